@@ -0,0 +1,184 @@
+'''
+    Per-slide derived-artifact cache.
+
+    Thumbnails, tissue masks, tile grids and segmentation outputs are keyed by
+    the slide *content* hash (not slide_id) plus the job parameters, so repeat
+    runs on the same upload - or on a re-upload of the same file - are hits.
+
+    Layout:
+        <SLIDE_CACHE_DIR>/<hash[:2]>/<hash>/<kind>-<params_digest>.<ext>
+
+    The cache is size-bounded and evicts least-recently-used files.
+'''
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.models.redis_keys import slide_key
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(path) -> str:
+    """Streaming sha256 of a file (blocking, run it off the event loop)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def slide_content_hash(slide_id: str, slide_path: str) -> str:
+    """
+    Content hash of a slide. Read from slide:<id> if known, otherwise
+    computed once (in a thread) and stored back on the slide hash.
+    """
+    content_hash = await redis_client.hget(slide_key(slide_id), "content_hash")
+    if content_hash:
+        return content_hash
+
+    content_hash = await asyncio.to_thread(hash_file, slide_path)
+    if await redis_client.exists(slide_key(slide_id)):
+        await redis_client.hset(slide_key(slide_id), "content_hash", content_hash)
+    return content_hash
+
+
+def params_digest(params: dict) -> str:
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+class SlideArtifactCache:
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index: Optional["OrderedDict[Path, int]"] = None   # path -> size, LRU order
+        self._total = 0
+
+    # ------------------ index ------------------
+    def _load_index(self):
+        """Lazily scan the cache dir once; order by mtime (touched on every hit)."""
+        if self._index is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for p in self.root.rglob("*"):
+            if p.is_file() and not p.name.startswith("."):
+                st = p.stat()
+                entries.append((st.st_mtime, p, st.st_size))
+        entries.sort()
+        self._index = OrderedDict((p, size) for _, p, size in entries)
+        self._total = sum(self._index.values())
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._index:
+            path, size = self._index.popitem(last=False)
+            self._total -= size
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    # ------------------ public API ------------------
+    def path_for(self, content_hash: str, kind: str, params: dict, ext: str) -> Path:
+        return self.root / content_hash[:2] / content_hash / f"{kind}-{params_digest(params)}.{ext}"
+
+    def get(self, content_hash: str, kind: str, params: dict, ext: str) -> Optional[Path]:
+        """Return the cached file path on hit (and mark it recently used), else None."""
+        path = self.path_for(content_hash, kind, params, ext)
+        with self._lock:
+            self._load_index()
+            if path not in self._index:
+                # might have been written by another process
+                if not path.exists():
+                    return None
+                size = path.stat().st_size
+                self._index[path] = size
+                self._total += size
+            self._index.move_to_end(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._total -= self._index.pop(path, 0)
+            return None
+        return path
+
+    def put(self, content_hash: str, kind: str, params: dict, ext: str,
+            writer: Callable[[Path], None]) -> Path:
+        """
+        Store an artifact. `writer(tmp_path)` writes the file; it is then
+        atomically moved into place so readers never see partial files.
+        """
+        path = self.path_for(content_hash, kind, params, ext)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        tmp = path.parent / f".{uuid.uuid4().hex}.{ext}"
+        try:
+            writer(tmp)
+            os.replace(tmp, path)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+        size = path.stat().st_size
+        with self._lock:
+            self._load_index()
+            self._total -= self._index.pop(path, 0)
+            self._index[path] = size
+            self._total += size
+            self._evict()
+        return path
+
+    def get_json(self, content_hash: str, kind: str, params: dict):
+        path = self.get(content_hash, kind, params, "json")
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put_json(self, content_hash: str, kind: str, params: dict, data) -> Path:
+        def _write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(data, f)
+        return self.put(content_hash, kind, params, "json", _write)
+
+    @staticmethod
+    def materialize(cached: Path, dest: Path) -> bool:
+        """
+        Expose a cached artifact at `dest` (hardlink, falls back to copy).
+        Returns False if the cached file vanished (evicted concurrently).
+        """
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(cached, dest)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            try:
+                shutil.copyfile(cached, dest)
+            except FileNotFoundError:
+                return False
+        return True
+
+
+slide_cache = SlideArtifactCache(settings.SLIDE_CACHE_DIR, settings.SLIDE_CACHE_MAX_BYTES)
@@ -0,0 +1,125 @@
+'''
+    Cooperative cancellation of running jobs.
+
+    run_job runs every job function under a CancelToken (run_cancellable).
+    Cancelling a job on its node (cancel_local) sets the token and cancels
+    the job's asyncio task, so awaiting jobs stop at once; work offloaded to
+    a thread keeps going until it looks at the token, which it does between
+    batches:
+
+        for batch in batches:
+            check_cancelled()            # raises JobCancelled once cancelled
+            ...
+
+    The token reaches the thread through the contextvars copy the job hands
+    to run_in_executor, and wait_for_thread keeps the job from finishing (and
+    releasing its node resources) before the thread really stopped.
+
+    Cancelling across processes (the tombstone set and the cancel channel the
+    nodes listen on) is services/cancellation_manager.py.
+'''
+import asyncio
+import contextlib
+import contextvars
+import threading
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job that was cancelled; run_job marks it CANCELLED (never retried)."""
+
+
+class CancelToken:
+    """Thread-safe cancellation flag of one running job."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = ""
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise JobCancelled(self.reason)
+
+
+_current: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+# job_id -> (token, task) of the jobs running in this process
+_active: Dict[str, Tuple[CancelToken, asyncio.Task]] = {}
+
+
+def current_token() -> Optional[CancelToken]:
+    return _current.get()
+
+
+def check_cancelled():
+    """Raise JobCancelled if the job running in this context was cancelled."""
+    token = _current.get()
+    if token is not None:
+        token.check()
+
+
+async def run_cancellable(job_id: str, fn: Callable[[], Awaitable]):
+    """Await fn() as a task that cancel_local(job_id) can interrupt; raises JobCancelled if it was."""
+    token = CancelToken()
+    reset = _current.set(token)
+    try:
+        task = asyncio.ensure_future(fn())   # copies the context, token included
+    finally:
+        _current.reset(reset)
+
+    _active[job_id] = (token, task)
+    try:
+        # wait() instead of awaiting the task: a cancelled job must not look
+        # like this coroutine being cancelled (the node shutting down)
+        await asyncio.wait({task})
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        _active.pop(job_id, None)
+
+    if task.cancelled():
+        raise JobCancelled(token.reason or "cancelled")
+    return task.result()
+
+
+def cancel_local(job_id: str, reason: str = "cancelled") -> bool:
+    """Interrupt a job running in this process. Returns False if it isn't running here."""
+    entry = _active.get(job_id)
+    if entry is None:
+        return False
+    token, task = entry
+    token.cancel(reason)
+    task.cancel()
+    log.info("Cancelling running job %s: %s", job_id, reason)
+    return True
+
+
+async def wait_for_thread(future: Awaitable):
+    """
+    Await work running in an executor thread. If the job is cancelled
+    meanwhile, set its token and wait for the thread to stop at its next
+    check before cancelling, so its CPU / GPU is free once the job ends.
+    """
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        token = _current.get()
+        if token is not None:
+            token.cancel()
+        with contextlib.suppress(Exception):   # JobCancelled from the thread, or a late result
+            await future
+        raise
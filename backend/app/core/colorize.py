@@ -0,0 +1,39 @@
+'''
+    Vectorized label -> color mapping for segmentation outputs.
+
+    Labels are hashed into a fixed palette and colored with a single LUT
+    gather, so the cost is O(pixels) no matter how many instances there are
+    (the old per-label loop was O(labels x pixels)).
+'''
+import numpy as np
+
+PALETTE_BITS = 12
+PALETTE_SIZE = 1 << PALETTE_BITS
+
+# Knuth multiplicative hash constant (2^32 / golden ratio)
+_HASH_MULT = np.uint32(2654435761)
+
+
+def _build_lut(seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(50, 256, size=(PALETTE_SIZE, 3), dtype=np.uint8)
+    # row 0 is background (label 0 -> black)
+    return np.vstack([np.zeros((1, 3), dtype=np.uint8), palette])
+
+
+LABEL_LUT = _build_lut()
+
+
+def label_color_index(labels: np.ndarray) -> np.ndarray:
+    """
+    Map labels to LUT rows: 0 for background, 1..PALETTE_SIZE otherwise.
+    Neighbouring label ids land on unrelated colors thanks to the hash.
+    """
+    labels = labels.astype(np.uint32, copy=False)
+    hashed = (labels * _HASH_MULT) >> np.uint32(32 - PALETTE_BITS)   # uint32 wraps, top bits
+    return np.where(labels == 0, 0, hashed + 1).astype(np.uint16)
+
+
+def colorize_labels(labels: np.ndarray) -> np.ndarray:
+    """(H, W) integer labels -> (H, W, 3) uint8 RGB in one vectorized gather."""
+    return LABEL_LUT[label_color_index(labels)]
@@ -1,10 +1,73 @@
 import os
+import socket
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# backend/ directory, so storage paths don't depend on the process CWD
+BASE_DIR = Path(__file__).resolve().parent.parent.parent
+
 class Settings:
     PROJECT_NAME: str = "BAMT Workflow Scheduler"
     REDIS_URL: str = os.getenv("REDIS_URL", "redis://localhost:6379")
 
-settings = Settings()
\ No newline at end of file
+    # derived per-slide artifacts (thumbnails, masks, tile grids, seg outputs)
+    SLIDE_CACHE_DIR: Path = Path(os.getenv("SLIDE_CACHE_DIR", BASE_DIR / "storage" / "cache"))
+    SLIDE_CACHE_MAX_BYTES: int = int(os.getenv("SLIDE_CACHE_MAX_BYTES", 5 * 1024**3))
+
+    # open OpenSlide handles kept warm per worker process + shared tile cache
+    SLIDE_POOL_SIZE: int = int(os.getenv("SLIDE_POOL_SIZE", 8))
+    SLIDE_TILE_CACHE_BYTES: int = int(os.getenv("SLIDE_TILE_CACHE_BYTES", 256 * 1024**2))
+
+    # job outputs, one directory per user / workflow / run / job
+    ARTIFACT_DIR: Path = Path(os.getenv("ARTIFACT_DIR", BASE_DIR / "storage" / "artifacts"))
+
+    # /files/slides/<id> DeepZoom tile server: render threads + memory/disk LRU
+    SLIDE_TILE_WORKERS: int = int(os.getenv("SLIDE_TILE_WORKERS", 8))
+    SLIDE_TILE_MEMORY_BYTES: int = int(os.getenv("SLIDE_TILE_MEMORY_BYTES", 128 * 1024**2))
+    SLIDE_TILE_DISK_DIR: Path = Path(os.getenv("SLIDE_TILE_DISK_DIR", BASE_DIR / "storage" / "tiles"))
+    SLIDE_TILE_DISK_MAX_BYTES: int = int(os.getenv("SLIDE_TILE_DISK_MAX_BYTES", 2 * 1024**3))
+
+    # /files/download: concurrent transfers per user, and optional nginx
+    # X-Accel-Redirect prefix (internal location aliased to backend/)
+    DOWNLOAD_MAX_PER_USER: int = int(os.getenv("DOWNLOAD_MAX_PER_USER", 4))
+    DOWNLOAD_ACCEL_PREFIX: str = os.getenv("DOWNLOAD_ACCEL_PREFIX", "")
+
+    # logging: DEBUG / INFO / WARNING / ..., "text" (key=value) or "json" lines
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "text")
+
+    # dump a cProfile trace (.pstats artifact) for every profiled job;
+    # a single job can opt in with payload {"profile": true}
+    PROFILE_JOBS: bool = os.getenv("PROFILE_JOBS", "0").lower() in ("1", "true", "yes")
+
+    # seconds between tile_segmentation checkpoints (core/tile_checkpoint.py); 0 disables
+    SEG_CHECKPOINT_SECONDS: float = float(os.getenv("SEG_CHECKPOINT_SECONDS", 120))
+
+    # this process as a worker node: id and the capacity it advertises to the
+    # scheduler's bin-packing (defaults: the whole machine, no GPU). The default
+    # id is unique per process; a fixed NODE_ID lets a restarted node recover
+    # what its previous incarnation left behind
+    NODE_ID: str = os.getenv("NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+    NODE_CPUS: float = float(os.getenv("NODE_CPUS", os.cpu_count() or 1))
+    NODE_MEMORY_MB: float = float(os.getenv(
+        "NODE_MEMORY_MB", os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // 1024**2
+    ))
+    NODE_GPUS: int = int(os.getenv("NODE_GPUS", 0))
+    # jobs this node runs at once, and whether the API process runs a node
+    # itself (set 0 when all work goes to `python -m app.workers.node`)
+    NODE_WORKERS: int = int(os.getenv("NODE_WORKERS", 4))
+    RUN_LOCAL_NODE: bool = os.getenv("RUN_LOCAL_NODE", "1").lower() in ("1", "true", "yes")
+    # how dispatched jobs reach the nodes: "list" or "stream" (workers/transport.py);
+    # every scheduler and node of a deployment must use the same one
+    JOB_TRANSPORT: str = os.getenv("JOB_TRANSPORT", "list")
+    # port a stand-alone node (`python -m app.workers.node`) serves GET /metrics
+    # on for Prometheus; 0 disables (the API process exposes its own)
+    NODE_METRICS_PORT: int = int(os.getenv("NODE_METRICS_PORT", 9101))
+
+    # distinct users with jobs in flight at once, cluster-wide (0: no cap); jobs
+    # in flight are bounded by the NODE_WORKERS of the live nodes
+    MAX_ACTIVE_USERS: int = int(os.getenv("MAX_ACTIVE_USERS", 3))
+
+settings = Settings()
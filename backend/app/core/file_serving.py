@@ -0,0 +1,245 @@
+'''
+    File responses for job outputs, slides and tiles.
+
+    - strong ETag + Last-Modified, conditional GET (If-None-Match /
+      If-Modified-Since -> 304)
+    - single byte ranges (206 / 416), If-Range; multi-range requests get the
+      whole file (allowed by RFC 9110)
+    - zero-copy body transfer when the server offers it:
+        * X-Accel-Redirect when settings.DOWNLOAD_ACCEL_PREFIX is set, so a
+          fronting nginx sends the file itself (sendfile, ranges, keep-alive)
+        * ASGI "http.response.zerocopysend" (sendfile on an fd + offset) or
+          "http.response.pathsend"
+        * otherwise 1 MiB reads in a worker thread
+    - per-user bounded concurrency: a user holding DOWNLOAD_MAX_PER_USER open
+      transfers gets 429 until one finishes, so bulk exports can't starve the API
+      (anonymous requests count per client address)
+'''
+import os
+import re
+import stat
+from collections import defaultdict
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+import anyio
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.core.config import BASE_DIR, settings
+
+CHUNK_SIZE = 1024 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+# ------------------ per-user concurrency ------------------
+class DownloadLimiter:
+    """In-flight transfer slots per user (single event loop, no locking needed)."""
+
+    def __init__(self, max_per_user: int):
+        self.max_per_user = max_per_user
+        self._active = defaultdict(int)
+
+    def try_acquire(self, user_id: str) -> bool:
+        if self._active[user_id] >= self.max_per_user:
+            return False
+        self._active[user_id] += 1
+        return True
+
+    def release(self, user_id: str):
+        self._active[user_id] -= 1
+        if self._active[user_id] <= 0:
+            del self._active[user_id]
+
+    def active(self) -> dict:
+        return dict(self._active)
+
+
+download_limiter = DownloadLimiter(settings.DOWNLOAD_MAX_PER_USER)
+
+
+def limiter_key(request: Request, user_id: str | None) -> str:
+    """Limiter bucket: the user, or the client address for anonymous requests."""
+    if user_id:
+        return user_id
+    host = request.client.host if request.client else "unknown"
+    return f"anonymous:{host}"
+
+
+# ------------------ validators ------------------
+def file_etag(st: os.stat_result) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def _not_modified_since(header: str, st: os.stat_result) -> bool:
+    try:
+        return int(st.st_mtime) <= parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _parse_range(header: str, size: int):
+    """
+    Returns (start, end_exclusive), None (ignore: serve the whole file) or
+    "unsatisfiable".
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None   # malformed or multi-range
+    first, last = m.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # suffix range: last N bytes
+        length = int(last)
+        if length == 0:
+            return "unsatisfiable"
+        return max(0, size - length), size
+
+    start = int(first)
+    end = int(last) + 1 if last else size
+    if start >= size or end <= start:
+        return "unsatisfiable"
+    return start, min(end, size)
+
+
+# ------------------ response ------------------
+class ZeroCopyFileResponse(Response):
+    def __init__(self, path: Path, st: os.stat_result, status_code: int, headers: dict,
+                 media_type: str, start: int = 0, end: int | None = None, on_close=None):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = st.st_size if end is None else end
+        self.whole_file = start == 0 and self.end == st.st_size
+        self.on_close = on_close
+        self.headers["content-length"] = str(self.end - self.start)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            if scope["method"].upper() == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+            extensions = scope.get("extensions") or {}
+            if "http.response.zerocopysend" in extensions:
+                with open(self.path, "rb") as f:
+                    await send({
+                        "type": "http.response.zerocopysend",
+                        "file": f.fileno(),
+                        "offset": self.start,
+                        "count": self.end - self.start,
+                        "more_body": False,
+                    })
+            elif "http.response.pathsend" in extensions and self.whole_file:
+                await send({"type": "http.response.pathsend", "path": str(self.path)})
+            else:
+                await self._send_chunks(send)
+        finally:
+            if self.on_close is not None:
+                self.on_close()
+
+    async def _send_chunks(self, send):
+        remaining = self.end - self.start
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            while remaining > 0:
+                chunk = await f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # file shrank underneath us; close the body cleanly
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _accel_path(path: Path) -> str | None:
+    prefix = settings.DOWNLOAD_ACCEL_PREFIX
+    if not prefix:
+        return None
+    try:
+        rel = path.resolve().relative_to(BASE_DIR)
+    except ValueError:
+        return None
+    return prefix.rstrip("/") + "/" + rel.as_posix()
+
+
+def serve_file(
+    request: Request,
+    path: Path,
+    media_type: str = "application/octet-stream",
+    filename: str | None = None,
+    cache_control: str = "no-cache",
+    etag: str | None = None,
+    user_id: str | None = None,
+) -> Response:
+    """
+    Build the response for `path`. `etag` overrides the mtime/size validator
+    (e.g. a content hash). With `user_id`, the transfer counts against that
+    user's concurrent download slots for as long as the body is streaming.
+    """
+    st = path.stat()
+    if not stat.S_ISREG(st.st_mode):
+        return Response(status_code=404)
+
+    etag = etag or file_etag(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if filename:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    # ---- conditional GET ----
+    inm = request.headers.get("if-none-match")
+    ims = request.headers.get("if-modified-since")
+    if (inm and _etag_matches(inm, etag)) or (not inm and ims and _not_modified_since(ims, st)):
+        return Response(status_code=304, headers=headers)
+
+    # ---- byte range ----
+    start, end, status_code = 0, st.st_size, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        parsed = _parse_range(range_header, st.st_size)
+        if parsed == "unsatisfiable":
+            headers["Content-Range"] = f"bytes */{st.st_size}"
+            return Response(status_code=416, headers=headers)
+        if parsed is not None:
+            start, end = parsed
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{st.st_size}"
+
+    # ---- nginx offload ----
+    accel = _accel_path(path)
+    if accel:
+        # nginx applies Range / conditionals itself against the real file
+        headers.pop("Content-Range", None)
+        headers["X-Accel-Redirect"] = accel
+        return Response(status_code=200, headers=headers, media_type=media_type)
+
+    on_close = None
+    if user_id is not None:
+        if not download_limiter.try_acquire(user_id):
+            return Response(
+                status_code=429,
+                content="Too many concurrent downloads",
+                headers={"Retry-After": "1"},
+            )
+        on_close = lambda: download_limiter.release(user_id)
+
+    return ZeroCopyFileResponse(path, st, status_code, headers, media_type, start, end, on_close)
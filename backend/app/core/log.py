@@ -0,0 +1,130 @@
+'''
+    Structured logging for the scheduler, workers and jobs.
+
+    - Records are handed to a QueueHandler; a QueueListener thread does the
+      formatting and the stdout write, so the event loop never blocks on I/O.
+    - job_id / run_id / user_id live in contextvars and are attached to every
+      record logged while they are bound (including from job threads started
+      with a copied context).
+    - Levels come from LOG_LEVEL. Call sites use lazy %-style arguments, so a
+      disabled level costs one cached isEnabledFor() check.
+
+    Usage:
+        log = get_logger(__name__)
+        with log_context(job_id=job_id, user_id=user_id):
+            log.info("picked job")
+'''
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from app.core.config import settings
+
+ROOT_LOGGER = "bamt"
+CONTEXT_FIELDS = ("job_id", "run_id", "user_id")
+
+_context_vars = {name: contextvars.ContextVar(name, default=None) for name in CONTEXT_FIELDS}
+_listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the 'bamt' hierarchy (app.scheduler.x -> bamt.scheduler.x)."""
+    if name.startswith("app."):
+        name = name[len("app."):]
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+@contextmanager
+def log_context(**fields):
+    """Bind job_id / run_id / user_id for everything logged inside the block."""
+    tokens = [(_context_vars[k], _context_vars[k].set(v)) for k, v in fields.items() if k in _context_vars]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copy the bound context onto the record (runs in the emitting thread)."""
+
+    def filter(self, record):
+        for name, var in _context_vars.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return True
+
+
+class KeyValueFormatter(logging.Formatter):
+    def format(self, record):
+        ts = datetime.fromtimestamp(record.created, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+        parts = [ts, record.levelname, record.name, record.getMessage()]
+        ctx = " ".join(f"{k}={getattr(record, k)}" for k in CONTEXT_FIELDS if getattr(record, k, None))
+        if ctx:
+            parts.append(ctx)
+        line = " | ".join(parts)
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for k in CONTEXT_FIELDS:
+            v = getattr(record, k, None)
+            if v:
+                doc[k] = v
+        if record.exc_info:
+            doc["exc"] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str)
+
+
+class _PreformattedQueueHandler(logging.handlers.QueueHandler):
+    """
+    Keep the record as-is (no eager formatting on the hot path); the listener
+    thread formats it. Args are already immutable for our call sites.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging():
+    """Install the queued handler on the 'bamt' logger. Idempotent."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else KeyValueFormatter())
+
+    q = queue.SimpleQueue()
+    handler = _PreformattedQueueHandler(q)
+    handler.addFilter(_ContextFilter())
+
+    root = logging.getLogger(ROOT_LOGGER)
+    root.handlers[:] = [handler]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(q, stream, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records (call on app shutdown)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
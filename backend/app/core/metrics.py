@@ -0,0 +1,322 @@
+'''
+    In-process metrics registry with Prometheus text exposition.
+
+    Counters / gauges / histograms are plain dicts keyed by label values, so
+    recording is a lock + a few integer adds (safe from job threads too).
+    Gauges that mirror Redis state (queue depths, active users, ...) are
+    refreshed by collectors right before each scrape of GET /metrics.
+
+    Processes without the API (stand-alone worker nodes) expose their own
+    registry with serve() on settings.NODE_METRICS_PORT.
+
+    Job lifecycle timestamps (epoch seconds) live on the job hash:
+        enqueued_ts -> dispatched_ts -> started_ts -> finished_ts
+    and feed the per-template / per-user latency histograms.
+'''
+import asyncio
+import bisect
+import math
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# a scraper gets this long to send its request line and headers
+SERVE_READ_TIMEOUT_SECONDS = 10
+
+# seconds; spans sub-ms Redis hops up to hour-long segmentations
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600,
+)
+
+# bytes; 64 MiB .. 64 GiB
+MEMORY_BUCKETS = tuple(64 * 1024**2 * 2**i for i in range(11))
+
+
+def now() -> float:
+    return time.time()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value) -> List[str]:
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., sum, count]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            state[idx] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def _render_sample(self, key, state) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state):
+            cumulative += count
+            le = f'le="{_fmt_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _fmt_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_fmt_value(state[-2])}")
+        lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Awaitable[None]]] = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def collector(self, fn: Callable[[], Awaitable[None]]):
+        """Register an async callback that refreshes gauges before each scrape."""
+        self._collectors.append(fn)
+        return fn
+
+    async def render(self) -> str:
+        for collect in self._collectors:
+            await collect()
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# ------------------ job lifecycle ------------------
+JOB_QUEUE_WAIT = registry.histogram(
+    "bamt_job_queue_wait_seconds",
+    "Time from enqueue (scheduler:pending_jobs) to dispatch into a worker node queue.",
+    ("template", "user"),
+)
+JOB_DISPATCH_LATENCY = registry.histogram(
+    "bamt_job_dispatch_latency_seconds",
+    "Time from dispatch into a worker node queue to the node starting the job.",
+    ("template", "user"),
+)
+JOB_RUN_TIME = registry.histogram(
+    "bamt_job_run_seconds",
+    "Job execution time (start to finish).",
+    ("template", "user", "status"),
+)
+JOB_TOTAL_TIME = registry.histogram(
+    "bamt_job_total_seconds",
+    "End-to-end job latency (enqueue to finish).",
+    ("template", "user", "status"),
+)
+JOBS_FINISHED = registry.counter(
+    "bamt_jobs_finished_total",
+    "Finished jobs by template and final status.",
+    ("template", "status"),
+)
+
+# per-stage profiling inside a job (see core.profiling)
+JOB_STAGE_TIME = registry.histogram(
+    "bamt_job_stage_seconds",
+    "Time spent per pipeline stage of a job (open, tissue_mask, read, inference, stitch, save, ...).",
+    ("template", "stage"),
+)
+JOB_STAGE_COUNT = registry.counter(
+    "bamt_job_stage_total",
+    "Work counted by pipeline stages (bytes_decoded, tiles_processed, tiles_skipped, ...).",
+    ("template", "counter"),
+)
+JOB_PEAK_RSS = registry.histogram(
+    "bamt_job_peak_rss_bytes",
+    "Process RSS high-water mark sampled during a job.",
+    ("template",),
+    buckets=MEMORY_BUCKETS,
+)
+
+# ------------------ scheduler ------------------
+SCHEDULER_DISPATCHED = registry.counter(
+    "bamt_scheduler_dispatched_total",
+    "Jobs moved from the pending queue into a worker node queue.",
+    ("user",),
+)
+SCHEDULER_DEFERRED = registry.counter(
+    "bamt_scheduler_deferred_total",
+    "Scheduling rounds that left backlog waiting (worker slots, node capacity or MAX_ACTIVE_USERS taken).",
+)
+NODE_JOBS_STOLEN = registry.counter(
+    "bamt_node_jobs_stolen_total",
+    "Queued jobs an idle worker node took over from a busier one.",
+    ("node",),
+)
+LEASES_RECOVERED = registry.counter(
+    "bamt_leases_recovered_total",
+    "Jobs taken back from a dead node or an expired lease, by outcome (requeued / failed / cancelled / finished).",
+    ("outcome",),
+)
+JOB_RETRIES = registry.counter(
+    "bamt_job_retries_total",
+    "Failed job attempts scheduled for a retry after their backoff (workers/retries.py).",
+    ("template",),
+)
+JOBS_DEAD_LETTERED = registry.counter(
+    "bamt_jobs_dead_lettered_total",
+    "Jobs that ran out of attempts (or weren't retryable) and went to the dead-letter queue.",
+    ("template",),
+)
+JOBS_CANCELLED = registry.counter(
+    "bamt_jobs_cancelled_total",
+    "Cancelled jobs, by where the cancel found them (queued / running).",
+    ("template", "stage"),
+)
+SCHEDULER_DISPATCH_TIME = registry.histogram(
+    "bamt_scheduler_dispatch_seconds",
+    "Scheduler time per dispatched job after BLPOP returns (Redis round-trips).",
+)
+
+# ------------------ gauges refreshed at scrape time ------------------
+PENDING_DEPTH = registry.gauge(
+    "bamt_pending_jobs", "Jobs not yet dispatched (scheduler:pending_jobs + per-user backlogs)."
+)
+USER_BACKLOG_DEPTH = registry.gauge(
+    "bamt_user_backlog_jobs", "Jobs waiting for a fair-share slot, per user.", ("user",)
+)
+NODE_QUEUE_DEPTH = registry.gauge(
+    "bamt_node_queue_jobs", "Jobs dispatched to a worker node and not started yet.", ("node",)
+)
+DELAYED_JOBS = registry.gauge("bamt_delayed_jobs", "Failed jobs waiting out their retry backoff.")
+DEAD_LETTER_JOBS = registry.gauge("bamt_dead_letter_jobs", "Jobs in the dead-letter queue.")
+NODE_ALIVE = registry.gauge("bamt_node_alive", "1 while a worker node's heartbeat is fresh.", ("node",))
+RUNNING_JOBS = registry.gauge("bamt_running_jobs", "Jobs currently running.")
+ACTIVE_USERS = registry.gauge("bamt_active_users", "Users with jobs in flight (dispatched or running).")
+MAX_ACTIVE_USERS_GAUGE = registry.gauge("bamt_max_active_users", "Configured MAX_ACTIVE_USERS.")
+SLOT_UTILIZATION = registry.gauge(
+    "bamt_worker_slot_utilization", "Dispatched jobs / worker slots of the live nodes (0..1)."
+)
+NODE_CAPACITY = registry.gauge(
+    "bamt_node_capacity", "Resources a worker node advertises (cpu, memory_mb, gpu).", ("node", "resource")
+)
+NODE_ALLOCATED = registry.gauge(
+    "bamt_node_allocated", "Resources reserved on a worker node by dispatched jobs.", ("node", "resource")
+)
+REDIS_PING = registry.gauge("bamt_redis_ping_seconds", "Redis PING round-trip measured at scrape time.")
+
+
+def _ts(job_data: dict, field: str):
+    try:
+        return float(job_data.get(field) or "")
+    except ValueError:
+        return None
+
+
+def observe_between(hist: Histogram, job_data: dict, start_field: str, end: float, **labels):
+    """Observe `end - job_data[start_field]` if the start timestamp is known."""
+    start = _ts(job_data, start_field)
+    if start is not None and end >= start:
+        hist.observe(end - start, **labels)
+
+
+# ------------------ exposition without the API ------------------
+async def _answer(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request = await asyncio.wait_for(reader.readline(), SERVE_READ_TIMEOUT_SECONDS)
+        while await asyncio.wait_for(reader.readline(), SERVE_READ_TIMEOUT_SECONDS) not in (b"\r\n", b"\n", b""):
+            pass  # headers: nothing in them matters here
+        method, path, *_ = request.split() or [b"", b""]
+        if method == b"GET" and path.split(b"?")[0] == b"/metrics":
+            status, content_type, body = "200 OK", CONTENT_TYPE, (await registry.render()).encode()
+        else:
+            status, content_type, body = "404 Not Found", "text/plain", b"Not Found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError, ValueError):
+        pass  # slow, gone or garbled scraper: just hang up
+    finally:
+        writer.close()
+
+
+async def serve(port: int, host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Answer GET /metrics on `port` with the registry (minimal HTTP/1.1, one request per connection)."""
+    return await asyncio.start_server(_answer, host, port)
@@ -0,0 +1,117 @@
+'''
+    Per-stage profiling for long-running jobs (tile_segmentation).
+
+    A StageProfiler lives for one job run, inside the job's worker thread:
+        prof = StageProfiler(trace=True)
+        with prof.stage("read"):
+            ...
+        prof.count("bytes_decoded", n)
+        summary = prof.finish()       # -> job output_payload["profile"]
+        ...
+        prof.stop()                   # in a finally: error paths must stop tracing too
+
+    Stage timers are two perf_counter() calls; RSS is sampled from
+    /proc/self/statm on stage exit, so it is cheap enough to stay on for
+    every job. With trace=True the thread also runs under cProfile and
+    finish() dumps a .pstats file (snakeviz / flameprof / pstats can read it).
+'''
+import cProfile
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.core import metrics
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss() -> int:
+    """Resident set size of this process in bytes (0 if unknown)."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def max_rss() -> int:
+    """Process-lifetime RSS high-water mark in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageProfiler:
+    def __init__(self, trace: bool = False):
+        self._t0 = time.perf_counter()
+        self._seconds: Dict[str, float] = defaultdict(float)
+        self._calls: Dict[str, int] = defaultdict(int)
+        self._counters: Dict[str, int] = defaultdict(int)
+        self._rss_start = current_rss()
+        self._rss_peak = self._rss_start
+        self._profile: Optional[cProfile.Profile] = None
+        if trace:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._seconds[name] += time.perf_counter() - t
+            self._calls[name] += 1
+            rss = current_rss()
+            if rss > self._rss_peak:
+                self._rss_peak = rss
+
+    def count(self, name: str, n: int = 1):
+        self._counters[name] += n
+
+    def stop(self):
+        """Stop tracing without a summary (no-op once finished); for error paths."""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile = None
+
+    def finish(self, trace_path: Optional[Path] = None, template: str = "") -> Dict[str, Any]:
+        """
+        Stop tracing, record metrics and return the summary for output_payload.
+        The cProfile dump goes to `trace_path` when tracing was enabled.
+        """
+        trace_file = None
+        profile = self._profile
+        if profile is not None:
+            self.stop()
+            if trace_path is not None:
+                profile.dump_stats(str(trace_path))
+                trace_file = trace_path
+
+        wall = time.perf_counter() - self._t0
+        stages = {
+            name: {"seconds": round(sec, 6), "calls": self._calls[name]}
+            for name, sec in self._seconds.items()
+        }
+        summary = {
+            "wall_seconds": round(wall, 6),
+            "stages": stages,
+            "counters": dict(self._counters),
+            "rss_start_bytes": self._rss_start,
+            "rss_peak_bytes": self._rss_peak,
+            "process_max_rss_bytes": max_rss(),
+            # the stage that dominates wall time: decode / model / stitch bound
+            "bound_by": max(self._seconds, key=self._seconds.get) if self._seconds else None,
+            "trace": str(trace_file) if trace_file else None,
+        }
+
+        for name, sec in self._seconds.items():
+            metrics.JOB_STAGE_TIME.observe(sec, template=template, stage=name)
+        for name, n in self._counters.items():
+            metrics.JOB_STAGE_COUNT.inc(n, template=template, counter=name)
+        metrics.JOB_PEAK_RSS.observe(self._rss_peak, template=template)
+        return summary
@@ -0,0 +1,182 @@
+'''
+    DeepZoom pyramid writer for segmentation results.
+
+    Stitched labels are streamed into a multi-resolution tiled pyramid while
+    the segmentation is still running: a full-resolution DeepZoom tile is
+    written as soon as the last segmentation tile touching it has been
+    stitched, and a lower-level tile as soon as all of its children are final.
+
+    Layout (standard .dzi, readable by OpenSeadragon & co):
+        <out_dir>/<layer>.dzi
+        <out_dir>/<layer>_files/<level>/<col>_<row>.png
+        <out_dir>/.complete                    (written by finish())
+
+    Layers:
+        labels   - colorized labels, transparent background
+        overlay  - slide pixels blended with label colors, transparent where
+                   nothing was segmented
+    Tiles that never intersect a segmentation tile are not written.
+'''
+import math
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from app.core.colorize import colorize_labels
+
+DZ_TILE_SIZE = 256
+DZ_FORMAT = "png"
+PYRAMID_LAYERS = ("labels", "overlay")
+COMPLETE_MARKER = ".complete"
+
+DZI_TEMPLATE = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+    'Format="{fmt}" Overlap="0" TileSize="{tile_size}">'
+    '<Size Width="{width}" Height="{height}"/></Image>\n'
+)
+
+
+def _pool_max(grid: np.ndarray) -> np.ndarray:
+    """2x2 max-pool with -1 padding (parent tile = max of its children)."""
+    rows, cols = grid.shape
+    padded = np.full((rows + rows % 2, cols + cols % 2), -1, dtype=grid.dtype)
+    padded[:rows, :cols] = grid
+    return padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3))
+
+
+class DeepZoomPyramidWriter:
+    def __init__(self, out_dir, width: int, height: int, layers=PYRAMID_LAYERS,
+                 tile_size: int = DZ_TILE_SIZE, alpha: float = 0.5):
+        self.out_dir = Path(out_dir)
+        self.width = width
+        self.height = height
+        self.layers = tuple(layers)
+        self.tile_size = tile_size
+        self.alpha = alpha
+
+        self.max_level = max(0, math.ceil(math.log2(max(width, height))))
+        # level -> (width, height)
+        self.level_dims = {
+            level: (
+                max(1, math.ceil(width / 2 ** (self.max_level - level))),
+                max(1, math.ceil(height / 2 ** (self.max_level - level))),
+            )
+            for level in range(self.max_level + 1)
+        }
+        self.last_touch = {}   # level -> int grid: last segmentation tile index touching it (-1 = never)
+        self.done = {}         # level -> bool grid: tile is final (written or known empty)
+        self.tiles_written = 0
+
+    # ------------------ setup ------------------
+    def plan(self, tiles):
+        """
+        Register the segmentation tiles, in processing order, and write the
+        .dzi descriptors so viewers can open the pyramid while it fills in.
+        """
+        ts = self.tile_size
+        cols = math.ceil(self.width / ts)
+        rows = math.ceil(self.height / ts)
+
+        top = np.full((rows, cols), -1, dtype=np.int64)
+        for i, t in enumerate(tiles):
+            x, y, size = t["x"], t["y"], t["size"]
+            x1 = min(x + size, self.width)
+            y1 = min(y + size, self.height)
+            if x1 <= x or y1 <= y:
+                continue
+            top[y // ts:math.ceil(y1 / ts), x // ts:math.ceil(x1 / ts)] = i
+
+        self.last_touch[self.max_level] = top
+        for level in range(self.max_level - 1, -1, -1):
+            self.last_touch[level] = _pool_max(self.last_touch[level + 1])
+        # never-touched tiles are final (and empty) from the start
+        self.done = {level: grid < 0 for level, grid in self.last_touch.items()}
+
+        for layer in self.layers:
+            (self.out_dir / f"{layer}_files").mkdir(parents=True, exist_ok=True)
+            (self.out_dir / f"{layer}.dzi").write_text(DZI_TEMPLATE.format(
+                fmt=DZ_FORMAT, tile_size=ts, width=self.width, height=self.height,
+            ))
+
+    # ------------------ streaming ------------------
+    def flush(self, labels: np.ndarray, slide, processed: int):
+        """
+        Write every tile that became final now that segmentation tiles
+        [0, processed) are stitched into `labels`.
+        """
+        for level in range(self.max_level, -1, -1):
+            ready = np.argwhere(~self.done[level] & (self.last_touch[level] < processed))
+            for row, col in ready:
+                if level == self.max_level:
+                    self._write_full_res(labels, slide, int(row), int(col))
+                else:
+                    self._write_from_children(level, int(row), int(col))
+                self.done[level][row, col] = True
+
+    def finish(self, labels: np.ndarray, slide):
+        self.flush(labels, slide, processed=np.iinfo(np.int64).max)
+        (self.out_dir / COMPLETE_MARKER).touch()
+
+    # ------------------ tile rendering ------------------
+    def _tile_path(self, layer, level, col, row) -> Path:
+        return self.out_dir / f"{layer}_files" / str(level) / f"{col}_{row}.{DZ_FORMAT}"
+
+    def _save(self, img: Image.Image, layer, level, col, row):
+        path = self._tile_path(layer, level, col, row)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # fast zlib level: tiles are written on the segmentation hot path
+        img.save(path, format="PNG", compress_level=1)
+        self.tiles_written += 1
+
+    def _write_full_res(self, labels, slide, row, col):
+        ts = self.tile_size
+        x0, y0 = col * ts, row * ts
+        x1, y1 = min(x0 + ts, self.width), min(y0 + ts, self.height)
+
+        region = labels[y0:y1, x0:x1]
+        fg = region > 0
+        if not fg.any():
+            return
+
+        colored = colorize_labels(region)
+        alpha = np.where(fg, 255, 0).astype(np.uint8)
+
+        if "labels" in self.layers:
+            self._save(Image.fromarray(np.dstack([colored, alpha])), "labels", self.max_level, col, row)
+
+        if "overlay" in self.layers:
+            rgba = np.array(slide.read_region((x0, y0), 0, (x1 - x0, y1 - y0)))
+            bg = rgba[..., :3].astype(np.float32)
+            blended = np.where(fg[..., None], (1 - self.alpha) * bg + self.alpha * colored, bg)
+            out = np.dstack([blended.astype(np.uint8), rgba[..., 3]])
+            self._save(Image.fromarray(out), "overlay", self.max_level, col, row)
+
+    def _write_from_children(self, level, row, col):
+        child_level = level + 1
+        cw, ch = self.level_dims[child_level]
+        ts = self.tile_size
+
+        # extent of this tile's 2x2 children in child-level pixels
+        cx0, cy0 = 2 * col * ts, 2 * row * ts
+        cx1, cy1 = min(cx0 + 2 * ts, cw), min(cy0 + 2 * ts, ch)
+        out_size = (math.ceil((cx1 - cx0) / 2), math.ceil((cy1 - cy0) / 2))
+
+        for layer in self.layers:
+            canvas = None
+            for dy in (0, 1):
+                for dx in (0, 1):
+                    child = self._tile_path(layer, child_level, 2 * col + dx, 2 * row + dy)
+                    if not child.exists():
+                        continue
+                    if canvas is None:
+                        canvas = Image.new("RGBA", (cx1 - cx0, cy1 - cy0), (0, 0, 0, 0))
+                    with Image.open(child) as img:
+                        canvas.paste(img, (dx * ts, dy * ts))
+            if canvas is None:
+                continue
+
+            # labels stay crisp (nearest), the overlay is box-filtered
+            resample = Image.NEAREST if layer == "labels" else Image.BOX
+            self._save(canvas.resize(out_size, resample), layer, level, col, row)
@@ -1,5 +1,8 @@
 import redis.asyncio as redis
 from app.core.config import settings
+from app.core.log import get_logger
+
+log = get_logger(__name__)
 
 redis_client = redis.Redis(
     host="localhost",
@@ -13,6 +16,6 @@ async def test_redis_connection():
     try:
         pong = await redis_client.ping()
         if pong:
-            print("Redis connected successfully")
+            log.info("Redis connected successfully")
     except Exception as e:
-        print("Redis connection failed: ", e)
\ No newline at end of file
+        log.error("Redis connection failed: %s", e)
\ No newline at end of file
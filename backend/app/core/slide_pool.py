@@ -0,0 +1,143 @@
+'''
+    Shared pool of open OpenSlide handles.
+
+    Opening an SVS / JP2K file parses metadata and builds tile tables, so jobs
+    on the same slide should reuse a warm handle instead of re-opening it.
+    The pool is bounded (LRU eviction of idle handles), thread-safe (jobs run
+    in executor threads), and every handle shares one OpenSlide tile cache.
+
+    Usage:
+        with slide_pool.acquire(path) as slide:
+            slide.read_region(...)
+'''
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import openslide
+
+from app.core.config import settings
+
+
+class _PooledSlide:
+    __slots__ = ("slide", "refs", "stale")
+
+    def __init__(self, slide):
+        self.slide = slide
+        self.refs = 0
+        self.stale = False   # closed once the last user releases it
+
+
+class SlideHandlePool:
+    def __init__(self, max_handles: int, tile_cache_bytes: int):
+        self.max_handles = max_handles
+        self._lock = threading.Lock()
+        self._handles: "OrderedDict[tuple, _PooledSlide]" = OrderedDict()
+        self._cache = None
+        if tile_cache_bytes > 0 and hasattr(openslide, "OpenSlideCache"):
+            self._cache = openslide.OpenSlideCache(tile_cache_bytes)
+
+    @staticmethod
+    def _key(path) -> tuple:
+        p = Path(path).resolve()
+        st = p.stat()
+        # a replaced file gets a new key (and a fresh handle)
+        return (str(p), st.st_mtime_ns, st.st_size)
+
+    def _open(self, path):
+        slide = openslide.OpenSlide(str(path))
+        if self._cache is not None:
+            slide.set_cache(self._cache)
+        return slide
+
+    def _evict_idle(self):
+        """Close least-recently-used idle handles until we are within bounds."""
+        excess = len(self._handles) - self.max_handles
+        if excess <= 0:
+            return
+        for key in list(self._handles):
+            entry = self._handles[key]
+            if entry.refs == 0:
+                del self._handles[key]
+                entry.slide.close()
+                excess -= 1
+                if excess <= 0:
+                    break
+
+    # ------------------ public API ------------------
+    def checkout(self, path):
+        """Borrow a handle for `path` (opening it if needed). Pair with release()."""
+        key = self._key(path)
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is not None:
+                entry.refs += 1
+                self._handles.move_to_end(key)
+                return key, entry.slide
+
+        # open outside the lock: this is the slow part
+        slide = self._open(path)
+
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is not None:
+                # another thread opened it meanwhile; keep theirs
+                slide.close()
+            else:
+                entry = _PooledSlide(slide)
+                self._handles[key] = entry
+            entry.refs += 1
+            self._handles.move_to_end(key)
+            self._evict_idle()
+            return key, entry.slide
+
+    def release(self, key):
+        with self._lock:
+            entry = self._handles.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                entry.refs = 0
+                if entry.stale:
+                    del self._handles[key]
+                    entry.slide.close()
+                else:
+                    self._evict_idle()
+
+    @contextmanager
+    def acquire(self, path):
+        key, slide = self.checkout(path)
+        try:
+            yield slide
+        finally:
+            self.release(key)
+
+    def close(self, path=None):
+        """
+        Close the handle(s) for `path`, or every handle when path is None.
+        Handles still in use are closed as soon as their last user releases them.
+        """
+        target = str(Path(path).resolve()) if path is not None else None
+        with self._lock:
+            for key in list(self._handles):
+                if target is not None and key[0] != target:
+                    continue
+                entry = self._handles[key]
+                if entry.refs == 0:
+                    del self._handles[key]
+                    entry.slide.close()
+                else:
+                    entry.stale = True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open_handles": len(self._handles),
+                "in_use": sum(1 for e in self._handles.values() if e.refs > 0),
+                "max_handles": self.max_handles,
+            }
+
+
+slide_pool = SlideHandlePool(settings.SLIDE_POOL_SIZE, settings.SLIDE_TILE_CACHE_BYTES)
@@ -0,0 +1,188 @@
+'''
+    On-the-fly DeepZoom tiles for uploaded slides.
+
+    Tiles are rendered from pooled OpenSlide handles in a dedicated thread
+    pool (so long-running jobs in the default executor can't starve viewers),
+    then cached in two LRU layers keyed by slide *content* hash:
+        memory  - encoded bytes, SLIDE_TILE_MEMORY_BYTES
+        disk    - SlideArtifactCache under SLIDE_TILE_DISK_DIR
+    Concurrent requests for the same tile share one render.
+'''
+import asyncio
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from openslide.deepzoom import DeepZoomGenerator
+
+from app.core.artifact_cache import SlideArtifactCache
+from app.core.config import settings
+from app.core.slide_pool import slide_pool
+
+TILE_SIZE = 254     # 254 + 2 * overlap = 256 px on the wire
+TILE_OVERLAP = 1
+PREVIEW_MAX_DIM = 1024
+
+TILE_FORMATS = {
+    # format -> (PIL format, mime, save kwargs)
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 80}),
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 0}),
+}
+
+
+class _MemoryTileCache:
+    """Byte-bounded LRU of encoded tiles (thread-safe)."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._total = 0
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._total -= len(old)
+            self._items[key] = data
+            self._total += len(data)
+            while self._total > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._total -= len(evicted)
+
+
+class SlideTileServer:
+    def __init__(self, memory_bytes: int, disk_cache: SlideArtifactCache, workers: int):
+        self.memory = _MemoryTileCache(memory_bytes)
+        self.disk = disk_cache
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slide-tiles")
+        self._dz_lock = threading.Lock()
+        # pool key -> (slide handle, DeepZoomGenerator), rebuilt if the handle was reopened
+        self._generators: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    # ------------------ rendering (worker threads) ------------------
+    def _generator(self, key, slide) -> DeepZoomGenerator:
+        with self._dz_lock:
+            entry = self._generators.get(key)
+            if entry is not None and entry[0] is slide:
+                self._generators.move_to_end(key)
+                return entry[1]
+
+        dz = DeepZoomGenerator(slide, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, limit_bounds=True)
+        with self._dz_lock:
+            self._generators[key] = (slide, dz)
+            self._generators.move_to_end(key)
+            while len(self._generators) > settings.SLIDE_POOL_SIZE * 2:
+                self._generators.popitem(last=False)
+        return dz
+
+    def _with_generator(self, slide_path: str, fn):
+        key, slide = slide_pool.checkout(slide_path)
+        try:
+            return fn(self._generator(key, slide))
+        finally:
+            slide_pool.release(key)
+
+    def _render_tile(self, slide_path, content_hash, level, col, row, fmt) -> Optional[bytes]:
+        params = {"size": TILE_SIZE, "overlap": TILE_OVERLAP, "level": level, "col": col, "row": row}
+        kind = "dztile"
+
+        cached = self.disk.get(content_hash, kind, params, fmt)
+        if cached is not None:
+            try:
+                return cached.read_bytes()
+            except FileNotFoundError:
+                pass   # evicted between get() and read
+
+        def _tile(dz):
+            if level >= dz.level_count:
+                return None
+            cols, rows = dz.level_tiles[level]
+            if col >= cols or row >= rows:
+                return None
+            return dz.get_tile(level, (col, row))
+
+        img = self._with_generator(slide_path, _tile)
+        if img is None:
+            return None
+
+        pil_format, _, save_kwargs = TILE_FORMATS[fmt]
+        buf = io.BytesIO()
+        img.save(buf, format=pil_format, **save_kwargs)
+        data = buf.getvalue()
+
+        self.disk.put(content_hash, kind, params, fmt, lambda tmp: tmp.write_bytes(data))
+        return data
+
+    def _dzi(self, slide_path, fmt) -> str:
+        return self._with_generator(slide_path, lambda dz: dz.get_dzi(fmt))
+
+    def _render_preview(self, slide_path, content_hash):
+        params = {"max_dim": PREVIEW_MAX_DIM}
+        cached = self.disk.get(content_hash, "preview", params, "jpg")
+        if cached is not None:
+            return cached
+
+        with slide_pool.acquire(slide_path) as slide:
+            img = slide.get_thumbnail((PREVIEW_MAX_DIM, PREVIEW_MAX_DIM)).convert("RGB")
+        return self.disk.put(content_hash, "preview", params, "jpg",
+                             lambda tmp: img.save(tmp, format="JPEG", quality=85))
+
+    # ------------------ public API (event loop) ------------------
+    async def get_tile(self, slide_path: str, content_hash: str,
+                       level: int, col: int, row: int, fmt: str) -> Optional[bytes]:
+        """Encoded tile bytes, or None if (level, col, row) is outside the slide."""
+        key = (content_hash, level, col, row, fmt)
+        data = self.memory.get(key)
+        if data is not None:
+            return data
+
+        # coalesce identical requests (many viewers on one slide)
+        fut = self._inflight.get(key)
+        if fut is not None:
+            return await asyncio.shield(fut)
+
+        loop = asyncio.get_running_loop()
+        fut = loop.run_in_executor(
+            self.executor, self._render_tile, slide_path, content_hash, level, col, row, fmt
+        )
+        self._inflight[key] = fut
+        try:
+            data = await asyncio.shield(fut)
+        finally:
+            self._inflight.pop(key, None)
+
+        if data is not None:
+            self.memory.put(key, data)
+        return data
+
+    async def get_dzi(self, slide_path: str, fmt: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._dzi, slide_path, fmt)
+
+    async def get_preview(self, slide_path: str, content_hash: str):
+        """Path of a cached JPEG preview (longest side PREVIEW_MAX_DIM)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._render_preview, slide_path, content_hash)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+tile_server = SlideTileServer(
+    settings.SLIDE_TILE_MEMORY_BYTES,
+    SlideArtifactCache(settings.SLIDE_TILE_DISK_DIR, settings.SLIDE_TILE_DISK_MAX_BYTES),
+    settings.SLIDE_TILE_WORKERS,
+)
@@ -0,0 +1,138 @@
+'''
+    Checkpoints of a tile segmentation in progress, so a retried or resumed
+    job skips the tiles it already ran inference on.
+
+    Kept in the job's artifact directory (ArtifactManager.job_dir), which a
+    retry of the same job reuses (on any node sharing ARTIFACT_DIR):
+
+        <job_dir>/checkpoint/manifest.json    key, next_tile, running_label, segments
+        <job_dir>/checkpoint/seg-00000.npz    stitched labels of the tiles saved then
+
+    Each save appends one segment holding, for every tile stitched since the
+    previous save, its region of the label mask as it is now (compressed), so
+    a save costs the new work only, never a dump of the whole mask. Pasting
+    the segments in order rebuilds the mask exactly: overlapping regions come
+    out as the later tile left them. The manifest is replaced atomically after
+    its segment is on disk, so a crash mid-save leaves the previous
+    checkpoint. `key` (slide content + tiling + model) must match for a
+    checkpoint to be resumed; otherwise it is dropped.
+'''
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+CHECKPOINT_DIR = "checkpoint"
+MANIFEST = "manifest.json"
+
+
+class TileCheckpoint:
+    def __init__(self, directory, key: dict, interval: float):
+        """`interval`: seconds between periodic saves (0 disables checkpointing)."""
+        self.directory = Path(directory)
+        self.key = key
+        self.interval = interval
+        self.segments: List[str] = []
+        self._saved = 0   # tiles [0, _saved) are in the segments
+        self._last_save = time.monotonic()
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0
+
+    # ------------------ resume ------------------
+    def load(self, mask: np.ndarray) -> Optional[dict]:
+        """
+        Paste a matching checkpoint into `mask` and return its
+        {"next_tile", "running_label"}; None (and a fresh start) without one.
+        """
+        if not self.enabled:
+            return None
+        try:
+            manifest = json.loads((self.directory / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return None
+        if manifest.get("key") != self.key:
+            log.info("Discarding checkpoint of different inputs in %s", self.directory)
+            self.clear()
+            return None
+
+        try:
+            for name in manifest["segments"]:
+                self._paste(self.directory / name, mask)
+        except (OSError, KeyError, ValueError) as exc:
+            log.warning("Unreadable checkpoint in %s (%s), starting over", self.directory, exc)
+            mask[:] = 0
+            self.clear()
+            return None
+
+        self.segments = list(manifest["segments"])
+        self._saved = int(manifest["next_tile"])
+        self._last_save = time.monotonic()
+        return {"next_tile": self._saved, "running_label": int(manifest["running_label"])}
+
+    @staticmethod
+    def _paste(path: Path, mask: np.ndarray):
+        with np.load(path) as segment:
+            for k, (x, y) in enumerate(segment["xy"]):
+                region = segment[f"t{k}"]
+                mask[y:y + region.shape[0], x:x + region.shape[1]] = region
+
+    # ------------------ save ------------------
+    def due(self) -> bool:
+        return self.enabled and time.monotonic() - self._last_save >= self.interval
+
+    def save(self, mask: np.ndarray, tiles: list, next_tile: int, running_label: int) -> bool:
+        """
+        Record tiles [0, next_tile) as done (all stitched into `mask`).
+        Best effort: a failed save is logged and the previous checkpoint kept.
+        """
+        if not self.enabled or next_tile <= self._saved:
+            return False
+        h, w = mask.shape
+        regions, xy = {}, []
+        for k, tile in enumerate(tiles[self._saved:next_tile]):
+            x, y, size = tile["x"], tile["y"], tile["size"]
+            regions[f"t{k}"] = mask[y:min(y + size, h), x:min(x + size, w)]
+            xy.append((x, y))
+
+        name = f"seg-{len(self.segments):05d}.npz"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f".{name}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez_compressed(f, xy=np.array(xy, dtype=np.int64).reshape(-1, 2), **regions)
+            os.replace(tmp, self.directory / name)
+
+            manifest = {
+                "key": self.key,
+                "next_tile": next_tile,
+                "running_label": int(running_label),
+                "segments": self.segments + [name],
+            }
+            tmp = self.directory / f".{MANIFEST}.tmp"
+            tmp.write_text(json.dumps(manifest))
+            os.replace(tmp, self.directory / MANIFEST)
+        except OSError as exc:
+            log.warning("Checkpoint save to %s failed: %s", self.directory, exc)
+            return False
+
+        self.segments.append(name)
+        self._saved = next_tile
+        self._last_save = time.monotonic()
+        log.debug("Checkpointed %d tiles to %s", next_tile, self.directory)
+        return True
+
+    def clear(self):
+        """Drop the checkpoint (the job finished, or it doesn't match)."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.segments = []
+        self._saved = 0
@@ -0,0 +1,178 @@
+'''
+    Tissue mask engine shared by the WSI jobs.
+
+    Instead of asking OpenSlide for a thumbnail (which resamples from whatever
+    level it picks), we read the nearest *native* pyramid level directly and run
+    the Otsu / morphology steps at a resolution matched to the tile stride.
+    Results are cached per slide file + parameters.
+'''
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# mask pixels covering one tile stride (tile_size - overlap)
+MASK_PIXELS_PER_STRIDE = 16
+
+# longest mask side used when no stride is given (matches the old 2048 thumbnail)
+DEFAULT_MASK_DIM = 2048
+
+# hard cap on the longest mask side, protects memory on huge level-0 reads
+MAX_MASK_DIM = 8192
+
+# background brightness cut-off (V channel), same as before
+VALUE_THRESHOLD = 220
+
+# levels larger than this (pixels) are read and reduced in horizontal bands
+MAX_LEVEL_READ_PIXELS = 64 * 1024 * 1024
+
+# max number of cached masks kept in-process
+MASK_CACHE_SIZE = 16
+
+_mask_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_mask_cache_lock = threading.Lock()
+
+
+def read_level(slide, level: int) -> Image.Image:
+    """
+    Read a whole native pyramid level as RGB, composited on the slide background.
+    (read_region leaves non-scanned areas fully transparent.)
+    """
+    size = slide.level_dimensions[level]
+    region = slide.read_region((0, 0), level, size)
+
+    bg = "#" + slide.properties.get("openslide.background-color", "ffffff")
+    rgb = Image.new("RGB", size, bg)
+    rgb.paste(region, mask=region.split()[3])
+    return rgb
+
+
+def read_level_reduced(slide, level: int, out_w: int, out_h: int) -> np.ndarray:
+    """
+    Read a native level and area-reduce it to (out_w, out_h).
+    Large levels are streamed in horizontal bands so we never hold the
+    full-resolution level in memory.
+    """
+    lw, lh = slide.level_dimensions[level]
+    if lw * lh <= MAX_LEVEL_READ_PIXELS:
+        level_np = np.array(read_level(slide, level))
+        if out_w < lw or out_h < lh:
+            level_np = cv2.resize(level_np, (out_w, out_h), interpolation=cv2.INTER_AREA)
+        return level_np
+
+    downsample = slide.level_downsamples[level]
+    bg = "#" + slide.properties.get("openslide.background-color", "ffffff")
+    fy = lh / out_h
+    rows_per_band = max(1, int(MAX_LEVEL_READ_PIXELS // (lw * fy)))
+
+    out = np.empty((out_h, out_w, 3), dtype=np.uint8)
+    for r0 in range(0, out_h, rows_per_band):
+        r1 = min(r0 + rows_per_band, out_h)
+        y0 = int(r0 * fy)
+        y1 = min(int(round(r1 * fy)), lh)
+
+        # read_region takes level-0 coordinates for the origin
+        band = slide.read_region((0, int(y0 * downsample)), level, (lw, y1 - y0))
+        rgb = Image.new("RGB", band.size, bg)
+        rgb.paste(band, mask=band.split()[3])
+
+        out[r0:r1] = cv2.resize(np.array(rgb), (out_w, r1 - r0), interpolation=cv2.INTER_AREA)
+    return out
+
+
+def pick_mask_level(slide, stride: int | None = None):
+    """
+    Pick the native level to read and the downsample the mask should end up at.
+
+    Returns:
+        level: pyramid level to read (never coarser than the target)
+        target_downsample: level-0 pixels per mask pixel
+    """
+    W0, H0 = slide.dimensions
+    longest = max(W0, H0)
+
+    if stride:
+        target = stride / MASK_PIXELS_PER_STRIDE
+    else:
+        target = longest / DEFAULT_MASK_DIM
+
+    # never go above MAX_MASK_DIM, never upsample past level 0
+    target = max(target, longest / MAX_MASK_DIM, 1.0)
+
+    level = slide.get_best_level_for_downsample(target)
+    return level, target
+
+
+def _cache_key(slide, slide_path, stride, close):
+    if slide_path is None:
+        return None
+    p = Path(slide_path)
+    try:
+        st = p.stat()
+    except OSError:
+        return None
+    return (str(p.resolve()), st.st_mtime_ns, st.st_size, stride, close, slide.dimensions)
+
+
+def compute_tissue_mask(slide, slide_path=None, stride: int | None = None, close: bool = True):
+    """
+    Compute a binary tissue mask (1 = tissue, 0 = background).
+
+    Args:
+        slide: open OpenSlide handle
+        slide_path: path of the slide file, enables caching when given
+        stride: tile stride in level-0 pixels; the mask is computed at
+                MASK_PIXELS_PER_STRIDE pixels per stride
+        close: apply morphological closing to fill small holes
+
+    Returns:
+        tissue_mask (np.uint8 array)
+        downsample (ds_x, ds_y): level-0 pixels per mask pixel
+    """
+    key = _cache_key(slide, slide_path, stride, close)
+    if key is not None:
+        with _mask_cache_lock:
+            hit = _mask_cache.get(key)
+            if hit is not None:
+                _mask_cache.move_to_end(key)
+                return hit
+
+    W0, H0 = slide.dimensions
+    level, target = pick_mask_level(slide, stride)
+
+    # 1) native read (no resampling inside OpenSlide), then
+    # 2) area-reduce to the stride-matched resolution if the level is finer
+    lw, lh = slide.level_dimensions[level]
+    mask_w = min(lw, max(1, int(round(W0 / target))))
+    mask_h = min(lh, max(1, int(round(H0 / target))))
+    level_np = read_level_reduced(slide, level, mask_w, mask_h)
+
+    # 3) Otsu on saturation + remove very bright background
+    hsv = cv2.cvtColor(level_np, cv2.COLOR_RGB2HSV)
+    _, S, V = cv2.split(hsv)
+
+    _, sat_mask = cv2.threshold(S, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    _, val_mask = cv2.threshold(V, VALUE_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+
+    tissue_mask = (sat_mask > 0).astype(np.uint8) & (val_mask > 0).astype(np.uint8)
+
+    # 4) closing with a kernel of ~half a stride, so holes smaller than a tile get filled
+    if close:
+        k = max(3, (MASK_PIXELS_PER_STRIDE // 2) | 1)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+        tissue_mask = cv2.morphologyEx(tissue_mask, cv2.MORPH_CLOSE, kernel)
+
+    mh, mw = tissue_mask.shape
+    result = (tissue_mask, (W0 / mw, H0 / mh))
+
+    if key is not None:
+        with _mask_cache_lock:
+            _mask_cache[key] = result
+            _mask_cache.move_to_end(key)
+            while len(_mask_cache) > MASK_CACHE_SIZE:
+                _mask_cache.popitem(last=False)
+
+    return result
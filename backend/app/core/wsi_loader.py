@@ -1,10 +1,27 @@
-import openslide
 from pathlib import Path
 
+from app.core.slide_pool import slide_pool
+from app.core.tissue_mask import read_level
+
 class WSILoader:
+    """
+    Thin wrapper around a pooled OpenSlide handle.
+    Call close() (or use as a context manager) to hand the handle back.
+    """
     def __init__(self, file_path: str):
         self.file_path = Path(file_path)
-        self.slide = openslide.OpenSlide(str(self.file_path))
+        self._handle, self.slide = slide_pool.checkout(self.file_path)
+
+    def close(self):
+        if self._handle is not None:
+            slide_pool.release(self._handle)
+            self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def metadata(self):
         return {
@@ -31,4 +48,5 @@ class WSILoader:
             # pick last level by default (lowest resolution)
             level = self.slide.level_count - 1
         
-        return self.read_region(0, 0, level, self.slide.level_dimensions[level][0])
+        # read the full (w, h) of the native level, not a (w, w) square
+        return read_level(self.slide, level)
@@ -1,11 +1,12 @@
-print("[fake_sleep] module imported!")   # <-- add this line
-
 import asyncio
 from app.workers.registry import register_job
+from app.core.log import get_logger
+
+log = get_logger(__name__)
 
-@register_job("fake_sleep")
+@register_job("fake_sleep", cpu=0.1, memory_mb=16)
 async def fake_sleep(job_id: str, payload: dict):
-    print(f"[fake_sleep] Running job {job_id}")
+    log.info("Running job %s", job_id)
     await asyncio.sleep(2)
     return {
         "job_id": job_id,
@@ -1,7 +1,12 @@
 import uuid
 import json
 import asyncio
+import contextvars
 import functools
+import logging
+import math
+import threading
+from contextlib import nullcontext
 from typing import List, Dict, Any
 
 # Import redis_client globally so it's accessible to the thread function
@@ -10,62 +15,172 @@ from app.services.job_manager import JobManager
 from app.services.branch_manager import BranchManager
 from app.services.workflow_manager import WorkflowManager
 from app.models.redis_keys import (
+    job_key,
     workflow_runs_key,
     workflow_run_jobs_key,
     GLOBAL_PENDING_JOBS,
     slide_key,  # Used for WSI hydration
 )
 
-from app.workers.registry import register_job
+from app.workers.registry import register_job, RetryPolicy, TRANSIENT_IO_ERRORS, PERMANENT_ERRORS
+from app.core import tissue_mask as tissue_mask_engine
+from app.core.artifact_cache import slide_cache, slide_content_hash
+from app.core.slide_pool import slide_pool
+from app.core.colorize import colorize_labels
+from app.core.pyramid import DeepZoomPyramidWriter, PYRAMID_LAYERS
+from app.services.artifact_manager import ArtifactManager
+from app.core.log import get_logger
+from app.core.profiling import StageProfiler
+from app.core.cancellation import JobCancelled, check_cancelled, wait_for_thread
+from app.core.tile_checkpoint import TileCheckpoint, CHECKPOINT_DIR
+from app.core.config import settings
 
 import numpy as np
 from PIL import Image
 import os
-import openslide
+import shutil
 from pathlib import Path
 import torch
 import cv2
+import openslide
 from torchvision import models, transforms
 
-# Initialize INSTANSEG_MODEL (assuming it's a pre-trained model from torchvision)
-INSTANSEG_MODEL = models.segmentation.deeplabv3_resnet101(pretrained=True)
-INSTANSEG_MODEL.eval()  # Set the model to evaluation mode
+# Segmentation model: built on first use (not at import, which pulled weights
+# over the network in every process importing app.main) and replaceable with
+# set_model() (benchmarks use a fixed-cost stub).
+MODEL_NAME = "deeplabv3_resnet101"  # part of the slide-cache key for seg outputs
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = models.segmentation.deeplabv3_resnet101(pretrained=True)
+                model.eval()  # Set the model to evaluation mode
+                _model = model
+    return _model
+
+
+def set_model(model, name: str):
+    """Inject a model (must return {"out": logits} like torchvision segmentation models)."""
+    global _model, MODEL_NAME
+    with _model_lock:
+        _model = model
+        MODEL_NAME = name
 
 # Initialize BATCH_SIZE for batch processing
 BATCH_SIZE = 10
 
+log = get_logger(__name__)
+
 # -------------------------------------------
 # Sync Worker Function (Runs in Thread)
 # -------------------------------------------
-def run_segmentation_task(job_id, slide_path_str, tile_size, overlap, min_tile_size, max_tile_size, loop):
+def run_segmentation_task(job_id, slide_path_str, tile_size, overlap, min_tile_size, max_tile_size, loop,
+                          content_hash=None, pyramid=False, output_dir=None, profile=False):
     """
     The synchronous core logic for segmentation. 
     This runs entirely in a separate thread to prevent blocking the asyncio event loop.
     We pass 'loop' explicitly to schedule updates back to the main thread.
+    `content_hash` (slide content sha256) enables the per-slide artifact cache.
+    `pyramid` streams full-resolution results into a DeepZoom pyramid as tiles finish.
+    `output_dir` is the job's artifact directory (ArtifactManager.job_dir).
+    `profile` also runs the thread under cProfile and dumps output_dir/profile.pstats;
+    per-stage timings / counters / peak RSS are always returned under "profile".
+    Progress is checkpointed to output_dir/checkpoint every SEG_CHECKPOINT_SECONDS
+    and when the task fails; a retry of the job resumes after the last saved batch.
     """
+    slide_handle = None
+    prof = StageProfiler(trace=profile)
     try:
-        # 1. Open Slide (Safe in thread)
-        slide = openslide.OpenSlide(slide_path_str)
-        w, h = slide.dimensions
-        print(f"\n=== [Thread] Loading WSI: {slide_path_str}")
-        print(f"WSI resolution: {w} × {h}")
+        output_dir = Path(output_dir)
+        output_dir.mkdir(exist_ok=True, parents=True)
 
-        # 2. Compute Tissue Mask
-        print("[Thread] Computing tissue mask…")
-        tissue_mask, scale = compute_tissue_mask(slide)
+        mask_path = output_dir / "mask.png"
+        overlay_path = output_dir / "overlay.png"
+        pyramid_dir = output_dir / "pyramid"
 
-        # 3. Generate Tiles
-        print("[Thread] Generating smart tiles…")
-        tiles = generate_smart_tiles(tissue_mask, scale, tile_size, overlap, min_tile_size, max_tile_size)
-        print(f"[Thread] Tiles to process: {len(tiles)}")
+        grid_params = {
+            "tile_size": tile_size,
+            "overlap": overlap,
+            "min_tile": min_tile_size,
+            "max_tile": max_tile_size,
+        }
+        seg_params = {**grid_params, "model": MODEL_NAME}
+
+        # 0. Same slide content + params already segmented -> reuse outputs
+        #    (the cache only holds the downsampled PNGs, a pyramid needs full-res labels)
+        if content_hash and not pyramid:
+            with prof.stage("cache_lookup"):
+                cached = load_cached_segmentation(content_hash, seg_params, mask_path, overlay_path)
+            if cached is not None:
+                log.info("Slide cache hit for %.12s, skipping inference", content_hash)
+                return {
+                    "mask_path": mask_path,
+                    "overlay_path": overlay_path,
+                    "num_tiles": cached["num_tiles"],
+                    "cache_hit": True,
+                    "pyramid": False,
+                    "profile": _finish_profile(prof, output_dir, profile),
+                }
+
+        # 1. Borrow a warm handle from the worker's slide pool (Safe in thread)
+        with prof.stage("open"):
+            slide_handle, slide = slide_pool.checkout(slide_path_str)
+        w, h = slide.dimensions
+        log.info("Loaded WSI %s (%d × %d)", slide_path_str, w, h)
+
+        # 2-3. Tissue mask + smart tiles (tile grid shared with wsi_metadata via the cache)
+        tiles = slide_cache.get_json(content_hash, "tiles", grid_params) if content_hash else None
+        if tiles is None:
+            log.debug("Computing tissue mask…")
+            with prof.stage("tissue_mask"):
+                tissue_mask, scale = compute_tissue_mask(slide, slide_path_str, stride=tile_size - overlap)
+
+            log.debug("Generating smart tiles…")
+            with prof.stage("tiling"):
+                tiles = generate_smart_tiles(tissue_mask, scale, tile_size, overlap, min_tile_size, max_tile_size)
+            if content_hash:
+                slide_cache.put_json(content_hash, "tiles", grid_params, tiles)
+        log.info("Tiles to process: %d", len(tiles))
+
+        # grid positions dropped as background (same stride as generate_smart_tiles)
+        stride = tile_size - overlap
+        prof.count("tiles_skipped", max(0, math.ceil(w / stride) * math.ceil(h / stride) - len(tiles)))
 
         # 4. Init Global Mask
         # Allocating large arrays can be slow, better done in thread
-        final_mask = np.zeros((h, w), dtype=np.uint32)
+        with prof.stage("allocate"):
+            final_mask = np.zeros((h, w), dtype=np.uint32)
+
+        # 4b. Pyramid writer (optional): tiles are flushed as soon as they are final
+        pyramid_writer = None
+        if pyramid:
+            pyramid_writer = DeepZoomPyramidWriter(pyramid_dir, w, h)
+            pyramid_writer.plan(tiles)
+
+        # 4c. Resume from a checkpoint of an earlier attempt (same slide, tiling and model)
+        checkpoint = TileCheckpoint(
+            output_dir / CHECKPOINT_DIR,
+            {"slide": content_hash or slide_path_str, **seg_params, "num_tiles": len(tiles)},
+            settings.SEG_CHECKPOINT_SECONDS,
+        )
+        with prof.stage("resume"):
+            resumed = checkpoint.load(final_mask)
+        start_tile = resumed["next_tile"] if resumed else 0
+        if start_tile:
+            log.info("Resuming from checkpoint: %d/%d tiles done", start_tile, len(tiles))
+            prof.count("tiles_resumed", start_tile)
+            if pyramid_writer is not None:
+                with prof.stage("pyramid"):
+                    pyramid_writer.flush(final_mask, slide, processed=start_tile)
 
         # 5. Batch Inference & Stitching
-        print("[Thread] Running batch inference…")
-        running_label = 1
+        log.debug("Running batch inference…")
+        running_label = resumed["running_label"] if resumed else 1
         
         # Preprocessing transform
         preprocess = transforms.Compose([
@@ -73,96 +188,155 @@ def run_segmentation_task(job_id, slide_path_str, tile_size, overlap, min_tile_s
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
         ])
 
-        total_tiles = len(tiles)
+        with prof.stage("model_load"):
+            model = get_model()
 
-        for i in range(0, total_tiles, BATCH_SIZE):
-            # Log occasional progress
-            if i % BATCH_SIZE == 0: 
-                print(f"[Thread] Processing {i}/{total_tiles}")
+        total_tiles = len(tiles)
+        debug = log.isEnabledFor(logging.DEBUG)  # checked once, not per batch
+
+        done = start_tile   # tiles [0, done) are stitched into final_mask
+        try:
+            for i in range(start_tile, total_tiles, BATCH_SIZE):
+                # a cancelled job stops here, at most one batch after the cancel
+                check_cancelled()
+                if debug:
+                    log.debug("Processing %d/%d", i, total_tiles)
             
-            batch = tiles[i:i+BATCH_SIZE]
+                batch = tiles[i:i+BATCH_SIZE]
             
-            # Run inference for batch
-            batch_out = batch_inference_logic(INSTANSEG_MODEL, slide, batch, preprocess)
-
-            # Stitch results
-            for labeled_output, x, y, size in batch_out:
-                # Shift labels for uniqueness
-                non_zero_mask = labeled_output > 0
-                labeled_output[non_zero_mask] += running_label
-                running_label = labeled_output.max() + 1
-
-                # Paste into global mask
-                y_end = min(y + size, h)
-                x_end = min(x + size, w)
-                
-                h_clip = y_end - y
-                w_clip = x_end - x
-
-                final_mask[y:y_end, x:x_end] = labeled_output[:h_clip, :w_clip]
+                # Run inference for batch
+                batch_out = batch_inference_logic(model, slide, batch, preprocess, prof=prof)
+
+                # Stitch results
+                with prof.stage("stitch"):
+                    for labeled_output, x, y, size in batch_out:
+                        # Shift labels for uniqueness
+                        non_zero_mask = labeled_output > 0
+                        labeled_output[non_zero_mask] += running_label
+                        running_label = labeled_output.max() + 1
+
+                        # Paste into global mask
+                        y_end = min(y + size, h)
+                        x_end = min(x + size, w)
+
+                        h_clip = y_end - y
+                        w_clip = x_end - x
+
+                        final_mask[y:y_end, x:x_end] = labeled_output[:h_clip, :w_clip]
+                prof.count("tiles_processed", len(batch_out))
+
+                if pyramid_writer is not None:
+                    with prof.stage("pyramid"):
+                        pyramid_writer.flush(final_mask, slide, processed=min(i + BATCH_SIZE, total_tiles))
             
-            # --- UPDATE PROGRESS SAFELY ---
-            # Schedule the Redis update on the main event loop.
-            # We use the global 'redis_client' variable.
-            if total_tiles > 0:
-                current_processed = min(i + BATCH_SIZE, total_tiles)
-                percent = int((current_processed / total_tiles) * 100)
+                # --- UPDATE PROGRESS SAFELY ---
+                # Schedule the Redis update on the main event loop.
+                # We use the global 'redis_client' variable.
+                if total_tiles > 0:
+                    current_processed = min(i + BATCH_SIZE, total_tiles)
+                    percent = int((current_processed / total_tiles) * 100)
                 
-                asyncio.run_coroutine_threadsafe(
-                    redis_client.hset(f"job:{job_id}", mapping={
-                        "progress": percent,
-                        "status": "running"
-                    }),
-                    loop
-                )
+                    # progress only: the status is run_job's (cancel_job reads it)
+                    asyncio.run_coroutine_threadsafe(
+                        redis_client.hset(job_key(job_id), "progress", percent),
+                        loop
+                    )
+
+                done = min(i + BATCH_SIZE, total_tiles)
+                if checkpoint.due():
+                    with prof.stage("checkpoint"):
+                        checkpoint.save(final_mask, tiles, done, running_label)
+        except Exception:
+            # keep what was stitched: the retry (or a resumed job) starts from here
+            with prof.stage("checkpoint"):
+                checkpoint.save(final_mask, tiles, done, running_label)
+            raise
 
         # 6. Save Outputs
-        # Save to 'tmp' directory to match the file server's resolution path
-        output_dir = Path("tmp") 
-        output_dir.mkdir(exist_ok=True, parents=True)
+        log.debug("Saving final outputs…")
+        with prof.stage("save"):
+            save_outputs(final_mask, slide, mask_path, overlay_path, content_hash=content_hash)
+        if pyramid_writer is not None:
+            with prof.stage("pyramid"):
+                pyramid_writer.finish(final_mask, slide)
 
-        filename_mask = f"{job_id}_mask.png"
-        filename_overlay = f"{job_id}_overlay.png"
+        log.debug("Saved files to %s", output_dir)
 
-        mask_path = output_dir / filename_mask
-        overlay_path = output_dir / filename_overlay
-
-        print("[Thread] Saving final outputs…")
-        save_downsampled_mask(final_mask, slide, mask_path)
-        save_overlay(final_mask, slide, overlay_path)
-        
-        print(f"DEBUG: Saved files to {output_dir.resolve()}")
+        if content_hash:
+            with prof.stage("cache_store"):
+                store_cached_segmentation(content_hash, seg_params, len(tiles), mask_path, overlay_path)
+        checkpoint.clear()
 
         return {
-            "mask_filename": filename_mask,
-            "overlay_filename": filename_overlay,
-            "num_tiles": len(tiles)
+            "mask_path": mask_path,
+            "overlay_path": overlay_path,
+            "pyramid_dir": pyramid_dir,
+            "num_tiles": len(tiles),
+            "resumed_tiles": start_tile,
+            "cache_hit": False,
+            "pyramid": pyramid_writer is not None,
+            "profile": _finish_profile(prof, output_dir, profile),
         }
 
-    except Exception as e:
-        print(f"Error in segmentation task: {e}")
-        raise e
+    except JobCancelled:
+        log.info("Segmentation cancelled")
+        raise
+
+    except Exception:
+        log.exception("Segmentation task failed")
+        raise
+
+    finally:
+        prof.stop()
+        if slide_handle is not None:
+            slide_pool.release(slide_handle)
+
+def _finish_profile(prof, output_dir, trace):
+    """Close the profiler; the cProfile dump sits next to the job outputs."""
+    return prof.finish(trace_path=Path(output_dir) / "profile.pstats" if trace else None,
+                       template="tile_segmentation")
+
+# -------------------------------------------
+# Resource estimate (scheduler bin-packing)
+# -------------------------------------------
+# model weights + activations of one BATCH_SIZE batch, roughly
+SEG_BASE_MEMORY_MB = 1536
+
+
+def estimate_resources(payload: dict) -> dict:
+    """Memory grows with the full-resolution uint32 label mask: 4 bytes per level-0 pixel."""
+    with slide_pool.acquire(payload["slide_path"]) as slide:
+        w, h = slide.dimensions
+    return {"memory_mb": SEG_BASE_MEMORY_MB + w * h * 4 / 1024**2}
 
 # -------------------------------------------
 # Async Job Wrapper
 # -------------------------------------------
-@register_job("tile_segmentation")
+# transient slide reads and out-of-memory are worth another try (on another
+# node, or once the one it ran on has room); bad input is not: a missing,
+# unreadable or unsupported slide fails at once. A retry resumes from the
+# attempt's last checkpoint instead of starting over.
+SEG_RETRY = RetryPolicy(
+    max_attempts=3,
+    backoff_seconds=30,
+    retry_on=(openslide.OpenSlideError, *TRANSIENT_IO_ERRORS, MemoryError, torch.cuda.OutOfMemoryError),
+    never_retry=(*PERMANENT_ERRORS, openslide.OpenSlideUnsupportedFormatError),
+)
+
+
+@register_job("tile_segmentation", cpu=4, memory_mb=SEG_BASE_MEMORY_MB, estimate=estimate_resources,
+              retry=SEG_RETRY)
 async def tile_segmentation(job_id: str, payload: dict):
     """
     Async wrapper that offloads the entire heavy lifting to a thread.
     """
-    print(f"DEBUG: Starting tile_segmentation for Job {job_id}")
-    
-    # FIX 1: IMMEDIATELY set status to Running.
-    # This ensures the UI updates instantly, covering the time taken by 'compute_tissue_mask'.
+    log.debug("Starting tile_segmentation for job %s", job_id)
+
+    # run_job has marked the job RUNNING already; reset the progress of a retried attempt
     try:
-        await redis_client.hset(f"job:{job_id}", mapping={
-            "status": "running",
-            "progress": 0
-        })
-        print(f"DEBUG: Set Job {job_id} status to RUNNING")
+        await redis_client.hset(job_key(job_id), "progress", 0)
     except Exception as e:
-        print(f"ERROR: Failed to set initial Redis status for job {job_id}: {e}")
+        log.error("Failed to reset progress of job %s: %s", job_id, e)
 
     slide_id = payload["slide_id"]
     slide_path = payload["slide_path"] # Keep as string for thread safety
@@ -172,54 +346,74 @@ async def tile_segmentation(job_id: str, payload: dict):
     overlap = payload.get("overlap", 128)
     min_tile_size = payload.get("min_tile_size", 512)
     max_tile_size = payload.get("max_tile_size", 1536)
+    pyramid = bool(payload.get("pyramid", False))
+    profile = bool(payload.get("profile", settings.PROFILE_JOBS))
+
+    content_hash = await slide_content_hash(slide_id, slide_path)
+    output_dir = await ArtifactManager.job_dir(job_id)
 
     loop = asyncio.get_running_loop()
 
     # FIX 2: Pass 'loop' directly instead of a closure callback.
     # This prevents pickling errors if the executor environment is strict.
-    result = await loop.run_in_executor(
-        None, 
+    # run_in_executor doesn't carry contextvars over, so run the task in a copy
+    # of ours to keep job_id / run_id / user_id on the thread's log records
+    # (and the job's cancel token, checked between batches).
+    result = await wait_for_thread(loop.run_in_executor(
+        None,
+        contextvars.copy_context().run,
         run_segmentation_task,
-        job_id, slide_path, tile_size, overlap, min_tile_size, max_tile_size, loop
-    )
+        job_id, slide_path, tile_size, overlap, min_tile_size, max_tile_size, loop, content_hash, pyramid,
+        output_dir, profile,
+    ))
+
+    log.info("Segmentation completed: mask → %s, overlay → %s", result["mask_path"], result["overlay_path"])
+
+    # Final update to 100% (run_job marks it SUCCESS)
+    await redis_client.hset(job_key(job_id), "progress", 100)
 
-    print("\nJob Completed Successfully.")
-    print(f" - mask    → {result['mask_filename']}")
-    print(f" - overlay → {result['overlay_filename']}\n")
+    # Index outputs in the artifact store (expired with the run / branch)
+    mask = await ArtifactManager.register(job_id, result["mask_path"])
+    overlay = await ArtifactManager.register(job_id, result["overlay_path"])
+    artifacts = {"mask": mask["artifact_id"], "overlay": overlay["artifact_id"]}
+    if result["pyramid"]:
+        artifacts["pyramid"] = (await ArtifactManager.register(job_id, result["pyramid_dir"]))["artifact_id"]
 
-    # Final update to 100%
-    await redis_client.hset(f"job:{job_id}", mapping={"progress": 100, "status": "completed"})
+    stats = result["profile"]
+    if stats["trace"]:
+        trace = await ArtifactManager.register(job_id, Path(stats["trace"]),
+                                               media_type="application/octet-stream")
+        artifacts["profile"] = trace["artifact_id"]
+        stats["trace"] = trace["url"]
 
     return {
         "slide_id": slide_id,
-        # Return relative filename so the download endpoint (rooted in tmp) finds it
-        "mask_path": result["mask_filename"],     
-        "overlay_path": result["overlay_filename"], 
+        # download URLs (GET /files/artifacts/<id>)
+        "mask_path": mask["url"],
+        "overlay_path": overlay["url"],
+        "artifacts": artifacts,
         "num_tiles": result["num_tiles"],
+        # tiles a checkpoint of an earlier attempt already covered
+        "resumed_tiles": result.get("resumed_tiles", 0),
+        "cache_hit": result["cache_hit"],
+        # per-stage seconds, bytes decoded / tiles skipped, peak RSS
+        "profile": stats,
+        # DeepZoom descriptors, served tile-by-tile by GET /files/pyramid/...
+        "pyramid": {
+            layer: f"/files/pyramid/{job_id}/{layer}.dzi" for layer in PYRAMID_LAYERS
+        } if result["pyramid"] else None,
     }
 
 # -------------------------------------------
 # Helper functions
 # -------------------------------------------
 
-def compute_tissue_mask(slide):
-    w, h = slide.dimensions
-    thumbnail = slide.get_thumbnail((2048, 2048))
-    thumb_w, thumb_h = thumbnail.size
-    thumb_np = np.array(thumbnail.convert("RGB"))
-    
-    scale_x = w / thumb_w
-    scale_y = h / thumb_h
-    scale = (scale_x, scale_y)
-
-    hsv = cv2.cvtColor(thumb_np, cv2.COLOR_RGB2HSV)
-    H, S, V = cv2.split(hsv)
-
-    _, sat_mask = cv2.threshold(S, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    _, val_mask = cv2.threshold(V, 220, 255, cv2.THRESH_BINARY_INV)
-
-    tissue_mask = (sat_mask > 0).astype(np.uint8) & (val_mask > 0).astype(np.uint8)
-    return tissue_mask, scale
+def compute_tissue_mask(slide, slide_path=None, stride=None):
+    """
+    Tissue mask from the nearest native pyramid level (see core.tissue_mask).
+    Returns the mask and the level-0 / mask scale.
+    """
+    return tissue_mask_engine.compute_tissue_mask(slide, slide_path=slide_path, stride=stride)
 
 
 def generate_smart_tiles(tissue_mask, scale, tile_size, overlap, min_size, max_size):
@@ -257,19 +451,24 @@ def generate_smart_tiles(tissue_mask, scale, tile_size, overlap, min_size, max_s
 
     return tiles
 
-def batch_inference_logic(model, slide, batch, preprocess):
+def batch_inference_logic(model, slide, batch, preprocess, prof=None):
     """
     Helper logic for batch inference, called inside the thread loop.
+    `prof` (StageProfiler) splits the time into read (decode) and inference.
     """
+    stage = prof.stage if prof is not None else (lambda name: nullcontext())
     batch_out = []
     for tile in batch:
         x, y, size = tile["x"], tile["y"], tile["size"]
-        
-        tile_image = slide.read_region((x, y), 0, (size, size))
-        tile_pil = tile_image.convert("RGB")
-        input_tensor = preprocess(tile_pil).unsqueeze(0)
 
-        with torch.no_grad():
+        with stage("read"):
+            tile_image = slide.read_region((x, y), 0, (size, size))
+            tile_pil = tile_image.convert("RGB")
+            input_tensor = preprocess(tile_pil).unsqueeze(0)
+        if prof is not None:
+            prof.count("bytes_decoded", size * size * 4)  # RGBA from read_region
+
+        with stage("inference"), torch.no_grad():
             output = model(input_tensor)["out"]
             _, predicted_mask = torch.max(output, 1)
             
@@ -282,54 +481,95 @@ def batch_inference_logic(model, slide, batch, preprocess):
         batch_out.append((labeled_output_resized, x, y, size))
     return batch_out
 
-def save_downsampled_mask(mask, slide, out_path):
-    downsample_factor = 16
-    mask_downsampled = mask[::downsample_factor, ::downsample_factor]
-    
-    unique_labels = np.unique(mask_downsampled)
-    unique_labels = unique_labels[unique_labels != 0]
+# both outputs are cut from one downsampled label array;
+# MASK_DOWNSAMPLE must be a multiple of OVERLAY_DOWNSAMPLE
+OVERLAY_DOWNSAMPLE = 8
+MASK_DOWNSAMPLE = 16
 
-    np.random.seed(42)
-    colors = {}
-    for label in unique_labels:
-        colors[label] = tuple(np.random.randint(50, 256, 3)) 
 
-    h, w = mask_downsampled.shape
-    colored_mask = np.zeros((h, w, 3), dtype=np.uint8)
+def save_outputs(mask, slide, mask_path, overlay_path, content_hash=None):
+    """
+    Downsample the stitched labels once, colorize once (LUT gather),
+    then write both the mask PNG and the overlay PNG from that array.
+    """
+    w, h = slide.dimensions
+    overlay_w = w // OVERLAY_DOWNSAMPLE
+    overlay_h = h // OVERLAY_DOWNSAMPLE
+
+    # NumPy slicing for downsampling (avoids cv2.resize uint32 error)
+    labels_ds = mask[0:overlay_h * OVERLAY_DOWNSAMPLE:OVERLAY_DOWNSAMPLE,
+                     0:overlay_w * OVERLAY_DOWNSAMPLE:OVERLAY_DOWNSAMPLE]
+    colored = colorize_labels(labels_ds)
+
+    save_downsampled_mask(colored, mask_path)
+    save_overlay(colored, slide, overlay_path, content_hash=content_hash)
 
-    for label, color in colors.items():
-        colored_mask[mask_downsampled == label] = color
 
-    mask_image = Image.fromarray(colored_mask)
+def save_downsampled_mask(colored, out_path):
+    step = MASK_DOWNSAMPLE // OVERLAY_DOWNSAMPLE
+    mask_image = Image.fromarray(np.ascontiguousarray(colored[::step, ::step]))
     mask_image.save(out_path)
 
-def save_overlay(mask, slide, out_path):
-    w, h = slide.dimensions
-    downsample_factor = 8
-    overlay_w = w // downsample_factor
-    overlay_h = h // downsample_factor
-    
-    background = slide.get_thumbnail((overlay_w, overlay_h)).convert("RGB")
-    background_np = np.array(background)
-    
-    # NumPy slicing for downsampling (avoids cv2.resize uint32 error)
-    mask_resized = mask[0:overlay_h * downsample_factor:downsample_factor, 
-                        0:overlay_w * downsample_factor:downsample_factor]
-    
-    unique_labels = np.unique(mask_resized)
-    unique_labels = unique_labels[unique_labels != 0]
+def save_overlay(colored, slide, out_path, content_hash=None):
+    overlay_h, overlay_w = colored.shape[:2]
 
-    np.random.seed(42)
-    colors = {}
-    for label in unique_labels:
-        colors[label] = tuple(np.random.randint(50, 256, 3)) 
+    background = get_thumbnail_cached(slide, (overlay_w, overlay_h), content_hash)
+    background_np = np.array(background)
 
-    overlay_layer = np.zeros_like(background_np)
-    for label, color in colors.items():
-        overlay_layer[mask_resized == label] = color
+    # thumbnail keeps aspect ratio, so it can be a pixel off the label grid
+    bh, bw = background_np.shape[:2]
+    if (bh, bw) != (overlay_h, overlay_w):
+        background_np = cv2.resize(background_np, (overlay_w, overlay_h), interpolation=cv2.INTER_LINEAR)
 
     alpha = 0.5
-    final_overlay = cv2.addWeighted(background_np, 1 - alpha, overlay_layer, alpha, 0)
+    final_overlay = cv2.addWeighted(background_np, 1 - alpha, colored, alpha, 0)
     
     overlay_image = Image.fromarray(final_overlay)
-    overlay_image.save(out_path)
\ No newline at end of file
+    overlay_image.save(out_path)
+
+
+# -------------------------------------------
+# Slide artifact cache helpers
+# -------------------------------------------
+def get_thumbnail_cached(slide, size, content_hash=None):
+    """Slide thumbnail (overlay background), cached per slide content + size."""
+    params = {"w": size[0], "h": size[1]}
+    if content_hash:
+        cached = slide_cache.get(content_hash, "thumbnail", params, "png")
+        if cached is not None:
+            try:
+                with Image.open(cached) as img:
+                    return img.convert("RGB")
+            except FileNotFoundError:
+                pass
+
+    thumbnail = slide.get_thumbnail(size).convert("RGB")
+    if content_hash:
+        slide_cache.put(content_hash, "thumbnail", params, "png",
+                        lambda tmp: thumbnail.save(tmp, format="PNG"))
+    return thumbnail
+
+
+def load_cached_segmentation(content_hash, params, mask_path, overlay_path):
+    meta = slide_cache.get_json(content_hash, "segmentation", params)
+    if meta is None:
+        return None
+
+    cached_mask = slide_cache.get(content_hash, "seg_mask", params, "png")
+    cached_overlay = slide_cache.get(content_hash, "seg_overlay", params, "png")
+    if cached_mask is None or cached_overlay is None:
+        return None
+
+    if not (slide_cache.materialize(cached_mask, mask_path)
+            and slide_cache.materialize(cached_overlay, overlay_path)):
+        return None
+    return meta
+
+
+def store_cached_segmentation(content_hash, params, num_tiles, mask_path, overlay_path):
+    slide_cache.put(content_hash, "seg_mask", params, "png",
+                    lambda tmp: shutil.copyfile(mask_path, tmp))
+    slide_cache.put(content_hash, "seg_overlay", params, "png",
+                    lambda tmp: shutil.copyfile(overlay_path, tmp))
+    # meta last: its presence means both images are complete
+    slide_cache.put_json(content_hash, "segmentation", params, {"num_tiles": num_tiles})
@@ -1,52 +1,33 @@
 import json
+import shutil
 import numpy as np
-import cv2
 from PIL import Image
-import openslide
 from pathlib import Path
+import openslide
 
-from app.workers.registry import register_job
-
-TMP_DIR = Path("tmp")
-TMP_DIR.mkdir(exist_ok=True)
+from app.workers.registry import register_job, RetryPolicy, TRANSIENT_IO_ERRORS, PERMANENT_ERRORS
+from app.core import tissue_mask as tissue_mask_engine
+from app.core.artifact_cache import slide_cache, slide_content_hash
+from app.core.slide_pool import slide_pool
+from app.services.artifact_manager import ArtifactManager
 
 
 # -----------------------------------------------------
 # 1. Generate a tissue mask at low resolution
 # -----------------------------------------------------
-def compute_tissue_mask(slide, thumb_size=(2048, 2048)):
+def compute_tissue_mask(slide, slide_path=None, stride=None):
     """
     Returns:
         tissue_mask (np.uint8 array): 1 = tissue, 0 = background
         scale: ratio between mask size and level-0 WSI size
     """
-    # Low-res thumbnail for mask generation
-    thumbnail = slide.get_thumbnail(thumb_size)
-    thumb_np = np.array(thumbnail.convert("RGB"))
-
-    # Convert to HSV → H & S channels help eliminate white background
-    hsv = cv2.cvtColor(thumb_np, cv2.COLOR_RGB2HSV)
-    H, S, V = cv2.split(hsv)
-
-    # Otsu threshold on saturation
-    _, sat_mask = cv2.threshold(S, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-
-    # Remove very bright areas (white background)
-    _, val_mask = cv2.threshold(V, 220, 255, cv2.THRESH_BINARY_INV)
-
-    raw_mask = (sat_mask > 0).astype(np.uint8) & (val_mask > 0).astype(np.uint8)
-
-    # Morph closing to fill holes
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (15, 15))
-    tissue_mask = cv2.morphologyEx(raw_mask, cv2.MORPH_CLOSE, kernel)
-
-    # Compute scaling factor back to level-0 coordinates
-    W0, H0 = slide.dimensions
-    mask_h, mask_w = tissue_mask.shape
-    scale_x = mask_w / W0
-    scale_y = mask_h / H0
+    # Native pyramid level read + Otsu/closing at stride-matched resolution
+    tissue_mask, (ds_x, ds_y) = tissue_mask_engine.compute_tissue_mask(
+        slide, slide_path=slide_path, stride=stride
+    )
 
-    return tissue_mask, (scale_x, scale_y)
+    # Scaling factor back to level-0 coordinates (mask px per level-0 px)
+    return tissue_mask, (1.0 / ds_x, 1.0 / ds_y)
 
 
 # -----------------------------------------------------
@@ -112,7 +93,16 @@ def generate_smart_tiles(tissue_mask, scale, tile_size, overlap=0, min_size=512,
 # -----------------------------------------------------
 # 3. JOB EXECUTION
 # -----------------------------------------------------
-@register_job("wsi_metadata")
+# flaky slide reads get another try; a missing or unsupported slide doesn't
+WSI_RETRY = RetryPolicy(
+    max_attempts=3,
+    backoff_seconds=5,
+    retry_on=(openslide.OpenSlideError, *TRANSIENT_IO_ERRORS),
+    never_retry=(*PERMANENT_ERRORS, openslide.OpenSlideUnsupportedFormatError),
+)
+
+
+@register_job("wsi_metadata", cpu=1, memory_mb=512, retry=WSI_RETRY)
 async def wsi_initialize(job_id: str, payload: dict):
 
     slide_id = payload["slide_id"]
@@ -123,11 +113,28 @@ async def wsi_initialize(job_id: str, payload: dict):
     MIN_TILE = payload.get("min_tile", 512)
     MAX_TILE = payload.get("max_tile", 1536)
 
-    slide = openslide.OpenSlide(str(slide_path))
-    W0, H0 = slide.dimensions
+    out_dir = await ArtifactManager.job_dir(job_id)
+    mask_path = out_dir / "tissue_mask.png"
+    tiles_path = out_dir / "tiles.json"
+
+    # 0) Derived-artifact cache: same slide content + params -> reuse
+    content_hash = await slide_content_hash(slide_id, str(slide_path))
+    params = tile_grid_params(TILE_SIZE, OVERLAP, MIN_TILE, MAX_TILE)
+
+    cached = load_cached_metadata(content_hash, params, mask_path, tiles_path)
+    if cached is not None:
+        return {
+            "slide_id": slide_id,
+            **cached,
+            **await register_outputs(job_id, mask_path, tiles_path),
+            "cache_hit": True,
+        }
+
+    with slide_pool.acquire(slide_path) as slide:
+        W0, H0 = slide.dimensions
 
-    # 1) Compute tissue mask (low level)
-    tissue_mask, scale = compute_tissue_mask(slide)
+        # 1) Compute tissue mask (low level)
+        tissue_mask, scale = compute_tissue_mask(slide, slide_path, stride=TILE_SIZE - OVERLAP)
 
     # 2) Compute tiles based on mask
     tiles = generate_smart_tiles(
@@ -141,21 +148,76 @@ async def wsi_initialize(job_id: str, payload: dict):
 
     # 3) Save mask for frontend visualization
     tissue_mask_vis = (tissue_mask * 255).astype(np.uint8)
-    mask_path = TMP_DIR / f"{job_id}_tissue_mask.png"
     Image.fromarray(tissue_mask_vis).save(mask_path)
 
     # 4) Save smart tile metadata
-    tiles_path = TMP_DIR / f"{job_id}_tiles.json"
     with open(tiles_path, "w") as f:
         json.dump(tiles, f)
 
-    # 5) Return job output (stored by worker)
-    return {
-        "slide_id": slide_id,
+    meta = {
         "width": W0,
         "height": H0,
         "num_tiles": len(tiles),
-        "tiles_path": str(tiles_path),
-        "tissue_mask_path": str(mask_path),
         "scale": scale,
     }
+    store_cached_metadata(content_hash, params, meta, mask_path, tiles_path)
+
+    # 5) Return job output (stored by worker)
+    return {
+        "slide_id": slide_id,
+        **meta,
+        **await register_outputs(job_id, mask_path, tiles_path),
+        "cache_hit": False,
+    }
+
+
+async def register_outputs(job_id, mask_path, tiles_path):
+    """Index the outputs in the artifact store; paths in the output are download URLs."""
+    mask = await ArtifactManager.register(job_id, mask_path)
+    tiles = await ArtifactManager.register(job_id, tiles_path)
+    return {
+        "tiles_path": tiles["url"],
+        "tissue_mask_path": mask["url"],
+        "artifacts": {"tissue_mask": mask["artifact_id"], "tiles": tiles["artifact_id"]},
+    }
+
+
+# -----------------------------------------------------
+# 4. Slide artifact cache helpers
+# -----------------------------------------------------
+def tile_grid_params(tile_size, overlap, min_tile, max_tile):
+    """Parameters that fully determine the tissue mask + tile grid of a slide."""
+    return {
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "min_tile": min_tile,
+        "max_tile": max_tile,
+    }
+
+
+def load_cached_metadata(content_hash, params, mask_path, tiles_path):
+    """Materialize cached mask + tiles into this job's outputs; returns meta or None."""
+    meta = slide_cache.get_json(content_hash, "wsi_metadata", params)
+    if meta is None:
+        return None
+
+    cached_mask = slide_cache.get(content_hash, "tissue_mask", params, "png")
+    cached_tiles = slide_cache.get(content_hash, "tiles", params, "json")
+    if cached_mask is None or cached_tiles is None:
+        return None
+
+    if not (slide_cache.materialize(cached_mask, mask_path)
+            and slide_cache.materialize(cached_tiles, tiles_path)):
+        return None
+
+    meta["scale"] = tuple(meta["scale"])
+    return meta
+
+
+def store_cached_metadata(content_hash, params, meta, mask_path, tiles_path):
+    slide_cache.put(content_hash, "tissue_mask", params, "png",
+                    lambda tmp: shutil.copyfile(mask_path, tmp))
+    slide_cache.put(content_hash, "tiles", params, "json",
+                    lambda tmp: shutil.copyfile(tiles_path, tmp))
+    # meta last: its presence means the other two are complete
+    slide_cache.put_json(content_hash, "wsi_metadata", params, meta)
@@ -4,32 +4,45 @@ from contextlib import asynccontextmanager
 import asyncio
 
 from app.core.redis_schema import initialize_redis_schema
-from app.services.user_manager import UserManager
 from app.scheduler.scheduler_main import scheduler_loop
-from app.workers.worker_main import worker_loop
+from app.workers.node import WorkerNode
+from app.core.config import settings
+from app.core.slide_pool import slide_pool
+from app.core.slide_tiles import tile_server
+from app.core.log import get_logger, setup_logging, shutdown_logging
 
 import app.jobs.fake_sleep
 import app.jobs.wsi_initialize
 import app.jobs.tile_segmentation
 
+log = get_logger(__name__)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print("[LIFESPAN] Startup triggered")
+    setup_logging()
+    log.info("Startup triggered")
     await initialize_redis_schema()
 
     # start scheduler (only ONCE)
-    print("[LIFESPAN] Starting global scheduler...")
+    log.info("Starting global scheduler...")
     asyncio.create_task(scheduler_loop())
 
-    # start workers for all users in DB
-    users = await UserManager.get_all_users()
-    for uid in users:
-        print(f"[LIFESPAN] Starting worker for {uid}")
-        asyncio.create_task(worker_loop(uid))
+    # run a worker node in this process too (standalone ones: app.workers.node)
+    node_task = None
+    if settings.RUN_LOCAL_NODE:
+        log.info("Starting local worker node %s...", settings.NODE_ID)
+        node_task = asyncio.create_task(WorkerNode().run())
 
     yield
 
-    print("[LIFESPAN] Shutdown triggered")
+    log.info("Shutdown triggered")
+    if node_task is not None:
+        node_task.cancel()
+        await asyncio.gather(node_task, return_exceptions=True)
+    tile_server.shutdown()
+    slide_pool.close()
+    shutdown_logging()
 
 
 app = FastAPI(
@@ -55,6 +68,7 @@ from app.routes.jobs import router as jobs_router
 from app.routes.execution import router as execution_router
 from app.routes.scheduler import router as scheduler_router
 from app.routes.files import router as files_router
+from app.routes.metrics import router as metrics_router
 
 app.include_router(users_router)
 app.include_router(workflows_router)
@@ -63,6 +77,7 @@ app.include_router(jobs_router)
 app.include_router(execution_router)
 app.include_router(scheduler_router)
 app.include_router(files_router)
+app.include_router(metrics_router)
 
 
 @app.get("/")
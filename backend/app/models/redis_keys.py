@@ -108,9 +108,6 @@ ACTIVE_USERS_KEY = "scheduler:active_users"
 GLOBAL_RUNNING_JOBS = "scheduler:running_jobs"
 GLOBAL_JOB_PROGRESS = "scheduler:job_progress"
 
-def user_queue_key(user_id: str) -> str:
-    return f"user:{user_id}:queue"
-
 '''
 ============
 Scheduler
@@ -119,6 +116,105 @@ Scheduler
 def scheduler_state_key() -> str:
     return "scheduler:state"
 
+# nudged by workers when they free a slot, so the scheduler doesn't poll
+SCHEDULER_WAKEUP = "scheduler:wakeup"
+
+# fair share (see scheduler/fair_share.py), one ready set / backlog per priority class
+FAIR_PASS_KEY = "scheduler:fair:pass"       # HASH <priority>:<user_id> -> pass (kept while idle)
+FAIR_VTIME_KEY = "scheduler:fair:vtime"     # HASH <priority> -> pass of the last dispatch
+USER_WEIGHTS_KEY = "scheduler:weights"      # HASH user_id -> share weight
+
+def fair_ready_key(priority: str) -> str:
+    '''
+        Users with backlog in a priority class, scored by their stride pass.
+        e.g.:
+            ZADD scheduler:fair:ready:<priority> <pass> <user_id>
+    '''
+    return f"scheduler:fair:ready:{priority}"
+
+def pending_by_priority_key(priority: str) -> str:
+    '''
+        Admitted, not yet dispatched jobs of a priority class by enqueue time
+        (the oldest one drives aging).
+        e.g.:
+            ZADD scheduler:pending:<priority> <enqueued_ts> <job_id>
+    '''
+    return f"scheduler:pending:{priority}"
+
+def user_backlog_key(user_id: str, priority: str) -> str:
+    '''
+        Jobs of one priority class admitted for a user but not yet given a
+        worker slot (FIFO).
+        e.g.:
+            RPUSH scheduler:backlog:<user_id>:<priority> <job_id>
+    '''
+    return f"scheduler:backlog:{user_id}:{priority}"
+
+def node_allocated_key(node_id: str) -> str:
+    '''
+        Resources reserved on a worker node by dispatched, unfinished jobs,
+        and the number of such jobs (capacity and worker count are advertised
+        in global:worker_usage).
+        e.g.:
+            HINCRBYFLOAT scheduler:node:<node_id>:allocated memory_mb 2048
+            HINCRBY scheduler:node:<node_id>:allocated jobs 1
+    '''
+    return f"scheduler:node:{node_id}:allocated"
+
+def node_queue_key(node_id: str) -> str:
+    '''
+        Jobs dispatched to a worker node with the "list" transport
+        (workers/transport.py), not yet started (FIFO: pushed on the left,
+        taken from the right, also by idle nodes stealing work).
+        e.g.:
+            LPUSH scheduler:node:<node_id>:queue <job_id>
+    '''
+    return f"scheduler:node:{node_id}:queue"
+
+def node_processing_key(node_id: str) -> str:
+    '''
+        Jobs a worker node took from a queue (atomically) with the "list"
+        transport and holds a lease on until it acknowledges them.
+        e.g.:
+            BRPOPLPUSH scheduler:node:<node_id>:queue scheduler:node:<node_id>:processing 1
+    '''
+    return f"scheduler:node:{node_id}:processing"
+
+def node_stream_key(node_id: str) -> str:
+    '''
+        Jobs dispatched to a worker node with the "stream" transport
+        (workers/transport.py): one entry {job: <job_id>} per dispatch, read
+        through the NODE_STREAM_GROUP consumer group (consumer = node id),
+        trimmed to an approximate MAXLEN.
+        e.g.:
+            XADD scheduler:node:<node_id>:stream MAXLEN ~ 10000 * job <job_id>
+            XREADGROUP GROUP executors <node_id> COUNT 4 BLOCK 1000 STREAMS scheduler:node:<node_id>:stream >
+    '''
+    return f"scheduler:node:{node_id}:stream"
+
+NODE_STREAM_GROUP = "executors"
+
+# job leases: renewed by the holding node's heartbeat, expired ones are recovered
+JOB_LEASES_KEY = "scheduler:leases"         # ZSET job_id -> lease expiry (epoch seconds)
+
+# failed attempts waiting out their backoff, and jobs that ran out of attempts
+DELAYED_JOBS_KEY = "scheduler:delayed"      # ZSET job_id -> retry due (epoch seconds)
+DEAD_LETTER_KEY = "scheduler:dead_letter"   # ZSET job_id -> dead-lettered at (epoch seconds)
+
+# cancelled jobs still sitting in a queue or running (services/cancellation_manager.py):
+# whoever pops the id next drops it, a running job's node interrupts it
+CANCELLED_JOBS_KEY = "scheduler:cancelled"  # SET of job_ids (tombstones)
+CANCEL_CHANNEL = "scheduler:cancel"         # PUBSUB job_id, heard by every worker node
+
+def node_heartbeat_key(node_id: str) -> str:
+    '''
+        Liveness of a worker node: refreshed every few seconds with a TTL, a
+        node whose key expired is dead and its jobs are recovered.
+        e.g.:
+            SET scheduler:node:<node_id>:heartbeat <ts> EX 15
+    '''
+    return f"scheduler:node:{node_id}:heartbeat"
+
 '''
 ============
 Slides (WSI uploads)
@@ -140,20 +236,98 @@ def slide_key(slide_id: str) -> str:
     e.g.:
         - slide_id
         - user_id
-        - slide_path
+        - slide_path (the shared blob file, see slide_blob_key)
         - size_bytes
+        - content_hash (sha256 of the file, keys the slide artifact cache)
+        - blob_hash (the blob:<hash> it holds a reference on; absent on legacy slides)
+        - filename (original upload name)
     """
     return f"slide:{slide_id}"
 
 
 def slide_preview_key(slide_id: str) -> str:
     """
-    Optional: path or bytes for a low-resolution JPEG preview.
+    Path of the cached low-resolution JPEG preview (see core/slide_tiles.py).
     e.g.:
         GET slide:<id>:preview
     """
     return f"slide:{slide_id}:preview"
 
+
+def slide_blob_key(content_hash: str) -> str:
+    """
+    Content-addressed slide file, shared by every slide:<id> with the same bytes.
+    e.g.:
+        - content_hash
+        - blob_path
+        - size_bytes
+        - refcount (slide records pointing at it; the file is deleted at 0)
+    """
+    return f"blob:{content_hash}"
+
+
+def upload_key(upload_id: str) -> str:
+    """
+    Hash tracking a resumable chunked upload.
+    e.g.:
+        - upload_id
+        - user_id
+        - filename
+        - total_bytes
+        - offset (bytes durably written so far)
+        - part_path
+    """
+    return f"upload:{upload_id}"
+
+'''
+============
+Artifacts (job outputs, see services/artifact_manager.py)
+============
+'''
+def artifact_key(artifact_id: str) -> str:
+    """
+    Hash describing one job output.
+    e.g.:
+        - artifact_id, name, media_type
+        - user_id, workflow_id, run_id, branch_id, job_id
+        - rel_path (under ARTIFACT_DIR), is_dir
+        - size_bytes
+        - created_at
+    """
+    return f"artifact:{artifact_id}"
+
+
+def run_artifacts_key(workflow_id: str, run_id: str) -> str:
+    """
+    Set of artifact_ids produced by a workflow run (expired with the run).
+    """
+    return f"workflow:{workflow_id}:run:{run_id}:artifacts"
+
+
+def artifact_reusers_key(artifact_id: str) -> str:
+    """
+    Set of job_ids of later runs that carried this artifact over from the job
+    that produced it (partial re-execution); it outlives the producing run
+    while one of them exists.
+    """
+    return f"artifact:{artifact_id}:reused_by"
+
+
+def branch_artifacts_key(workflow_id: str, branch_id: str) -> str:
+    """
+    Set of artifact_ids produced by jobs of a branch (expired with the branch).
+    """
+    return f"workflow:{workflow_id}:branch:{branch_id}:artifacts"
+
+
+def user_artifact_bytes_key(user_id: str) -> str:
+    """
+    Bytes of job outputs currently stored for a user.
+    e.g.:
+        INCRBY user:<id>:artifact_bytes <size>
+    """
+    return f"user:{user_id}:artifact_bytes"
+
 '''
 ============
 Global monitoring
@@ -169,4 +343,4 @@ def global_active_users_key() -> str:
     return "global:active_users"   # SET of user_ids currently allowed to run
 
 def global_worker_usage_key() -> str:
-    return "global:worker_usage"   # HASH: worker_id -> job_id (or empty)
\ No newline at end of file
+    return "global:worker_usage"   # HASH: node_id -> JSON capacity {cpu, memory_mb, gpu, updated_ts}
\ No newline at end of file
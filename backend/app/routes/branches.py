@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Optional
 
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 from app.services.workflow_manager import WorkflowManager
 from app.services.branch_manager import BranchManager
+from app.services.cancellation_manager import CancellationManager
+from app.schemas.jobs import JobPriority
 
 router = APIRouter(prefix="/workflows", tags=["Branches"])
 
@@ -16,11 +18,13 @@ class CreateBranchRequest(BaseModel):
 class AddJobRequest(BaseModel):
     job_template_id: str
     input_payload: dict = {}
+    priority: Optional[JobPriority] = None
 
 
 class JobSpec(BaseModel):
     template_id: str
     input_payload: dict = {}
+    priority: Optional[JobPriority] = None
 
 
 class BranchJobsResponse(BaseModel):
@@ -64,6 +68,7 @@ async def add_job_to_branch(
         branch_id=branch_id,
         job_template_id=payload.job_template_id,
         input_payload=payload.input_payload,
+        priority=payload.priority.value if payload.priority else None,
     )
     if not added:
         raise HTTPException(status_code=404, detail="Branch not found.")
@@ -115,6 +120,24 @@ async def get_branch_jobs(workflow_id: str, branch_id: str):
     )
 
 
+# cancel the branch's jobs in every run
+@router.post(
+    "/{workflow_id}/branches/{branch_id}/cancel",
+    summary="Cancel the queued and running jobs of a branch",
+)
+async def cancel_branch(workflow_id: str, branch_id: str):
+    if not await WorkflowManager.workflow_exists(workflow_id):
+        raise HTTPException(status_code=404, detail="Workflow not found.")
+    if not await BranchManager.branch_exists(workflow_id, branch_id):
+        raise HTTPException(status_code=404, detail="Branch not found.")
+
+    return {
+        "workflow_id": workflow_id,
+        "branch_id": branch_id,
+        "jobs": await CancellationManager.cancel_branch(workflow_id, branch_id),
+    }
+
+
 # delete branch
 @router.delete(
     "/{workflow_id}/branches/{branch_id}",
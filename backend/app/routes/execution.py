@@ -1,21 +1,63 @@
+from typing import Optional
+
 from fastapi import APIRouter, HTTPException
 from app.services.execution_manager import ExecutionManager
 from app.services.workflow_manager import WorkflowManager
+from app.services.cancellation_manager import CancellationManager
+from app.schemas.jobs import JobPriority
 
 router = APIRouter(prefix="/workflows", tags=["Execution"])
 
 
 @router.post("/{workflow_id}/execute")
-async def execute_workflow(workflow_id: str):
-
+async def execute_workflow(workflow_id: str, priority: Optional[JobPriority] = None,
+                           rerun_of: Optional[str] = None):
+    """
+    `priority` (query) applies to jobs whose spec doesn't set one.
+    `rerun_of` (query, a previous run_id): reuse the outputs of jobs that
+    succeeded there unchanged and only run failed, unfinished or changed ones.
+    """
     if not await WorkflowManager.workflow_exists(workflow_id):
         raise HTTPException(status_code=404, detail="Workflow not found")
+    if rerun_of and not await ExecutionManager.run_exists(workflow_id, rerun_of):
+        raise HTTPException(status_code=404, detail="Run to rerun not found")
 
-    result = await ExecutionManager.execute_workflow(workflow_id)
+    result = await ExecutionManager.execute_workflow(
+        workflow_id, priority.value if priority else None, rerun_of
+    )
 
     return {
         "message": "Workflow execution started",
         "workflow_id": workflow_id,
         "run_id": result["run_id"],
         "job_ids": result["job_ids"],
-    }
\ No newline at end of file
+        "rerun_of": result["rerun_of"],
+        "reused_job_ids": result["reused_job_ids"],
+    }
+
+
+@router.delete("/{workflow_id}/runs/{run_id}")
+async def delete_run(workflow_id: str, run_id: str):
+    """Delete a run and expire the artifacts its jobs wrote."""
+    deleted = await ExecutionManager.delete_run(workflow_id, run_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    return {
+        "message": "Run deleted.",
+        "workflow_id": workflow_id,
+        "run_id": run_id,
+    }
+
+
+@router.post("/{workflow_id}/runs/{run_id}/cancel")
+async def cancel_run(workflow_id: str, run_id: str):
+    """Cancel the unfinished jobs of a run (job ids grouped by outcome, see POST /jobs/<id>/cancel)."""
+    if not await ExecutionManager.run_exists(workflow_id, run_id):
+        raise HTTPException(status_code=404, detail="Run not found")
+
+    return {
+        "workflow_id": workflow_id,
+        "run_id": run_id,
+        "jobs": await CancellationManager.cancel_run(workflow_id, run_id),
+    }
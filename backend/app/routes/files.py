@@ -1,15 +1,31 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request
+from fastapi.responses import Response
+from pydantic import BaseModel
+from starlette.requests import ClientDisconnect
 from pathlib import Path
-import shutil
+from typing import Optional
+import asyncio
+import hashlib
 import uuid
-import os
+import re
+import io
+
+from PIL import Image
 
 from app.core.redis_client import redis_client
 from app.models.redis_keys import (
     user_slides_key,
     slide_key,
+    slide_preview_key,
 )
+from app.core.artifact_cache import slide_content_hash
+from app.core.file_serving import serve_file, limiter_key
+from app.core.slide_tiles import tile_server, TILE_FORMATS
+from app.core.pyramid import PYRAMID_LAYERS, DZ_TILE_SIZE, DZ_FORMAT, COMPLETE_MARKER
+from app.services.slide_manager import SlideManager
+from app.services.job_manager import JobManager
+from app.services.artifact_manager import ArtifactManager, job_dir_for
+from app.services.upload_manager import UploadManager, UploadOffsetMismatch, UploadBusy
 
 router = APIRouter(prefix="/files", tags=["Files"])
 
@@ -18,52 +34,152 @@ BASE_DIR = Path(__file__).resolve().parent.parent.parent
 STORAGE_DIR = BASE_DIR / "storage"
 UPLOAD_DIR = STORAGE_DIR / "slides"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+PART_DIR = STORAGE_DIR / "uploads"
 
 # ---------------------------------------------------------------------
 # 1) UPLOAD WHOLE-SLIDE IMAGE (.svs)
 # ---------------------------------------------------------------------
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def _write_and_hash(src, dest: Path) -> tuple[int, str]:
+    """Blocking copy + sha256 in one pass (runs in a worker thread)."""
+    h = hashlib.sha256()
+    size = 0
+    with dest.open("wb") as out:
+        while True:
+            chunk = src.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+            h.update(chunk)
+            size += len(chunk)
+    return size, h.hexdigest()
+
+
 @router.post("/upload_wsi")
 async def upload_wsi(user_id: str, file: UploadFile = File(...)):
+    """
+    Single-request upload. Fine for small slides; large slides should use the
+    resumable /files/uploads endpoints below.
+    """
     filename = file.filename.lower()
 
     if not filename.endswith(".svs"):
         raise HTTPException(400, "Only .svs files allowed")
 
-    # Read file size
-    file.file.seek(0, os.SEEK_END)
-    size = file.file.tell()
-    file.file.seek(0)
+    # copy + hash off the event loop, then dedupe into the blob store
+    PART_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = PART_DIR / f"{uuid.uuid4()}.part"
+    size, content_hash = await asyncio.to_thread(_write_and_hash, file.file, tmp_path)
 
     if size == 0:
+        await asyncio.to_thread(tmp_path.unlink)
         raise HTTPException(400, "Uploaded file is empty")
 
-    # Generate slide ID and store
-    slide_id = str(uuid.uuid4())
-    save_path = UPLOAD_DIR / f"{slide_id}.svs"
-
-    with save_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Store metadata in Redis
-    await redis_client.sadd(user_slides_key(user_id), slide_id)
-    await redis_client.hset(
-        slide_key(slide_id),
-        mapping={
-            "slide_id": slide_id,
-            "user_id": user_id,
-            "slide_path": str(save_path),
-            "size_bytes": size,
-        }
+    return await SlideManager.create_slide_from_file(
+        user_id=user_id,
+        src_path=str(tmp_path),
+        content_hash=content_hash,
+        size_bytes=size,
+        filename=file.filename,
     )
 
+
+# ---------------------------------------------------------------------
+# 1b) RESUMABLE CHUNKED UPLOAD
+#     POST   /files/uploads                      -> {upload_id, offset: 0}
+#     PUT    /files/uploads/{id}?offset=N        raw bytes, returns new offset
+#     GET    /files/uploads/{id}                 current offset (to resume)
+#     POST   /files/uploads/{id}/complete        -> slide metadata
+#     DELETE /files/uploads/{id}
+# ---------------------------------------------------------------------
+class UploadInitRequest(BaseModel):
+    user_id: str
+    filename: str
+    size_bytes: int
+    sha256: Optional[str] = None   # expected checksum, verified at complete
+
+
+class UploadCompleteRequest(BaseModel):
+    sha256: Optional[str] = None
+
+
+def _upload_status(meta: dict) -> dict:
     return {
-        "slide_id": slide_id,
-        "slide_path": str(save_path),
-        "size_bytes": size,
-        "user_id": user_id,
+        "upload_id": meta["upload_id"],
+        "user_id": meta["user_id"],
+        "filename": meta["filename"],
+        "offset": int(meta["offset"]),
+        "size_bytes": int(meta["total_bytes"]),
     }
 
 
+@router.post("/uploads")
+async def init_upload(req: UploadInitRequest):
+    if not req.filename.lower().endswith(".svs"):
+        raise HTTPException(400, "Only .svs files allowed")
+    if req.size_bytes <= 0:
+        raise HTTPException(400, "Uploaded file is empty")
+
+    meta = await UploadManager.init_upload(req.user_id, req.filename, req.size_bytes, req.sha256)
+    return _upload_status(meta)
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    meta = await UploadManager.get_upload(upload_id)
+    if not meta:
+        raise HTTPException(404, "Upload not found")
+    return _upload_status(meta)
+
+
+@router.put("/uploads/{upload_id}")
+async def upload_part(upload_id: str, offset: int, request: Request):
+    """
+    Append the raw request body at `offset`. The body is streamed, never held
+    in memory whole. On 409 the client re-reads the offset and resumes there.
+    """
+    try:
+        new_offset = await UploadManager.write_part(upload_id, offset, request.stream())
+    except UploadOffsetMismatch as e:
+        raise HTTPException(409, {"error": "Offset mismatch", "offset": e.offset})
+    except UploadBusy:
+        raise HTTPException(409, "Another part is being written for this upload")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except ClientDisconnect:
+        # bytes received so far are durable; client resumes from GET /uploads/{id}
+        return Response(status_code=499)
+
+    if new_offset is None:
+        raise HTTPException(404, "Upload not found")
+    return {"upload_id": upload_id, "offset": new_offset}
+
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, req: UploadCompleteRequest | None = None):
+    try:
+        slide = await UploadManager.complete_upload(upload_id, req.sha256 if req else None)
+    except UploadOffsetMismatch as e:
+        raise HTTPException(409, {"error": "Upload incomplete", "offset": e.offset})
+    except UploadBusy:
+        raise HTTPException(409, "A part is still being written for this upload")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+    if slide is None:
+        raise HTTPException(404, "Upload not found")
+    return slide
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    if not await UploadManager.abort_upload(upload_id):
+        raise HTTPException(404, "Upload not found")
+    return {"status": "aborted", "upload_id": upload_id}
+
+
 # ---------------------------------------------------------------------
 # 2) LIST USER SLIDES
 # ---------------------------------------------------------------------
@@ -80,46 +196,223 @@ async def list_slides(user_id: str):
     return slides
 
 
+@router.delete("/slides/{slide_id}")
+async def delete_slide(slide_id: str):
+    """Remove a slide record; the file goes away with the last slide sharing it."""
+    if not await SlideManager.delete_slide(slide_id):
+        raise HTTPException(404, "Slide not found")
+    return {"status": "deleted", "slide_id": slide_id}
+
+
 # ---------------------------------------------------------------------
 # 3) UNIVERSAL DOWNLOAD ENDPOINT — for job outputs & stored files
 # ---------------------------------------------------------------------
-@router.get("/download")
-async def download_file(path: str):
+TMP_DIR = BASE_DIR / "tmp"
+BLOB_DIR = STORAGE_DIR / "blobs"
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _resolve_download(clean: str) -> Path:
+    # only the file name is taken from the client, never a directory
+    name = Path(clean).name
+    if "storage/blobs" in clean:
+        return BLOB_DIR / name[:2] / name
+    if "storage/slides" in clean:
+        return UPLOAD_DIR / name
+    return TMP_DIR / name
+
+
+@router.api_route("/download", methods=["GET", "HEAD"])
+async def download_file(path: str, request: Request, user_id: Optional[str] = None):
     """
-    Download files generated by jobs.
-    All job outputs live under: backend/tmp/<filename>
+    Download legacy job outputs (backend/tmp/<filename>) and stored slides.
+    New job outputs are artifacts: GET /files/artifacts/<artifact_id>.
+    Supports Range / If-Range, ETag / If-None-Match and HEAD; at most
+    DOWNLOAD_MAX_PER_USER concurrent transfers per user_id (per client
+    address without one).
     """
-
     clean = path.strip('"').strip("'")
-    p = Path(clean)
-
-    BASE_DIR = Path(__file__).resolve().parent.parent.parent
-    TMP_DIR = BASE_DIR / "tmp"
-    SLIDES_DIR = BASE_DIR / "storage" / "slides"
-
-    print("\n===== DOWNLOAD DEBUG =====")
-    print("input path:", clean)
-    print("BASE_DIR:", BASE_DIR)
-    print("TMP_DIR:", TMP_DIR)
-
-    # ---------- Resolve path ----------
-    if clean.startswith("tmp/"):
-        full = TMP_DIR / p.name
-    elif "/tmp/" in clean:
-        full = TMP_DIR / p.name
-    elif "storage/slides" in clean:
-        full = SLIDES_DIR / p.name
-    else:
-        full = TMP_DIR / p.name
-
-    print("Resolved:", full)
-    print("==========================\n")
-
-    if not full.exists():
-        raise HTTPException(404, f"File not found: {full}")
-
-    return FileResponse(
+    full = _resolve_download(clean)
+
+    if not full.is_file():
+        raise HTTPException(404, f"File not found: {full.name}")
+
+    # blob names are their sha256 (+ "-<generation>"): a true content validator
+    content_hash = full.stem.split("-", 1)[0]
+    etag = f'"{content_hash}"' if _SHA256_RE.match(content_hash) else None
+
+    return serve_file(
+        request,
         full,
         filename=full.name,
-        media_type="application/octet-stream",
-    )
\ No newline at end of file
+        etag=etag,
+        user_id=limiter_key(request, user_id),
+    )
+
+
+# ---------------------------------------------------------------------
+# 3b) JOB ARTIFACTS — stable IDs returned in job outputs
+# ---------------------------------------------------------------------
+@router.api_route("/artifacts/{artifact_id}", methods=["GET", "HEAD"])
+async def download_artifact(artifact_id: str, request: Request):
+    resolved = await ArtifactManager.resolve(artifact_id)
+    if resolved is None:
+        raise HTTPException(404, "Artifact not found")
+    meta, path = resolved
+
+    if int(meta.get("is_dir") or 0):
+        raise HTTPException(400, "Artifact is a directory")
+    if not path.is_file():
+        raise HTTPException(404, "Artifact file missing")
+
+    return serve_file(
+        request,
+        path,
+        media_type=meta.get("media_type") or "application/octet-stream",
+        filename=meta["name"],
+        user_id=meta["user_id"],
+    )
+
+
+@router.get("/artifacts/{artifact_id}/meta")
+async def get_artifact(artifact_id: str):
+    meta = await ArtifactManager.get(artifact_id)
+    if meta is None:
+        raise HTTPException(404, "Artifact not found")
+    return meta
+
+
+@router.get("/user/{user_id}/artifacts/usage")
+async def get_artifact_usage(user_id: str):
+    return {"user_id": user_id, "bytes": await ArtifactManager.user_usage(user_id)}
+
+
+# ---------------------------------------------------------------------
+# 4) DEEPZOOM PYRAMID TILES — segmentation results, fetched per tile
+# ---------------------------------------------------------------------
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]+$")
+_TILE_RE = re.compile(rf"^(\d+)_(\d+)\.{DZ_FORMAT}$")
+
+# tiles are written once, when final, and never change afterwards
+_IMMUTABLE = "public, max-age=31536000, immutable"
+
+_blank_tile_png = None
+
+
+async def _pyramid_dir(job_id: str, layer: str) -> Path:
+    if not _JOB_ID_RE.match(job_id) or layer not in PYRAMID_LAYERS:
+        raise HTTPException(404, "Pyramid not found")
+    job = await JobManager.get_job(job_id)
+    if job:
+        return job_dir_for(job) / "pyramid"
+    # jobs from before the artifact store
+    return TMP_DIR / f"{job_id}_pyramid"
+
+
+def _blank_tile() -> bytes:
+    global _blank_tile_png
+    if _blank_tile_png is None:
+        buf = io.BytesIO()
+        Image.new("RGBA", (DZ_TILE_SIZE, DZ_TILE_SIZE), (0, 0, 0, 0)).save(buf, format="PNG")
+        _blank_tile_png = buf.getvalue()
+    return _blank_tile_png
+
+
+@router.get("/pyramid/{job_id}/{layer}.dzi")
+async def get_pyramid_descriptor(job_id: str, layer: str, request: Request):
+    root = await _pyramid_dir(job_id, layer)
+    dzi = root / f"{layer}.dzi"
+    if not dzi.exists():
+        raise HTTPException(404, "Pyramid not found")
+    return serve_file(request, dzi, "application/xml", cache_control=_IMMUTABLE)
+
+
+@router.get("/pyramid/{job_id}/{layer}_files/{level}/{tile}")
+async def get_pyramid_tile(job_id: str, layer: str, level: int, tile: str, request: Request):
+    """
+    Serve one DeepZoom tile by level / col_row. Viewers only fetch what is on screen.
+    While the job is still running, tiles that are not final yet return 404 (not
+    cached) so the viewer retries; once complete, missing tiles are empty space.
+    """
+    root = await _pyramid_dir(job_id, layer)
+    m = _TILE_RE.match(tile)
+    if not m or level < 0:
+        raise HTTPException(404, "Tile not found")
+
+    path = root / f"{layer}_files" / str(level) / tile
+    if path.exists():
+        return serve_file(request, path, f"image/{DZ_FORMAT}", cache_control=_IMMUTABLE)
+
+    if not (root / COMPLETE_MARKER).exists():
+        raise HTTPException(404, "Tile not ready", headers={"Cache-Control": "no-store"})
+
+    return Response(
+        content=_blank_tile(),
+        media_type=f"image/{DZ_FORMAT}",
+        headers={"Cache-Control": _IMMUTABLE, "ETag": '"blank"'},
+    )
+
+
+# ---------------------------------------------------------------------
+# 5) SLIDE VIEWER — DeepZoom tiles rendered from the uploaded WSI
+#     GET /files/slides/{id}/image.dzi?format=jpeg|webp
+#     GET /files/slides/{id}/image_files/{level}/{col}_{row}.{jpeg|webp}
+#     GET /files/slides/{id}/preview.jpg
+# ---------------------------------------------------------------------
+_SLIDE_TILE_RE = re.compile(r"^(\d+)_(\d+)\.(jpeg|webp)$")
+
+
+async def _slide_source(slide_id: str) -> tuple[str, str]:
+    """(slide_path, content_hash) for a slide, 404 if unknown."""
+    meta = await SlideManager.get_slide(slide_id)
+    if not meta or not meta.get("slide_path"):
+        raise HTTPException(404, "Slide not found")
+    content_hash = meta.get("content_hash") or await slide_content_hash(slide_id, meta["slide_path"])
+    return meta["slide_path"], content_hash
+
+
+@router.get("/slides/{slide_id}/image.dzi")
+async def get_slide_descriptor(slide_id: str, format: str = "jpeg"):
+    if format not in TILE_FORMATS:
+        raise HTTPException(400, f"format must be one of {sorted(TILE_FORMATS)}")
+    slide_path, _ = await _slide_source(slide_id)
+    return Response(
+        content=await tile_server.get_dzi(slide_path, format),
+        media_type="application/xml",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/slides/{slide_id}/image_files/{level}/{tile}")
+async def get_slide_tile(slide_id: str, level: int, tile: str, request: Request):
+    m = _SLIDE_TILE_RE.match(tile)
+    if not m or level < 0:
+        raise HTTPException(404, "Tile not found")
+    col, row, fmt = int(m.group(1)), int(m.group(2)), m.group(3)
+
+    slide_path, content_hash = await _slide_source(slide_id)
+
+    # tiles are a pure function of the slide bytes: answer revalidations without rendering
+    etag = f'"{content_hash[:16]}-{level}-{col}-{row}-{fmt}"'
+    headers = {"ETag": etag, "Cache-Control": _IMMUTABLE}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    data = await tile_server.get_tile(slide_path, content_hash, level, col, row, fmt)
+    if data is None:
+        raise HTTPException(404, "Tile not found")
+    return Response(content=data, media_type=TILE_FORMATS[fmt][1], headers=headers)
+
+
+@router.get("/slides/{slide_id}/preview.jpg")
+async def get_slide_preview(slide_id: str, request: Request):
+    slide_path, content_hash = await _slide_source(slide_id)
+
+    cached = await redis_client.get(slide_preview_key(slide_id))
+    path = Path(cached) if cached else None
+    if path is None or not path.is_file():
+        path = await tile_server.get_preview(slide_path, content_hash)
+        await redis_client.set(slide_preview_key(slide_id), str(path))
+
+    return serve_file(request, path, "image/jpeg", cache_control="public, max-age=3600",
+                      etag=f'"{content_hash[:16]}-preview"')
@@ -1,6 +1,7 @@
 import json
 from fastapi import APIRouter, HTTPException
 from app.services.job_manager import JobManager
+from app.services.cancellation_manager import CancellationManager
 from app.schemas.jobs import JobInstance
 from app.workers.registry import JOB_REGISTRY
 
@@ -36,3 +37,15 @@ async def get_job(job_id: str):
         data["output_payload"] = {}
 
     return JobInstance(**data)
+
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a job: "cancelled" if it was still queued, "cancelling" if it
+    runs (it stops at its next batch), or the status it already finished with.
+    """
+    outcome = await CancellationManager.cancel_job(job_id)
+    if outcome is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "outcome": outcome}
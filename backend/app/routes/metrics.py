@@ -0,0 +1,82 @@
+# app/routes/metrics.py
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.core import metrics
+from app.core.redis_client import redis_client
+from app.models.redis_keys import (
+    users_key,
+    user_backlog_key,
+    GLOBAL_PENDING_JOBS,
+    GLOBAL_RUNNING_JOBS,
+    ACTIVE_USERS_KEY,
+    DELAYED_JOBS_KEY,
+    DEAD_LETTER_KEY,
+)
+from app.scheduler.scheduler_main import MAX_ACTIVE_USERS
+from app.scheduler.priority import PRIORITY_ORDER
+from app.scheduler.resources import Resources
+from app.workers.transport import get_transport
+
+router = APIRouter(tags=["Metrics"])
+
+
+@metrics.registry.collector
+async def collect_scheduler_state():
+    """Refresh queue / slot / node gauges from Redis in a couple of round-trips."""
+    t0 = time.perf_counter()
+    await redis_client.ping()
+    metrics.REDIS_PING.set(time.perf_counter() - t0)
+
+    users = sorted(await redis_client.smembers(users_key()))
+    nodes = await Resources.nodes()
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(GLOBAL_PENDING_JOBS)
+    pipe.scard(GLOBAL_RUNNING_JOBS)
+    pipe.scard(ACTIVE_USERS_KEY)
+    pipe.zcard(DELAYED_JOBS_KEY)
+    pipe.zcard(DEAD_LETTER_KEY)
+    for uid in users:
+        for priority in PRIORITY_ORDER:
+            pipe.llen(user_backlog_key(uid, priority.value))
+    pending, running, active, delayed, dead_letters, *per_user = await pipe.execute()
+    stride = len(PRIORITY_ORDER)
+    node_depths = await get_transport().depths(list(nodes))
+    backlogs = [sum(per_user[i:i + stride]) for i in range(0, len(per_user), stride)]
+
+    metrics.PENDING_DEPTH.set(pending + sum(backlogs))
+    metrics.RUNNING_JOBS.set(running)
+    metrics.DELAYED_JOBS.set(delayed)
+    metrics.DEAD_LETTER_JOBS.set(dead_letters)
+    metrics.ACTIVE_USERS.set(active)
+    metrics.MAX_ACTIVE_USERS_GAUGE.set(MAX_ACTIVE_USERS)
+    live = [node for node in nodes.values() if node["alive"]]
+    slots = sum(node["workers"] for node in live)
+    metrics.SLOT_UTILIZATION.set(min(1.0, sum(node["jobs"] for node in live) / slots) if slots else 0)
+
+    # deleted users / withdrawn nodes drop out of the exposition
+    metrics.USER_BACKLOG_DEPTH.clear()
+    for uid, backlog in zip(users, backlogs):
+        metrics.USER_BACKLOG_DEPTH.set(backlog, user=uid)
+
+    metrics.NODE_CAPACITY.clear()
+    metrics.NODE_ALLOCATED.clear()
+    metrics.NODE_QUEUE_DEPTH.clear()
+    metrics.NODE_ALIVE.clear()
+    for (node_id, node), depth in zip(nodes.items(), node_depths):
+        metrics.NODE_QUEUE_DEPTH.set(depth, node=node_id)
+        metrics.NODE_ALIVE.set(1 if node["alive"] else 0, node=node_id)
+        for resource, value in node["capacity"].items():
+            metrics.NODE_CAPACITY.set(value, node=node_id, resource=resource)
+            metrics.NODE_ALLOCATED.set(node["allocated"][resource], node=node_id, resource=resource)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus text exposition (format 0.0.4)."""
+    return PlainTextResponse(
+        await metrics.registry.render(),
+        media_type=metrics.CONTENT_TYPE,
+    )
@@ -1,6 +1,7 @@
 # app/routes/scheduler.py
 import json
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
 
 from app.core.redis_client import redis_client
 from app.models.redis_keys import (
@@ -9,7 +10,11 @@ from app.models.redis_keys import (
     GLOBAL_JOB_PROGRESS,
     ACTIVE_USERS_KEY,
     GLOBAL_PENDING_JOBS,
+    DELAYED_JOBS_KEY,
 )
+from app.scheduler.fair_share import FairShare
+from app.scheduler.resources import Resources
+from app.workers.retries import Retries
 
 router = APIRouter(prefix="/scheduler", tags=["scheduler"])
 
@@ -40,6 +45,11 @@ async def get_global_status():
     running = list(await redis_client.smembers(GLOBAL_RUNNING_JOBS) or [])
     active_users = list(await redis_client.smembers(ACTIVE_USERS_KEY) or [])
     pending = await redis_client.lrange(GLOBAL_PENDING_JOBS, 0, -1)
+    # admitted but not yet dispatched, in priority / fair-share order
+    pending += await FairShare.backlog_job_ids()
+
+    # failed attempts waiting out their backoff
+    retrying = await redis_client.zrange(DELAYED_JOBS_KEY, 0, -1)
 
     raw_progress = await redis_client.hgetall(GLOBAL_JOB_PROGRESS)
 
@@ -59,5 +69,59 @@ async def get_global_status():
         "running_jobs": running,
         "active_users": active_users,
         "pending_jobs": pending,
+        "retrying_jobs": retrying,
         "progress": progress,
-    }
\ No newline at end of file
+    }
+
+
+# ------------------ FAIR SHARE ------------------
+class WeightRequest(BaseModel):
+    weight: float
+
+
+@router.get("/fair_share")
+async def get_fair_share():
+    """Class order (after aging) and per class: virtual time, pass / weight / backlog per waiting user."""
+    return await FairShare.snapshot()
+
+
+@router.put("/weights/{user_id}")
+async def set_user_weight(user_id: str, body: WeightRequest):
+    """Relative share of worker slots for a user (default 1)."""
+    if body.weight <= 0:
+        raise HTTPException(status_code=400, detail="weight must be > 0")
+    await FairShare.set_weight(user_id, body.weight)
+    return {"user_id": user_id, "weight": body.weight}
+
+
+# ------------------ NODES ------------------
+@router.get("/nodes")
+async def get_nodes():
+    """Advertised worker nodes: capacity, resources reserved by dispatched jobs, and what is free."""
+    return await Resources.nodes()
+
+
+# ------------------ DEAD-LETTER QUEUE ------------------
+@router.get("/dead_letter")
+async def get_dead_letters(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+    """Jobs that ran out of attempts, most recent first, with their last error."""
+    return {
+        "total": await Retries.count_dead_letters(),
+        "jobs": await Retries.list_dead_letters(offset, limit),
+    }
+
+
+@router.post("/dead_letter/{job_id}/replay")
+async def replay_dead_letter(job_id: str):
+    """Submit a dead-lettered job again, with a fresh set of attempts."""
+    if not await Retries.replay(job_id):
+        raise HTTPException(status_code=404, detail="Job not in the dead-letter queue")
+    return {"job_id": job_id, "status": "PENDING"}
+
+
+@router.delete("/dead_letter/{job_id}")
+async def discard_dead_letter(job_id: str):
+    """Drop a job from the dead-letter queue; it stays FAILED."""
+    if not await Retries.discard(job_id):
+        raise HTTPException(status_code=404, detail="Job not in the dead-letter queue")
+    return {"job_id": job_id, "discarded": True}
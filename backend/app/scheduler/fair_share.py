@@ -0,0 +1,312 @@
+'''
+    Weighted fair share across tenants (stride scheduling), per priority class.
+
+    Submissions still land in GLOBAL_PENDING_JOBS; the scheduler admits them
+    into one backlog list per user and priority class, and hands out free
+    worker slots class by class (scheduler/priority.py), by stride within a class:
+
+        scheduler:fair:ready:<prio>   ZSET user -> pass   (users with backlog)
+        scheduler:pending:<prio>      ZSET job -> enqueued_ts (aging)
+        scheduler:fair:pass           HASH <prio>:<user> -> pass (kept while idle)
+        scheduler:fair:vtime          HASH <prio> -> pass of the last dispatch
+        scheduler:weights             HASH user -> weight (default 1)
+
+    Every dispatch advances the user's pass by 1 / weight, and the next slot
+    goes to the lowest pass, so over time slots are shared in proportion to
+    the weights. A user joining a ready set starts at max(own pass, vtime):
+    idling doesn't bank credit, but a tenant with a few interactive jobs
+    enters at the current virtual time and is served ahead of a bulk tenant
+    whose pass has run far ahead.
+
+    A user's next job is only taken once it fits on a worker node
+    (scheduler/resources.py); until then later users of the class backfill
+    the free capacity. Backfilling stops for a job that has waited
+    BACKFILL_WAIT_SECONDS, so capacity drains toward it instead of being
+    nibbled away by small jobs forever.
+
+    Cancelled jobs are left where they are and dropped when they reach the
+    head of a list (their tombstone, services/cancellation_manager.py).
+
+    Picking is a ZRANGE over the first PICK_PAGE entries of one class (plus
+    one ZRANGE per class for aging), i.e. O(log users) per dispatch; only
+    while users are skipped (their next job doesn't fit yet, or they are
+    kept out by the MAX_ACTIVE_USERS cap) does it page further down the class.
+    Only the scheduler writes these keys.
+'''
+from typing import Iterable, Optional, Tuple
+
+from app.core.redis_client import redis_client
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    user_backlog_key,
+    fair_ready_key,
+    pending_by_priority_key,
+    FAIR_PASS_KEY,
+    FAIR_VTIME_KEY,
+    USER_WEIGHTS_KEY,
+    CANCELLED_JOBS_KEY,
+)
+from app.schemas.jobs import JobPriority
+from app.scheduler.priority import (
+    AGING_SECONDS,
+    INTERACTIVE_HOLD_SECONDS,
+    PRIORITY_ORDER,
+    RESERVED_INTERACTIVE_SLOTS,
+    base_level,
+    effective_level,
+    parse_priority,
+)
+from app.scheduler.resources import Resources
+from app.core.log import get_logger
+
+DEFAULT_WEIGHT = 1.0
+
+# a job that doesn't fit for this long stops smaller jobs from backfilling
+BACKFILL_WAIT_SECONDS = AGING_SECONDS
+
+# _pick_in_class: hold the free capacity for a starving job, dispatch nothing
+_HOLD = ()
+# ready-set entries read per ZRANGE while looking for a user who can go
+PICK_PAGE = 16
+# _try_user: pass over this user (kept out, or next job doesn't fit yet) / user left the ready set
+_SKIP = object()
+_GONE = object()
+
+# last time interactive work was seen waiting (this scheduler process)
+_interactive_seen = 0.0
+
+log = get_logger(__name__)
+
+
+def _weight(raw) -> float:
+    try:
+        weight = float(raw) if raw is not None else DEFAULT_WEIGHT
+    except ValueError:
+        weight = DEFAULT_WEIGHT
+    return weight if weight > 0 else DEFAULT_WEIGHT
+
+
+def _pass_field(priority: JobPriority, user_id: str) -> str:
+    return f"{priority.value}:{user_id}"
+
+
+class FairShare:
+    # ------------------ weights ------------------
+    @staticmethod
+    async def get_weight(user_id: str) -> float:
+        return _weight(await redis_client.hget(USER_WEIGHTS_KEY, user_id))
+
+    @staticmethod
+    async def set_weight(user_id: str, weight: float):
+        if weight <= 0:
+            raise ValueError("weight must be > 0")
+        await redis_client.hset(USER_WEIGHTS_KEY, user_id, weight)
+
+    # ------------------ admission ------------------
+    @staticmethod
+    async def admit(job_id: str) -> Optional[str]:
+        """Move a submitted job into its user's backlog. Returns the user_id."""
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hmget(job_key(job_id), ["user_id", "priority", "enqueued_ts"])
+        pipe.srem(CANCELLED_JOBS_KEY, job_id)
+        (user_id, raw_priority, enqueued_ts), cancelled = await pipe.execute()
+        if cancelled:
+            log.debug("Dropping cancelled job %s", job_id)
+            return None
+        if not user_id:
+            log.warning("Missing metadata / user_id for %s, skipping.", job_id)
+            return None
+
+        priority = parse_priority(raw_priority) or JobPriority.NORMAL
+        ready = fair_ready_key(priority.value)
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.rpush(user_backlog_key(user_id, priority.value), job_id)
+        pipe.zadd(pending_by_priority_key(priority.value), {job_id: float(enqueued_ts or metrics.now())})
+        pipe.zscore(ready, user_id)
+        pipe.hget(FAIR_PASS_KEY, _pass_field(priority, user_id))
+        pipe.hget(FAIR_VTIME_KEY, priority.value)
+        _, _, current, remembered, vtime = await pipe.execute()
+
+        if current is None:
+            start = max(float(remembered or 0), float(vtime or 0))
+            await redis_client.zadd(ready, {user_id: start}, nx=True)
+        return user_id
+
+    # ------------------ selection ------------------
+    @staticmethod
+    async def class_order() -> list:
+        """Classes with waiting work, best first: by aged level, then oldest job."""
+        return [priority for _, priority in await FairShare._ranked_classes()]
+
+    @staticmethod
+    async def _ranked_classes() -> list:
+        """(aged level, class) of the classes with waiting work, best first."""
+        pipe = redis_client.pipeline(transaction=False)
+        for priority in PRIORITY_ORDER:
+            pipe.zrange(pending_by_priority_key(priority.value), 0, 0, withscores=True)
+        oldest = await pipe.execute()
+
+        now = metrics.now()
+        ranked = []
+        for priority, head in zip(PRIORITY_ORDER, oldest):
+            if not head:
+                continue
+            wait = now - head[0][1]
+            ranked.append((effective_level(priority, wait), wait, priority))
+        ranked.sort(key=lambda r: (r[0], r[1]), reverse=True)
+        return [(level, priority) for level, _, priority in ranked]
+
+    @staticmethod
+    async def pick(free_slots: int, only: Optional[Iterable[str]] = None) -> Optional[Tuple[str, str, JobPriority, Optional[str]]]:
+        """
+        Pop the next job: best class first, then the lowest-pass user of that
+        class (among `only`, if given) whose next job fits a node.
+        Returns (user_id, job_id, priority, node_id), or None if nobody is
+        eligible. node_id is None for a job no node can ever hold; it is
+        popped all the same, for the caller to fail.
+        """
+        global _interactive_seen
+        only = set(only) if only is not None else None
+        ranked = await FairShare._ranked_classes()
+
+        now = metrics.now()
+        if any(priority == JobPriority.INTERACTIVE for _, priority in ranked):
+            _interactive_seen = now
+        top = base_level(JobPriority.INTERACTIVE)
+        reserve = free_slots <= RESERVED_INTERACTIVE_SLOTS and now - _interactive_seen < INTERACTIVE_HOLD_SECONDS
+
+        for level, priority in ranked:
+            if reserve and level < top:
+                continue
+            picked = await FairShare._pick_in_class(priority, only)
+            if picked == _HOLD:
+                return None
+            if picked is not None:
+                return picked[0], picked[1], priority, picked[2]
+        return None
+
+    @staticmethod
+    async def _pick_in_class(priority: JobPriority, only: Optional[set]):
+        ready = fair_ready_key(priority.value)
+        # users kept out and users whose next job doesn't fit now are skipped:
+        # page on down the ready set until someone can go
+        start = 0
+        while True:
+            candidates = await redis_client.zrange(ready, start, start + PICK_PAGE - 1, withscores=True)
+            if not candidates:
+                return None
+            start += len(candidates)
+            for user_id, user_pass in candidates:
+                picked = await FairShare._try_user(priority, ready, user_id, user_pass, only)
+                if picked is _SKIP:
+                    continue
+                if picked is _GONE:
+                    start -= 1   # left the ready set: the next page starts one earlier
+                    continue
+                return picked
+
+    @staticmethod
+    async def _try_user(priority: JobPriority, ready: str, user_id: str, user_pass: float, only: Optional[set]):
+        """
+        Pop `user_id`'s next job if it can go now: (user_id, job_id, node_id),
+        _HOLD, _SKIP (not in `only`, or doesn't fit yet), or _GONE (nothing
+        left; the user left the ready set).
+        """
+        if only is not None and user_id not in only:
+            return _SKIP
+
+        backlog = user_backlog_key(user_id, priority.value)
+        head = await redis_client.lindex(backlog, 0)
+        while head is not None and await redis_client.srem(CANCELLED_JOBS_KEY, head):
+            # cancelled while it waited (services/cancellation_manager.py): drop it
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.lpop(backlog)
+            pipe.zrem(pending_by_priority_key(priority.value), head)
+            pipe.lindex(backlog, 0)
+            _, _, head = await pipe.execute()
+        node_id = None
+        if head is not None:
+            node_id, placeable = await Resources.place(await Resources.requirements(head))
+            if node_id is None and placeable:
+                # fits somewhere, just not now: let the next user backfill,
+                # unless this one has waited long enough to claim the capacity
+                enqueued = await redis_client.zscore(pending_by_priority_key(priority.value), head)
+                if enqueued is not None and metrics.now() - enqueued >= BACKFILL_WAIT_SECONDS:
+                    return _HOLD
+                return _SKIP
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.lpop(backlog)
+        pipe.llen(backlog)
+        pipe.hget(USER_WEIGHTS_KEY, user_id)
+        job_id, remaining, weight = await pipe.execute()
+        new_pass = user_pass + 1.0 / _weight(weight)
+
+        pipe = redis_client.pipeline(transaction=False)
+        if remaining == 0:
+            pipe.zrem(ready, user_id)
+            pipe.hset(FAIR_PASS_KEY, _pass_field(priority, user_id), new_pass)
+        else:
+            pipe.zadd(ready, {user_id: new_pass})
+        pipe.hset(FAIR_VTIME_KEY, priority.value, user_pass)
+        if job_id is not None:
+            pipe.zrem(pending_by_priority_key(priority.value), job_id)
+        await pipe.execute()
+
+        if job_id is None:
+            return _GONE
+        return user_id, job_id, node_id
+
+    @staticmethod
+    async def has_backlog() -> bool:
+        pipe = redis_client.pipeline(transaction=False)
+        for priority in PRIORITY_ORDER:
+            pipe.zcard(fair_ready_key(priority.value))
+        return any(await pipe.execute())
+
+    # ------------------ introspection / cleanup ------------------
+    @staticmethod
+    async def snapshot():
+        """Per class: virtual time, and pass / weight / backlog of waiting users."""
+        weights = await redis_client.hgetall(USER_WEIGHTS_KEY)
+        vtimes = await redis_client.hgetall(FAIR_VTIME_KEY)
+        classes = {}
+        for priority in PRIORITY_ORDER:
+            ready = await redis_client.zrange(fair_ready_key(priority.value), 0, -1, withscores=True)
+            users = []
+            for user_id, user_pass in ready:
+                users.append({
+                    "user_id": user_id,
+                    "pass": user_pass,
+                    "weight": _weight(weights.get(user_id)),
+                    "backlog": await redis_client.llen(user_backlog_key(user_id, priority.value)),
+                })
+            classes[priority.value] = {
+                "vtime": float(vtimes.get(priority.value) or 0),
+                "pending": await redis_client.zcard(pending_by_priority_key(priority.value)),
+                "ready": users,
+            }
+        return {"order": [p.value for p in await FairShare.class_order()], "classes": classes}
+
+    @staticmethod
+    async def backlog_job_ids() -> list:
+        """Admitted, undispatched job ids: best class first, fair-share order within one."""
+        out = []
+        for priority in PRIORITY_ORDER:
+            for user_id in await redis_client.zrange(fair_ready_key(priority.value), 0, -1):
+                out += await redis_client.lrange(user_backlog_key(user_id, priority.value), 0, -1)
+        return out
+
+    @staticmethod
+    async def forget_user(user_id: str):
+        for priority in PRIORITY_ORDER:
+            backlog = user_backlog_key(user_id, priority.value)
+            job_ids = await redis_client.lrange(backlog, 0, -1)
+            if job_ids:
+                await redis_client.zrem(pending_by_priority_key(priority.value), *job_ids)
+            await redis_client.delete(backlog)
+            await redis_client.zrem(fair_ready_key(priority.value), user_id)
+            await redis_client.hdel(FAIR_PASS_KEY, _pass_field(priority, user_id))
+        await redis_client.hdel(USER_WEIGHTS_KEY, user_id)
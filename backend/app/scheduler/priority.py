@@ -0,0 +1,66 @@
+'''
+    Priority classes for dispatch.
+
+    Every job carries a JobPriority, resolved at execute time from (first set
+    wins) its job spec, the execute request, then the template default below.
+    The scheduler serves the highest class with waiting work first and, within
+    a class, tenants in fair-share order (scheduler/fair_share.py).
+
+    Aging: a class is promoted one level for every AGING_SECONDS its oldest
+    job has waited; classes at the same (aged) level go oldest job first. So
+    batch work overtakes fresh interactive work after 2 * AGING_SECONDS at
+    most and never starves.
+
+    The last RESERVED_INTERACTIVE_SLOTS worker slots are kept for interactive
+    jobs while there are any waiting, or were in the last
+    INTERACTIVE_HOLD_SECONDS: a burst of batch work can't take every slot and
+    leave a quick preview waiting behind hours of segmentation. Without
+    interactive traffic the slots are used by everyone, and a class aged up to
+    the interactive level may always use them.
+'''
+from typing import Optional
+
+from app.schemas.jobs import JobPriority
+
+# highest first; the index is the base level (inverted)
+PRIORITY_ORDER = (JobPriority.INTERACTIVE, JobPriority.NORMAL, JobPriority.BATCH)
+
+AGING_SECONDS = 120.0
+
+RESERVED_INTERACTIVE_SLOTS = 1
+# the reserve outlives the last interactive job by this much, so a user
+# clicking through previews finds the slot still free between jobs
+INTERACTIVE_HOLD_SECONDS = 30.0
+
+TEMPLATE_DEFAULT_PRIORITY = {
+    "wsi_metadata": JobPriority.INTERACTIVE,
+    "tile_segmentation": JobPriority.BATCH,
+}
+
+
+def base_level(priority: JobPriority) -> int:
+    """interactive -> 2, normal -> 1, batch -> 0."""
+    return len(PRIORITY_ORDER) - 1 - PRIORITY_ORDER.index(priority)
+
+
+def effective_level(priority: JobPriority, oldest_wait: float) -> int:
+    """Base level plus one per AGING_SECONDS waited, capped at the top level."""
+    aged = int(max(0.0, oldest_wait) // AGING_SECONDS)
+    return min(base_level(priority) + aged, len(PRIORITY_ORDER) - 1)
+
+
+def parse_priority(value) -> Optional[JobPriority]:
+    if value in (None, ""):
+        return None
+    try:
+        return JobPriority(value)
+    except ValueError:
+        return None
+
+
+def resolve_priority(template_id: str, spec_priority=None, run_priority=None) -> JobPriority:
+    return (
+        parse_priority(spec_priority)
+        or parse_priority(run_priority)
+        or TEMPLATE_DEFAULT_PRIORITY.get(template_id, JobPriority.NORMAL)
+    )
@@ -0,0 +1,190 @@
+'''
+    Resource-aware placement (bin-packing) of dispatched jobs on worker nodes.
+
+    Every job hash carries its requirements (req_cpu / req_memory_mb / req_gpu,
+    from the template declaration or estimate, see workers/registry.py). Each
+    worker node (workers/node.py, settings.NODE_*) advertises its capacity and
+    keeps a heartbeat; the scheduler reserves a job's requirements (and one
+    of the node's worker slots) on one live node when it dispatches it, and
+    the node releases them when the job ends (or takes them over when it
+    steals the job):
+
+        global:worker_usage                 HASH node_id -> JSON capacity + workers
+        scheduler:node:<node_id>:allocated  HASH cpu / memory_mb / gpu / jobs -> reserved
+        scheduler:node:<node_id>:heartbeat  STRING with TTL (alive while it exists)
+
+    Placement is best fit: of the live nodes with room for the job and a free
+    worker slot, the one left with the least free capacity, so big holes stay
+    open for big jobs (idle nodes steal the overflow). With no live node
+    nothing is placed.
+'''
+import json
+from typing import Dict, Optional, Tuple
+
+from app.core.redis_client import redis_client
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    global_worker_usage_key,
+    node_allocated_key,
+    node_heartbeat_key,
+)
+from app.workers.registry import RESOURCE_KEYS, DEFAULT_RESOURCES, JOB_RESOURCES
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+_REQ_FIELDS = [f"req_{key}" for key in RESOURCE_KEYS]
+
+
+def _float(raw) -> Optional[float]:
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def fits(req: Dict[str, float], free: Dict[str, float]) -> bool:
+    return all(req.get(key, 0.0) <= free.get(key, 0.0) + 1e-9 for key in RESOURCE_KEYS)
+
+
+def describe(req: Dict[str, float]) -> str:
+    return f"cpu={req['cpu']:g} memory_mb={req['memory_mb']:.0f} gpu={req['gpu']:g}"
+
+
+class Resources:
+    # ------------------ nodes ------------------
+    @staticmethod
+    async def advertise(node_id: str, capacity: Dict[str, float], workers: int, ttl: int):
+        """
+        Publish a node's capacity, worker count and first heartbeat. Reservations
+        start from zero: whatever a previous incarnation of the node held was recovered.
+        """
+        # heartbeat first: an advertised node without one is reaped as dead
+        await Resources.heartbeat(node_id, ttl)
+        await redis_client.delete(node_allocated_key(node_id))
+        await redis_client.hset(
+            global_worker_usage_key(), node_id, json.dumps({**capacity, "workers": workers, "updated_ts": metrics.now()})
+        )
+        log.info("Node %s advertised %s", node_id, describe(capacity))
+
+    @staticmethod
+    async def heartbeat(node_id: str, ttl: int):
+        await redis_client.set(node_heartbeat_key(node_id), metrics.now(), ex=ttl)
+
+    @staticmethod
+    async def claim(node_id: str, ttl: int) -> bool:
+        """Take the node id: False while another process heartbeats under it."""
+        return bool(await redis_client.set(node_heartbeat_key(node_id), metrics.now(), ex=ttl, nx=True))
+
+    @staticmethod
+    async def withdraw(node_id: str):
+        await redis_client.hdel(global_worker_usage_key(), node_id)
+        await redis_client.delete(node_allocated_key(node_id), node_heartbeat_key(node_id))
+
+    @staticmethod
+    async def nodes(live_only: bool = False) -> Dict[str, dict]:
+        """node_id -> {"capacity", "allocated", "free", "workers", "jobs", "alive"} for advertised nodes."""
+        advertised = await redis_client.hgetall(global_worker_usage_key())
+        node_ids = sorted(advertised)
+        pipe = redis_client.pipeline(transaction=False)
+        for node_id in node_ids:
+            pipe.hgetall(node_allocated_key(node_id))
+            pipe.exists(node_heartbeat_key(node_id))
+        replies = await pipe.execute()
+
+        out = {}
+        for node_id, alloc, alive in zip(node_ids, replies[0::2], replies[1::2]):
+            if live_only and not alive:
+                continue
+            try:
+                raw = json.loads(advertised[node_id])
+            except ValueError:
+                log.warning("Bad capacity record for node %s, ignoring it", node_id)
+                continue
+            capacity = {key: _float(raw.get(key)) or 0.0 for key in RESOURCE_KEYS}
+            # HINCRBYFLOAT drift can leave tiny negatives behind
+            allocated = {key: max(0.0, _float(alloc.get(key)) or 0.0) for key in RESOURCE_KEYS}
+            out[node_id] = {
+                "capacity": capacity,
+                "allocated": allocated,
+                "free": {key: capacity[key] - allocated[key] for key in RESOURCE_KEYS},
+                "workers": int(_float(raw.get("workers")) or 0),
+                "jobs": max(0, int(_float(alloc.get("jobs")) or 0)),
+                "updated_ts": _float(raw.get("updated_ts")),
+                "alive": bool(alive),
+            }
+        return out
+
+    # ------------------ jobs ------------------
+    @staticmethod
+    async def requirements(job_id: str) -> Dict[str, float]:
+        """A job's requirements; jobs submitted before they were recorded get the template's."""
+        template, *values = await redis_client.hmget(job_key(job_id), ["job_template_id", *_REQ_FIELDS])
+        fallback = JOB_RESOURCES.get(template, DEFAULT_RESOURCES)
+        return {
+            key: value if value is not None else fallback[key]
+            for key, value in zip(RESOURCE_KEYS, map(_float, values))
+        }
+
+    @staticmethod
+    async def place(req: Dict[str, float]) -> Tuple[Optional[str], bool]:
+        """
+        Best-fit live node for `req` right now: (node_id or None, fits_any_node).
+        fits_any_node is False when no live node could ever hold the job
+        (True while there is no live node at all: one may still join).
+        """
+        nodes = await Resources.nodes(live_only=True)
+        if not nodes:
+            return None, True
+
+        best, best_left = None, None
+        for node_id, node in nodes.items():
+            if node["jobs"] >= node["workers"] or not fits(req, node["free"]):
+                continue
+            left = sum(
+                (node["free"][key] - req[key]) / node["capacity"][key]
+                for key in RESOURCE_KEYS if node["capacity"][key] > 0
+            )
+            if best_left is None or left < best_left:
+                best, best_left = node_id, left
+        if best is not None:
+            return best, True
+        return None, any(fits(req, node["capacity"]) for node in nodes.values())
+
+    @staticmethod
+    async def free_slots() -> int:
+        """Worker slots of the live nodes not taken by a dispatched job."""
+        nodes = await Resources.nodes(live_only=True)
+        return sum(max(0, node["workers"] - node["jobs"]) for node in nodes.values())
+
+    @staticmethod
+    async def reserve(node_id: str, job_id: str, req: Dict[str, float]):
+        pipe = redis_client.pipeline(transaction=False)
+        for key in RESOURCE_KEYS:
+            if req[key]:
+                pipe.hincrbyfloat(node_allocated_key(node_id), key, req[key])
+        pipe.hincrby(node_allocated_key(node_id), "jobs", 1)
+        pipe.hset(job_key(job_id), mapping={"node_id": node_id, "node_reserved": 1})
+        await pipe.execute()
+
+    @staticmethod
+    async def release(job_id: str) -> bool:
+        """Give a finished job's reservation back (idempotent)."""
+        node_id = await redis_client.hget(job_key(job_id), "node_id")
+        if not node_id or not await redis_client.hdel(job_key(job_id), "node_reserved"):
+            return False
+        req = await Resources.requirements(job_id)
+        pipe = redis_client.pipeline(transaction=False)
+        for key in RESOURCE_KEYS:
+            if req[key]:
+                pipe.hincrbyfloat(node_allocated_key(node_id), key, -req[key])
+        pipe.hincrby(node_allocated_key(node_id), "jobs", -1)
+        await pipe.execute()
+        return True
+
+    @staticmethod
+    async def transfer(job_id: str, node_id: str):
+        """Move a queued job's reservation to `node_id` (work stealing)."""
+        await Resources.release(job_id)
+        await Resources.reserve(node_id, job_id, await Resources.requirements(job_id))
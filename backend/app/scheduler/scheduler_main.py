@@ -4,79 +4,155 @@ import asyncio
 from app.core.redis_client import redis_client
 from app.models.redis_keys import (
     GLOBAL_PENDING_JOBS,
-    user_queue_key,
+    SCHEDULER_WAKEUP,
     job_key,
     scheduler_state_key,
     ACTIVE_USERS_KEY,
 )
-from app.schemas.jobs import JobStatus  # optional if you want to use it for logging
+from app.services.job_manager import JobManager
+from app.scheduler.fair_share import FairShare
+from app.scheduler.resources import Resources, describe
+from app.workers.node import reap_dead_nodes
+from app.workers.leases import Leases
+from app.workers.transport import get_transport
+from app.workers.retries import Retries
+from app.core.config import settings
+from app.core import metrics
+from app.core.log import get_logger
 
-# Max number of distinct users that can have jobs running concurrently
-MAX_ACTIVE_USERS = 3
+log = get_logger(__name__)
+
+# Max number of distinct users that can have jobs running concurrently (0: no
+# cap); how many jobs run at once is up to the worker slots of the live nodes
+MAX_ACTIVE_USERS = settings.MAX_ACTIVE_USERS
+
+# how often the scheduler looks for dead worker nodes and expired job leases
+REAP_INTERVAL_SECONDS = 5
+
+# submissions admitted into user backlogs per scheduling round
+ADMIT_BATCH = 100
+
+
+async def _admit_pending() -> int:
+    """Drain GLOBAL_PENDING_JOBS into the per-user fair-share backlogs."""
+    admitted = 0
+    while admitted < ADMIT_BATCH:
+        job_id = await redis_client.lpop(GLOBAL_PENDING_JOBS)
+        if job_id is None:
+            break
+        if await FairShare.admit(job_id):
+            admitted += 1
+    return admitted
+
+
+async def _dispatch(user_id: str, job_id: str, priority, node_id: str):
+    """Reserve a worker slot and the job's resources on `node_id` and queue it there."""
+    t0 = metrics.now()
+    job_data = await redis_client.hgetall(job_key(job_id))
+
+    # the slot and the resources are claimed here, not when the worker picks
+    # the job up, so a second dispatch in the same round can't oversubscribe
+    # (the user counts as active from now on, for MAX_ACTIVE_USERS)
+    await redis_client.sadd(ACTIVE_USERS_KEY, user_id)
+    await Resources.reserve(node_id, job_id, await Resources.requirements(job_id))
+    dispatched_ts = await JobManager.mark_dispatched(job_id)
+    await get_transport().send(node_id, job_id)
+
+    template = job_data.get("job_template_id", "")
+    metrics.observe_between(metrics.JOB_QUEUE_WAIT, job_data, "enqueued_ts", dispatched_ts,
+                            template=template, user=user_id)
+    metrics.SCHEDULER_DISPATCHED.inc(user=user_id)
+    metrics.SCHEDULER_DISPATCH_TIME.observe(metrics.now() - t0)
+
+    log.debug("Dispatched job %s → node %s (user=%s, priority=%s)", job_id, node_id, user_id, priority.value)
+
+
+async def _reject_unplaceable(job_id: str):
+    """No advertised node is big enough for the job: fail it rather than hold the queue."""
+    req = await Resources.requirements(job_id)
+    reason = f"needs {describe(req)}, more than any worker node offers"
+    log.warning("Rejecting job %s: %s", job_id, reason)
+    await JobManager.mark_failed(job_id, reason)
+
+
+async def _dispatch_round() -> int:
+    """Fill the free worker slots in fair-share order. Returns the number of dispatches."""
+    free_slots = await Resources.free_slots()
+    active = await redis_client.smembers(ACTIVE_USERS_KEY)
+    dispatched = 0
+    while free_slots > 0:
+        # a full house of active users: only they get more slots
+        only = active if MAX_ACTIVE_USERS and len(active) >= MAX_ACTIVE_USERS else None
+        picked = await FairShare.pick(free_slots, only)
+        if picked is None:
+            break
+        user_id, job_id, priority, node_id = picked
+        if node_id is None:
+            await _reject_unplaceable(job_id)
+            continue
+        await _dispatch(user_id, job_id, priority, node_id)
+        active.add(user_id)
+        free_slots -= 1
+        dispatched += 1
+
+    # slots or node capacity taken (or held for interactive work): the rest waits for a wakeup
+    if await FairShare.has_backlog():
+        metrics.SCHEDULER_DEFERRED.inc()
+    return dispatched
 
 
 async def scheduler_loop():
     """
     Global scheduler:
 
-    - Watches GLOBAL_PENDING_JOBS (a Redis list of job_ids).
+    - Admits submissions from GLOBAL_PENDING_JOBS into per-user backlogs,
+      after moving there the retries whose backoff ended (workers/retries.py).
     - Respects `scheduler:state` (running / paused).
-    - Dispatches jobs to per-user queues (one queue per user).
-    - Enforces a global limit on number of *active users*.
+    - Hands out the free worker slots of the live nodes (NODE_WORKERS each,
+      so adding nodes adds throughput) to at most MAX_ACTIVE_USERS distinct
+      users: highest priority class first, with aging (scheduler/priority.py),
+      weighted fair share within a class (scheduler/fair_share.py), each job
+      sent (workers/transport.py) to the live worker node that fits it best
+      (scheduler/resources.py).
+    - Reaps worker nodes whose heartbeat expired (workers/node.py), jobs
+      whose lease expired and deliveries never acknowledged (workers/leases.py).
+    - Sleeps on BLPOP until a submission arrives or a worker frees a slot.
     """
-    print("[Scheduler] Loop started.")
+    log.info("Scheduler loop started.")
 
     # Ensure state key exists
     state = await redis_client.get(scheduler_state_key())
     if state is None:
         await redis_client.set(scheduler_state_key(), "paused")
 
+    next_reap = 0.0
     while True:
+        if metrics.now() >= next_reap:
+            next_reap = metrics.now() + REAP_INTERVAL_SECONDS
+            await reap_dead_nodes()
+            await Leases.reap_expired()
+            await Leases.reap_unleased(list(await Resources.nodes()))
+
         # Check scheduler state
         state = await redis_client.get(scheduler_state_key())
         if state != "running":
             await asyncio.sleep(0.5)
             continue
 
-        # Pop a pending job (blocking pop with timeout)
-        result = await redis_client.blpop(GLOBAL_PENDING_JOBS, timeout=1)
-        if not result:
-            # No pending job in the last second
-            continue
-
-        _, job_id = result
-        print(f"[Scheduler] Got pending job {job_id}")
-
-        # Load job metadata
-        job_data = await redis_client.hgetall(job_key(job_id))
-        if not job_data:
-            print(f"[Scheduler] Missing metadata for {job_id}, skipping.")
-            continue
-
-        user_id = job_data.get("user_id")
-        if not user_id:
-            print(f"[Scheduler] Missing user_id for {job_id}, skipping.")
+        await Retries.promote_due()
+        admitted = await _admit_pending()
+        dispatched = await _dispatch_round()
+        if admitted or dispatched:
             continue
 
-        # Enforce active user limit.
-        # - If user is already active, we allow more jobs for them.
-        # - If user is new and we already have MAX_ACTIVE_USERS, we re-queue the job.
-        active_user_ids = await redis_client.smembers(ACTIVE_USERS_KEY)
-        num_active = len(active_user_ids)
-
-        if user_id not in active_user_ids and num_active >= MAX_ACTIVE_USERS:
-            # Too many distinct active users → requeue the job at the tail
-            print(
-                f"[Scheduler] Active users = {num_active} (>= {MAX_ACTIVE_USERS}), "
-                f"deferring job {job_id} for user {user_id}"
-            )
-            await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
-            # brief pause to avoid tight cycles
-            await asyncio.sleep(0.2)
+        # Idle: block until a new submission or a freed slot (timeout re-checks state)
+        result = await redis_client.blpop([GLOBAL_PENDING_JOBS, SCHEDULER_WAKEUP], timeout=1)
+        if not result:
             continue
 
-        # Assign job to the user's queue
-        queue = user_queue_key(user_id)
-        await redis_client.rpush(queue, job_id)
-
-        print(f"[Scheduler] Dispatched job {job_id} → {queue} (user={user_id})")
+        key, value = result
+        if key == GLOBAL_PENDING_JOBS:
+            log.debug("Got pending job %s", value)
+            await FairShare.admit(value)
+        else:
+            await redis_client.delete(SCHEDULER_WAKEUP)
@@ -31,6 +31,14 @@ class JobStatus(str, Enum):
     RUNNING = "RUNNING"
     FAILED = "FAILED"
     SUCCESS = "SUCCESS"
+    CANCELLED = "CANCELLED"
+
+
+class JobPriority(str, Enum):
+    """Scheduling class, highest first (see scheduler/priority.py)."""
+    INTERACTIVE = "interactive"
+    NORMAL = "normal"
+    BATCH = "batch"
 
 
 class JobInstance(BaseModel):
@@ -0,0 +1,268 @@
+'''
+    Artifact store for job outputs.
+
+    Every job writes into its own run-scoped directory:
+        <ARTIFACT_DIR>/<user_id>/<workflow_id>/<run_id>/<job_id>/
+    and registers each output, getting back a stable artifact_id (derived from
+    job_id + name, so re-registering the same output keeps its id).
+
+    Redis keeps the index, so every lookup is O(1):
+        artifact:<id>                                   metadata + relative path
+        workflow:<wf>:run:<run>:artifacts              ids per run
+        workflow:<wf>:branch:<branch>:artifacts        ids per branch
+        user:<id>:artifact_bytes                       bytes stored per user
+        artifact:<id>:reused_by                        jobs of later runs reusing it
+    Deleting a run or branch expires its artifacts (files + index + usage).
+
+    A rerun carries the outputs of unchanged successful jobs over (see
+    ExecutionManager.execute_workflow): their artifacts are indexed in the new
+    run too, and when the producing run is deleted, an artifact still reused
+    is handed over (moved into the reusing job's directory) instead of deleted.
+'''
+import asyncio
+import json
+import mimetypes
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.models.redis_keys import (
+    job_key,
+    artifact_key,
+    artifact_reusers_key,
+    run_artifacts_key,
+    branch_artifacts_key,
+    user_artifact_bytes_key,
+)
+
+_ARTIFACT_NS = uuid.UUID("5b0c6a0e-8f4e-4d6c-9a59-0f1f3c7e2a61")
+
+
+def artifact_url(artifact_id: str) -> str:
+    return f"/files/artifacts/{artifact_id}"
+
+
+def job_dir_for(job: Dict[str, Any]) -> Path:
+    """Run-scoped output directory for a job hash (pure path, nothing created)."""
+    return (
+        settings.ARTIFACT_DIR
+        / job["user_id"]
+        / job["workflow_id"]
+        / job["run_id"]
+        / job["job_id"]
+    )
+
+
+def _disk_usage(path: Path) -> int:
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _remove_path(path: Path):
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+    # drop the job dir once its last output is gone
+    try:
+        path.parent.rmdir()
+    except OSError:
+        pass
+
+
+class ArtifactManager:
+    @staticmethod
+    async def job_dir(job_id: str) -> Path:
+        """Create (if needed) and return the output directory of a job."""
+        job = await redis_client.hgetall(job_key(job_id))
+        if not job:
+            raise ValueError(f"Job {job_id} not found")
+        path = job_dir_for({**job, "job_id": job_id})
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    async def register(job_id: str, path: Path, name: str | None = None,
+                       media_type: str | None = None) -> Dict[str, Any]:
+        """
+        Index a file (or directory) a job wrote into its job_dir.
+        Returns {"artifact_id", "name", "size_bytes", "url"}.
+        """
+        job = await redis_client.hgetall(job_key(job_id))
+        if not job:
+            raise ValueError(f"Job {job_id} not found")
+
+        path = Path(path)
+        name = name or path.name
+        artifact_id = uuid.uuid5(_ARTIFACT_NS, f"{job_id}/{name}").hex
+        size = await asyncio.to_thread(_disk_usage, path)
+        is_dir = path.is_dir()
+
+        key = artifact_key(artifact_id)
+        previous = await redis_client.hget(key, "size_bytes")
+
+        meta = {
+            "artifact_id": artifact_id,
+            "name": name,
+            "media_type": media_type or (
+                "" if is_dir else mimetypes.guess_type(name)[0] or "application/octet-stream"
+            ),
+            "user_id": job["user_id"],
+            "workflow_id": job["workflow_id"],
+            "run_id": job["run_id"],
+            "branch_id": job["branch_id"],
+            "job_id": job_id,
+            "rel_path": path.resolve().relative_to(settings.ARTIFACT_DIR.resolve()).as_posix(),
+            "is_dir": int(is_dir),
+            "size_bytes": size,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        await redis_client.hset(key, mapping=meta)
+        await redis_client.sadd(run_artifacts_key(job["workflow_id"], job["run_id"]), artifact_id)
+        await redis_client.sadd(branch_artifacts_key(job["workflow_id"], job["branch_id"]), artifact_id)
+        await redis_client.incrby(user_artifact_bytes_key(job["user_id"]), size - int(previous or 0))
+
+        return {
+            "artifact_id": artifact_id,
+            "name": name,
+            "size_bytes": size,
+            "url": artifact_url(artifact_id),
+        }
+
+    @staticmethod
+    async def get(artifact_id: str) -> Optional[Dict[str, Any]]:
+        meta = await redis_client.hgetall(artifact_key(artifact_id))
+        return meta if meta else None
+
+    @staticmethod
+    async def resolve(artifact_id: str) -> Optional[Tuple[Dict[str, Any], Path]]:
+        """(metadata, absolute path) of an artifact, or None if unknown."""
+        meta = await ArtifactManager.get(artifact_id)
+        if meta is None:
+            return None
+        return meta, settings.ARTIFACT_DIR / meta["rel_path"]
+
+    @staticmethod
+    async def user_usage(user_id: str) -> int:
+        return int(await redis_client.get(user_artifact_bytes_key(user_id)) or 0)
+
+    # ------------------ expiry ------------------
+    @staticmethod
+    async def delete_artifacts(artifact_ids: Iterable[str]) -> int:
+        """Remove artifacts (files, index entries, usage). Returns bytes freed."""
+        freed = 0
+        for artifact_id in artifact_ids:
+            meta = await ArtifactManager.get(artifact_id)
+            if meta is None:
+                continue
+
+            await asyncio.to_thread(_remove_path, settings.ARTIFACT_DIR / meta["rel_path"])
+
+            size = int(meta.get("size_bytes") or 0)
+            freed += size
+            await redis_client.decrby(user_artifact_bytes_key(meta["user_id"]), size)
+            await redis_client.srem(run_artifacts_key(meta["workflow_id"], meta["run_id"]), artifact_id)
+            await redis_client.srem(branch_artifacts_key(meta["workflow_id"], meta["branch_id"]), artifact_id)
+            await redis_client.delete(artifact_key(artifact_id), artifact_reusers_key(artifact_id))
+        return freed
+
+    @staticmethod
+    async def expire_run(workflow_id: str, run_id: str, user_id: str | None = None) -> int:
+        ids = await redis_client.smembers(run_artifacts_key(workflow_id, run_id))
+        owned = []
+        for artifact_id in ids:
+            meta = await ArtifactManager.get(artifact_id)
+            if meta is None:
+                continue
+            reusers = await ArtifactManager._live_reusers(artifact_id, run_id)
+            if meta["run_id"] != run_id:
+                continue   # carried over from an earlier run, which keeps it
+            if reusers:
+                await ArtifactManager._hand_over(meta, reusers[0])
+                continue
+            owned.append(artifact_id)
+        freed = await ArtifactManager.delete_artifacts(owned)
+        await redis_client.delete(run_artifacts_key(workflow_id, run_id))
+
+        # unregistered leftovers (e.g. a pyramid of a job that failed midway)
+        if user_id:
+            run_dir = settings.ARTIFACT_DIR / user_id / workflow_id / run_id
+            await asyncio.to_thread(shutil.rmtree, run_dir, True)
+        return freed
+
+    @staticmethod
+    async def expire_branch(workflow_id: str, branch_id: str) -> int:
+        ids = await redis_client.smembers(branch_artifacts_key(workflow_id, branch_id))
+        freed = await ArtifactManager.delete_artifacts(ids)
+        await redis_client.delete(branch_artifacts_key(workflow_id, branch_id))
+        return freed
+
+    # ------------------ reuse across runs ------------------
+    @staticmethod
+    async def job_artifacts(job: Dict[str, Any]) -> List[str]:
+        """Ids of the artifacts a job produced (or carried over from an earlier run)."""
+        if job.get("artifact_ids"):
+            return json.loads(job["artifact_ids"])
+        ids = sorted(await redis_client.smembers(run_artifacts_key(job["workflow_id"], job["run_id"])))
+        pipe = redis_client.pipeline(transaction=False)
+        for artifact_id in ids:
+            pipe.hget(artifact_key(artifact_id), "job_id")
+        owners = await pipe.execute()
+        return [artifact_id for artifact_id, owner in zip(ids, owners) if owner == job["job_id"]]
+
+    @staticmethod
+    async def share(artifact_ids: List[str], job_id: str):
+        """Let a job of a later run reuse artifacts: indexed in its run, kept while it exists."""
+        job = await redis_client.hgetall(job_key(job_id))
+        pipe = redis_client.pipeline(transaction=False)
+        for artifact_id in artifact_ids:
+            pipe.sadd(run_artifacts_key(job["workflow_id"], job["run_id"]), artifact_id)
+            pipe.sadd(artifact_reusers_key(artifact_id), job_id)
+        pipe.hset(job_key(job_id), "artifact_ids", json.dumps(artifact_ids))
+        await pipe.execute()
+
+    @staticmethod
+    async def _live_reusers(artifact_id: str, expiring_run_id: str) -> List[str]:
+        """Reusing jobs that still exist outside the run being expired (the others are dropped)."""
+        job_ids = sorted(await redis_client.smembers(artifact_reusers_key(artifact_id)))
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hget(job_key(job_id), "run_id")
+        live, gone = [], []
+        for job_id, run_id in zip(job_ids, await pipe.execute()):
+            (live if run_id and run_id != expiring_run_id else gone).append(job_id)
+        if gone:
+            await redis_client.srem(artifact_reusers_key(artifact_id), *gone)
+        return live
+
+    @staticmethod
+    async def _hand_over(meta: Dict[str, Any], job_id: str):
+        """Make a reusing job the owner of an artifact: move its file, re-point the index."""
+        job = await redis_client.hgetall(job_key(job_id))
+        src = settings.ARTIFACT_DIR / meta["rel_path"]
+        dest = job_dir_for({**job, "job_id": job_id}) / src.name
+
+        def move():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            if src.exists():
+                shutil.move(str(src), str(dest))
+
+        await asyncio.to_thread(move)
+        artifact_id = meta["artifact_id"]
+        await redis_client.hset(artifact_key(artifact_id), mapping={
+            "run_id": job["run_id"],
+            "branch_id": job["branch_id"],
+            "job_id": job_id,
+            "rel_path": dest.resolve().relative_to(settings.ARTIFACT_DIR.resolve()).as_posix(),
+        })
+        await redis_client.srem(branch_artifacts_key(meta["workflow_id"], meta["branch_id"]), artifact_id)
+        await redis_client.sadd(branch_artifacts_key(job["workflow_id"], job["branch_id"]), artifact_id)
+        await redis_client.srem(artifact_reusers_key(artifact_id), job_id)
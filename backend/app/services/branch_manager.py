@@ -6,6 +6,8 @@ from app.models.redis_keys import (
     workflow_branches_key,
     workflow_branch_key,
 )
+from app.services.artifact_manager import ArtifactManager
+from app.services.cancellation_manager import CancellationManager
 
 
 class BranchManager:
@@ -31,13 +33,15 @@ class BranchManager:
         branch_id: str,
         job_template_id: str,
         input_payload: Dict[str, Any] | None = None,
+        priority: str | None = None,
     ) -> bool:
         """
         Append a job spec to the branch's ordered job list.
         The job spec is stored as JSON:
             {
                 "template_id": "<job_template_id>",
-                "input_payload": { ... }
+                "input_payload": { ... },
+                "priority": "interactive" | "normal" | "batch"   (optional)
             }
 
         Returns False if branch does not exist.
@@ -52,6 +56,8 @@ class BranchManager:
             "template_id": job_template_id,
             "input_payload": input_payload or {},
         }
+        if priority:
+            job_spec["priority"] = priority
 
         await redis_client.rpush(
             workflow_branch_key(workflow_id, branch_id),
@@ -101,8 +107,9 @@ class BranchManager:
 
     @staticmethod
     async def delete_executed_jobs(workflow_id: str, branch_id: str):
-        """Delete executed job instances belonging to workflow+branch."""
+        """Delete executed job instances belonging to workflow+branch (cancel them first)."""
         keys = await redis_client.keys("job:*")
+        job_ids = []
         for k in keys:
             job_data = await redis_client.hgetall(k)
             if not job_data:
@@ -111,14 +118,17 @@ class BranchManager:
                 job_data.get("workflow_id") == workflow_id
                 and job_data.get("branch_id") == branch_id
             ):
-                await redis_client.delete(k)
+                job_ids.append(job_data.get("job_id") or k.split(":")[1])
+        await CancellationManager.delete_jobs(job_ids)
                 
     @staticmethod
     async def delete_branch(workflow_id: str, branch_id: str) -> bool:
         """
         Delete branch from a workflow
+            - cancel its queued / running jobs (their queued ids are tombstoned)
             - remove branch_id from workflow:<wf_id>:branches
             - delete its job list key
+            - expire the artifacts its jobs produced
         """
         removed = await redis_client.srem(
             workflow_branches_key(workflow_id), branch_id
@@ -126,8 +136,10 @@ class BranchManager:
         if removed == 0:
             return False
 
+        await CancellationManager.cancel_branch(workflow_id, branch_id, "branch deleted")
         await redis_client.delete(workflow_branch_key(workflow_id, branch_id))
         await BranchManager.delete_executed_jobs(workflow_id, branch_id)
+        await ArtifactManager.expire_branch(workflow_id, branch_id)
         return True
 
     @staticmethod
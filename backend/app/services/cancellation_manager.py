@@ -0,0 +1,166 @@
+'''
+    Cancelling jobs, runs and branches.
+
+    A queued job is CANCELLED right away: it leaves the retry timer wheel
+    and, wherever else its id sits (the pending list, a user backlog and the
+    aging index, a node queue), gets a tombstone
+
+        scheduler:cancelled     SET of job_ids
+
+    instead of an O(n) LREM: the scheduler and the nodes pop ids with an SREM
+    on the tombstone set and drop the ones it removes. A job already holding a
+    slot (dispatched to a node) gives back its resources and its user's slot
+    at once.
+
+    A running job is signalled instead: a tombstone, plus a message on
+    scheduler:cancel for the nodes. The node running it sets the job's
+    CancelToken (core/cancellation.py), the job stops at its next batch and
+    run_job marks it CANCELLED and frees its capacity. Nodes also check the
+    tombstones of their jobs on every heartbeat, in case they missed the
+    message.
+
+    Deleting a run or branch cancels its jobs, then deletes their hashes
+    (delete_jobs). The hash of a job still stopping is kept, flagged
+    `deleted`, until run_job has released its resources from it.
+'''
+from typing import Dict, List, Optional
+
+from redis.exceptions import WatchError
+
+from app.core.redis_client import redis_client
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    workflow_runs_key,
+    workflow_run_jobs_key,
+    DELAYED_JOBS_KEY,
+    CANCELLED_JOBS_KEY,
+    CANCEL_CHANNEL,
+)
+from app.schemas.jobs import JobStatus
+from app.scheduler.resources import Resources
+from app.services.job_manager import JobManager
+from app.workers.worker_main import release_user_slot
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+FINAL_STATUSES = (JobStatus.SUCCESS.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value)
+
+
+class CancellationManager:
+    # ------------------ jobs ------------------
+    @staticmethod
+    async def cancel_job(job_id: str, reason: str = "cancelled by user") -> Optional[str]:
+        """
+        Cancel one job. Returns "cancelled" (it was queued), "cancelling"
+        (it runs; its node stops it within a batch), the status of a job
+        that already finished, or None for an unknown job.
+        """
+        key = job_key(job_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    # a node marking it RUNNING meanwhile aborts the transaction,
+                    # so a started job's resources are never released here
+                    await pipe.watch(key)
+                    user_id, status, reserved, template = await pipe.hmget(
+                        key, ["user_id", "status", "node_reserved", "job_template_id"]
+                    )
+                    status = status.upper() if status else status
+                    if status is None or status in FINAL_STATUSES or status == JobStatus.RUNNING.value:
+                        await pipe.reset()
+                        break
+                    pipe.multi()
+                    await JobManager.mark_cancelled(job_id, reason, pipe=pipe)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        if status is None:
+            return None
+        if status in FINAL_STATUSES:
+            return status
+
+        if status == JobStatus.RUNNING.value:
+            await redis_client.sadd(CANCELLED_JOBS_KEY, job_id)
+            await redis_client.publish(CANCEL_CHANNEL, job_id)
+            # finished meanwhile: nothing would clear the tombstone
+            final = (await redis_client.hget(key, "status") or "").upper()
+            if final in FINAL_STATUSES:
+                await redis_client.srem(CANCELLED_JOBS_KEY, job_id)
+                return final
+            log.info("Cancelling running job %s: %s", job_id, reason)
+            return "cancelling"
+
+        if not await redis_client.zrem(DELAYED_JOBS_KEY, job_id):
+            # still in the pending list, a backlog (left in the aging index
+            # too, so the scheduler reaches it) or a node queue
+            await redis_client.sadd(CANCELLED_JOBS_KEY, job_id)
+
+        if reserved:
+            # dispatched but not started: its slot and node resources are free now
+            await Resources.release(job_id)
+            if user_id:
+                await release_user_slot(user_id, job_id)
+
+        metrics.JOBS_CANCELLED.inc(template=template or "", stage="queued")
+        log.info("Cancelled queued job %s: %s", job_id, reason)
+        return "cancelled"
+
+    @staticmethod
+    async def cancel_jobs(job_ids: List[str], reason: str) -> Dict[str, List[str]]:
+        """Cancel several jobs; job_ids grouped by cancel_job's outcome."""
+        out: Dict[str, List[str]] = {}
+        for job_id in job_ids:
+            outcome = await CancellationManager.cancel_job(job_id, reason)
+            if outcome is not None:
+                out.setdefault(outcome, []).append(job_id)
+        return out
+
+    @staticmethod
+    async def take_tombstone(job_id: str) -> bool:
+        """Called on popping a queued id: True (and the tombstone is gone) if the job was cancelled."""
+        return bool(await redis_client.srem(CANCELLED_JOBS_KEY, job_id))
+
+    @staticmethod
+    async def delete_jobs(job_ids: List[str]):
+        """
+        Delete the hashes of cancelled jobs. A job still running (or still
+        holding its node reservation) is only flagged `deleted`: its hash is
+        where run_job finds what to release, so run_job deletes it afterwards.
+        """
+        for job_id in job_ids:
+            key = job_key(job_id)
+            status, reserved = await redis_client.hmget(key, ["status", "node_reserved"])
+            if status is None:
+                continue
+            if status.upper() != JobStatus.RUNNING.value and not reserved:
+                await redis_client.delete(key)
+                continue
+            await redis_client.hset(key, "deleted", 1)
+            # it may have ended before seeing the flag
+            status, reserved = await redis_client.hmget(key, ["status", "node_reserved"])
+            if status is not None and status.upper() in FINAL_STATUSES and not reserved:
+                await redis_client.delete(key)
+
+    # ------------------ runs / branches ------------------
+    @staticmethod
+    async def cancel_run(workflow_id: str, run_id: str, reason: str = "run cancelled") -> Dict[str, List[str]]:
+        job_ids = await redis_client.lrange(workflow_run_jobs_key(workflow_id, run_id), 0, -1)
+        return await CancellationManager.cancel_jobs(job_ids, reason)
+
+    @staticmethod
+    async def cancel_branch(workflow_id: str, branch_id: str, reason: str = "branch cancelled") -> Dict[str, List[str]]:
+        """Cancel the jobs of a branch in every run of the workflow."""
+        job_ids = []
+        for run_id in await redis_client.smembers(workflow_runs_key(workflow_id)):
+            run_jobs = await redis_client.lrange(workflow_run_jobs_key(workflow_id, run_id), 0, -1)
+            pipe = redis_client.pipeline(transaction=False)
+            for job_id in run_jobs:
+                pipe.hget(job_key(job_id), "branch_id")
+            job_ids += [
+                job_id for job_id, branch in zip(run_jobs, await pipe.execute()) if branch == branch_id
+            ]
+        return await CancellationManager.cancel_jobs(job_ids, reason)
@@ -1,23 +1,50 @@
 import uuid
 import json
-from typing import List, Dict, Any
+import asyncio
+import hashlib
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
 
 from app.core.redis_client import redis_client
 from app.services.job_manager import JobManager
 from app.services.branch_manager import BranchManager
 from app.services.workflow_manager import WorkflowManager
+from app.services.artifact_manager import ArtifactManager
+from app.services.cancellation_manager import CancellationManager
 from app.models.redis_keys import (
     workflow_runs_key,
     workflow_run_jobs_key,
     GLOBAL_PENDING_JOBS,
     slide_key,  # Used for WSI hydration
+    job_key,
 )
+from app.schemas.jobs import JobStatus
+from app.core.log import get_logger
+from app.scheduler.priority import resolve_priority
+from app.workers.registry import JOB_ESTIMATORS, job_requirements
+from app.workers.retries import Retries
 
+log = get_logger(__name__)
+
+
+def spec_hash(template_id: str, payload: Dict[str, Any]) -> str:
+    """Identity of what a job computes: its template and (hydrated) input payload."""
+    canonical = json.dumps({"template": template_id, "payload": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
 
 
 class ExecutionManager:
     @staticmethod
-    async def execute_workflow(workflow_id: str):
+    async def execute_workflow(workflow_id: str, priority: str | None = None, rerun_of: str | None = None):
+        """
+        Instantiate every branch's job specs as a new run and submit them.
+        `priority` applies to jobs whose spec doesn't set one (see scheduler/priority.py).
+
+        With `rerun_of` (a previous run_id of the workflow), a job whose
+        template and payload hash the same as a job that succeeded in that
+        run is not submitted: the new run reuses its output and artifacts.
+        Only failed, unfinished and changed jobs run again.
+        """
         # 1) Load workflow metadata
         workflow = await WorkflowManager.get_workflow(workflow_id)
         if workflow is None:
@@ -25,11 +52,15 @@ class ExecutionManager:
 
         user_id = workflow["owner_user_id"]
 
+        # (branch_id, spec_hash) -> successful jobs of the previous run
+        reusable = await ExecutionManager._successful_jobs(workflow_id, rerun_of) if rerun_of else {}
+
         # 2) Create new run
         run_id = str(uuid.uuid4())
         await redis_client.sadd(workflow_runs_key(workflow_id), run_id)
 
         created_jobs: List[str] = []
+        reused_jobs: List[str] = []
 
         # 3) Iterate branches and process jobs
         branches = await BranchManager.list_branches(workflow_id)
@@ -43,6 +74,7 @@ class ExecutionManager:
                 try:
                     template_id = job_spec.get("template_id")
                     payload = job_spec.get("input_payload", {})
+                    job_priority = resolve_priority(template_id, job_spec.get("priority"), priority)
 
                     # Handle wsi_metadata job
                     if template_id == "wsi_metadata":
@@ -91,6 +123,23 @@ class ExecutionManager:
                         payload["min_tile_size"] = payload.get("min_tile_size", 512)
                         payload["max_tile_size"] = payload.get("max_tile_size", 1536)
 
+                    digest = spec_hash(template_id, payload)
+                    previous = reusable.get((branch_id, digest))
+                    if previous:
+                        job_id = await ExecutionManager._carry_over(
+                            previous.pop(0), user_id, workflow_id, run_id, branch_id,
+                            template_id, payload, job_priority.value, digest,
+                        )
+                        reused_jobs.append(job_id)
+                        await redis_client.rpush(workflow_run_jobs_key(workflow_id, run_id), job_id)
+                        continue
+
+                    # estimators may open the slide: keep them off the event loop
+                    if template_id in JOB_ESTIMATORS:
+                        resources = await asyncio.to_thread(job_requirements, template_id, payload)
+                    else:
+                        resources = job_requirements(template_id, payload)
+
                     # Create and queue the job
                     job_id = await JobManager.create_job_instance(
                         user_id=user_id,
@@ -99,6 +148,9 @@ class ExecutionManager:
                         branch_id=branch_id,
                         job_template_id=template_id,
                         input_payload=payload,  # Use the hydrated payload
+                        priority=job_priority.value,
+                        resources=resources,
+                        spec_hash=digest,
                     )
 
                     created_jobs.append(job_id)
@@ -106,14 +158,89 @@ class ExecutionManager:
                     await redis_client.rpush(workflow_run_jobs_key(workflow_id, run_id), job_id)
                     await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
 
-                    print(f"SUCCESS: Queued job {job_id}")
+                    log.debug("Queued job %s", job_id)
 
                 except Exception as e:
-                    print(f"ERROR: Failed to process job spec ({template_id}). Error: {e}")
+                    log.error("Failed to process job spec (%s): %s", template_id, e)
                     continue
 
+        if rerun_of:
+            log.info("Run %s reruns %s: %d job(s) submitted, %d reused",
+                     run_id, rerun_of, len(created_jobs), len(reused_jobs))
+
         return {
             "workflow_id": workflow_id,
             "run_id": run_id,
             "job_ids": created_jobs,
-        }
\ No newline at end of file
+            "rerun_of": rerun_of,
+            "reused_job_ids": reused_jobs,
+        }
+
+    @staticmethod
+    async def _successful_jobs(workflow_id: str, run_id: str) -> Dict[Tuple[str, str], List[Dict[str, Any]]]:
+        """SUCCESS jobs of a run by (branch_id, spec_hash), in run order."""
+        job_ids = await redis_client.lrange(workflow_run_jobs_key(workflow_id, run_id), 0, -1)
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hgetall(job_key(job_id))
+
+        out: Dict[Tuple[str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for job in await pipe.execute():
+            if not job or job.get("status") != JobStatus.SUCCESS.value:
+                continue
+            digest = job.get("spec_hash")
+            if not digest:
+                # submitted before spec hashes were recorded
+                try:
+                    payload = json.loads(job.get("input_payload") or "{}")
+                except ValueError:
+                    continue
+                digest = spec_hash(job.get("job_template_id", ""), payload)
+            out[(job.get("branch_id", ""), digest)].append(job)
+        return out
+
+    @staticmethod
+    async def _carry_over(source: Dict[str, Any], user_id: str, workflow_id: str, run_id: str,
+                          branch_id: str, template_id: str, payload: Dict[str, Any],
+                          priority: str, digest: str) -> str:
+        """A SUCCESS job in the new run with the output and artifacts of `source`."""
+        job_id = await JobManager.create_job_instance(
+            user_id=user_id,
+            workflow_id=workflow_id,
+            run_id=run_id,
+            branch_id=branch_id,
+            job_template_id=template_id,
+            input_payload=payload,
+            priority=priority,
+            spec_hash=digest,
+        )
+        await JobManager.mark_reused(job_id, source)
+        await ArtifactManager.share(await ArtifactManager.job_artifacts(source), job_id)
+        log.debug("Job %s reuses %s", job_id, source["job_id"])
+        return job_id
+
+    @staticmethod
+    async def run_exists(workflow_id: str, run_id: str) -> bool:
+        return bool(await redis_client.sismember(workflow_runs_key(workflow_id), run_id))
+
+    @staticmethod
+    async def delete_run(workflow_id: str, run_id: str) -> bool:
+        """
+        Delete a run: its job instances (cancelled first), its job list and
+        every artifact it produced.
+        """
+        removed = await redis_client.srem(workflow_runs_key(workflow_id), run_id)
+        if removed == 0:
+            return False
+
+        workflow = await WorkflowManager.get_workflow(workflow_id)
+        owner = workflow["owner_user_id"] if workflow else None
+
+        job_ids = await redis_client.lrange(workflow_run_jobs_key(workflow_id, run_id), 0, -1)
+        await CancellationManager.cancel_jobs(job_ids, "run deleted")
+        await CancellationManager.delete_jobs(job_ids)
+        await redis_client.delete(workflow_run_jobs_key(workflow_id, run_id))
+        await Retries.forget(job_ids)
+
+        await ArtifactManager.expire_run(workflow_id, run_id, owner)
+        return True
\ No newline at end of file
@@ -1,6 +1,9 @@
 import uuid
 import json
 from datetime import datetime
+from typing import Optional
+
+from redis.exceptions import WatchError
 
 from app.core.redis_client import redis_client
 from app.models.redis_keys import (
@@ -9,6 +12,7 @@ from app.models.redis_keys import (
     global_running_jobs_key,
 )
 from app.schemas.jobs import JobStatus
+from app.core import metrics
 
 
 class JobManager:
@@ -24,6 +28,9 @@ class JobManager:
         branch_id: str,
         job_template_id: str,
         input_payload: dict,
+        priority: str = "normal",
+        resources: dict | None = None,
+        spec_hash: str = "",
     ) -> str:
 
         job_id = str(uuid.uuid4())
@@ -40,6 +47,12 @@ class JobManager:
                 "branch_id": branch_id,
                 "job_template_id": job_template_id,
                 "user_id": user_id,
+                "priority": priority,
+                # template + hydrated payload, matched by reruns (ExecutionManager)
+                "spec_hash": spec_hash,
+
+                # requirements for node bin-packing (workers/registry.py)
+                **{f"req_{key}": value for key, value in (resources or {}).items()},
 
                 "status": JobStatus.PENDING.value,
                 "created_at": now,
@@ -47,6 +60,12 @@ class JobManager:
                 "started_at": "",
                 "finished_at": "",
 
+                # epoch seconds for latency metrics (enqueue -> dispatch -> start -> finish)
+                "enqueued_ts": metrics.now(),
+                "dispatched_ts": "",
+                "started_ts": "",
+                "finished_ts": "",
+
                 "input_payload": input_payload_str,
                 "output_payload": "",
                 "progress": 0,
@@ -159,50 +178,191 @@ class JobManager:
     # NEW: MARK RUNNING
     # ======================================================
     @staticmethod
-    async def mark_running(job_id: str):
-        now = datetime.utcnow().isoformat()
+    async def mark_dispatched(job_id: str) -> float:
+        ts = metrics.now()
+        await redis_client.hset(
+            job_key(job_id),
+            mapping={
+                "scheduled_at": datetime.utcnow().isoformat(),
+                "dispatched_ts": ts,
+            }
+        )
+        return ts
 
+    @staticmethod
+    async def mark_requeued(job_id: str, reason: str):
+        """Back to PENDING after its worker node was lost before starting it (enqueued_ts is kept)."""
         await redis_client.hset(
             job_key(job_id),
             mapping={
-                "status": JobStatus.RUNNING.value,
+                "status": JobStatus.PENDING.value,
+                "scheduled_at": "",
+                "dispatched_ts": "",
+                "progress_message": reason,
+            }
+        )
+        await redis_client.hdel(job_key(job_id), "node_id", "node_reserved")
+
+    @staticmethod
+    async def mark_retrying(job_id: str, error_message: str, retry_at: float):
+        """Back to PENDING after a failed attempt, until its backoff ends (workers/retries.py)."""
+        await redis_client.hset(
+            job_key(job_id),
+            mapping={
+                "status": JobStatus.PENDING.value,
+                "scheduled_at": "",
+                "dispatched_ts": "",
+                "started_ts": "",
+                "progress": 0,
+                "progress_message": error_message,
+                "stage": "retrying",
+                "retry_at": retry_at,
+                "last_error": error_message,
+            }
+        )
+        await redis_client.hdel(job_key(job_id), "node_id", "node_reserved")
+
+    @staticmethod
+    async def mark_replayed(job_id: str):
+        """A dead-lettered job submitted again: fresh attempts, timestamps from now."""
+        await redis_client.hset(
+            job_key(job_id),
+            mapping={
+                "status": JobStatus.PENDING.value,
+                "scheduled_at": "",
+                "started_at": "",
+                "finished_at": "",
+                "enqueued_ts": metrics.now(),
+                "dispatched_ts": "",
+                "started_ts": "",
+                "finished_ts": "",
+                "attempts": 0,
+                "progress": 0,
+                "progress_message": "replayed from the dead-letter queue",
+                "stage": "",
+                "retry_at": "",
+            }
+        )
+        await redis_client.hdel(job_key(job_id), "node_id", "node_reserved")
+
+    @staticmethod
+    async def mark_reused(job_id: str, source: dict):
+        """SUCCESS without running: the output of `source`, an identical job of an earlier run."""
+        now = datetime.utcnow().isoformat()
+        ts = metrics.now()
+        await redis_client.hset(
+            job_key(job_id),
+            mapping={
+                "status": JobStatus.SUCCESS.value,
                 "started_at": now,
-                "scheduled_at": now,   # optional: scheduler timestamp
+                "finished_at": now,
+                "started_ts": ts,
+                "finished_ts": ts,
+                "output_payload": source.get("output_payload") or json.dumps({}),
+                "progress": 100,
+                "progress_message": f"reused output of job {source['job_id']} (run {source['run_id']})",
+                "stage": "reused",
+                # the job that actually ran, through chains of reruns
+                "reused_from": source.get("reused_from") or source["job_id"],
             }
         )
 
+    @staticmethod
+    async def mark_running(job_id: str) -> Optional[float]:
+        """
+        Start a job a node took, unless it was cancelled (or deleted) since:
+        then None, and the node drops it. Conditional on the status read, so
+        a concurrent cancel_job either lands first or sees it RUNNING.
+        """
+        now = datetime.utcnow().isoformat()
+        ts = metrics.now()
+
+        key = job_key(job_id)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    status, template = await pipe.hmget(key, ["status", "job_template_id"])
+                    if template is None or (status or "").upper() == JobStatus.CANCELLED.value:
+                        await pipe.reset()
+                        return None
+                    pipe.multi()
+                    pipe.hset(
+                        key,
+                        mapping={
+                            "status": JobStatus.RUNNING.value,
+                            "started_at": now,
+                            "started_ts": ts,
+                        }
+                    )
+                    await pipe.execute()
+                    return ts
+                except WatchError:
+                    continue
+
     # ======================================================
     # NEW: MARK SUCCESS
     # ======================================================
     @staticmethod
-    async def mark_success(job_id: str, output_payload: dict | None):
+    async def mark_success(job_id: str, output_payload: dict | None) -> float:
         now = datetime.utcnow().isoformat()
+        ts = metrics.now()
 
         await redis_client.hset(
             job_key(job_id),
             mapping={
                 "status": JobStatus.SUCCESS.value,
                 "finished_at": now,
+                "finished_ts": ts,
                 "output_payload": json.dumps(output_payload or {}),
                 "progress": 100,
                 "stage": "completed",
             }
         )
+        return ts
+
+    @staticmethod
+    async def mark_cancelled(job_id: str, reason: str, pipe=None) -> float:
+        """
+        Final state of a job cancelled while queued, or interrupted while
+        running. With `pipe` (a transaction in MULTI) the write is only queued.
+        """
+        now = datetime.utcnow().isoformat()
+        ts = metrics.now()
+
+        target = pipe if pipe is not None else redis_client
+        write = target.hset(
+            job_key(job_id),
+            mapping={
+                "status": JobStatus.CANCELLED.value,
+                "finished_at": now,
+                "finished_ts": ts,
+                "progress_message": reason,
+                "stage": "cancelled",
+                "retry_at": "",
+            }
+        )
+        if pipe is None:
+            await write
+        return ts
 
     # ======================================================
     # NEW: MARK FAILED
     # ======================================================
     @staticmethod
-    async def mark_failed(job_id: str, error_message: str):
+    async def mark_failed(job_id: str, error_message: str) -> float:
         now = datetime.utcnow().isoformat()
+        ts = metrics.now()
 
         await redis_client.hset(
             job_key(job_id),
             mapping={
                 "status": JobStatus.FAILED.value,
                 "finished_at": now,
+                "finished_ts": ts,
                 "progress_message": error_message,
                 "stage": "failed",
                 "progress": 100,
             }
-        )
\ No newline at end of file
+        )
+        return ts
\ No newline at end of file
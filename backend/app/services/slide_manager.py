@@ -0,0 +1,219 @@
+'''
+    Slide records and the content-addressed blob store behind them.
+
+    Slide files are stored once per sha256 under
+    storage/blobs/<h[:2]>/<h>-<generation>.svs and indexed by blob:<hash>.
+    Every slide:<id> points at a blob and holds a reference to it; the file
+    is deleted when the last slide is removed. Re-uploading a known slide
+    never keeps a second copy.
+
+    The reference count is only changed inside WATCH/MULTI transactions, so a
+    slide is never registered on a blob that is being deleted. A blob that
+    comes back after its deletion gets a new generation, a new file name, so
+    the late unlink of the old file can't remove it. Only the server's hash of
+    bytes it received links an upload to a blob (no client-declared hashes).
+'''
+import asyncio
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from redis.exceptions import WatchError
+
+from app.core.config import BASE_DIR
+from app.core.redis_client import redis_client
+from app.models.redis_keys import (
+    user_slides_key,
+    slide_key,
+    slide_preview_key,
+    slide_blob_key,
+)
+
+BLOB_DIR = BASE_DIR / "storage" / "blobs"
+
+
+def blob_path_for(content_hash: str) -> Path:
+    """A fresh file name for a new generation of the blob."""
+    return BLOB_DIR / content_hash[:2] / f"{content_hash}-{uuid.uuid4().hex[:8]}.svs"
+
+
+def _link_into_place(src: str, dest: Path):
+    """Make `dest` a copy of `src` (a hard link when possible), leaving `src` in place."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        # other filesystem, or no hard links
+        shutil.copyfile(src, dest)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class SlideManager:
+    # ------------------ blobs ------------------
+    @staticmethod
+    async def get_blob(content_hash: str) -> Optional[Dict[str, Any]]:
+        meta = await redis_client.hgetall(slide_blob_key(content_hash))
+        return meta if meta.get("blob_path") else None
+
+    @staticmethod
+    async def _acquire_blob(content_hash: str, new_blob: Dict[str, Any] | None = None) -> Optional[Dict[str, Any]]:
+        """
+        Take a reference on the stored blob; without one, register `new_blob`
+        (holding that first reference) if given. Returns the blob that was
+        referenced, or None.
+        """
+        key = slide_blob_key(content_hash)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    blob = await pipe.hgetall(key)
+                    pipe.multi()
+                    if blob.get("blob_path"):
+                        pipe.hincrby(key, "refcount", 1)
+                    elif new_blob is not None:
+                        blob = {**new_blob, "refcount": 1}
+                        pipe.delete(key)
+                        pipe.hset(key, mapping=blob)
+                    else:
+                        await pipe.reset()
+                        return None
+                    await pipe.execute()
+                    return blob
+                except WatchError:
+                    continue   # refcount changed under us: read it again
+
+    @staticmethod
+    async def _release_blob(content_hash: str):
+        """Drop a reference; the last one deletes the blob record, then its file."""
+        key = slide_blob_key(content_hash)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    refcount, blob_path = await pipe.hmget(key, ["refcount", "blob_path"])
+                    if refcount is None:
+                        await pipe.reset()
+                        return
+                    pipe.multi()
+                    if int(refcount) > 1:
+                        pipe.hincrby(key, "refcount", -1)
+                        blob_path = None
+                    else:
+                        pipe.delete(key)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        if blob_path:
+            await asyncio.to_thread(_remove_quietly, blob_path)
+
+    # ------------------ slides ------------------
+    @staticmethod
+    async def _register_slide(user_id: str, content_hash: str, blob: Dict[str, Any],
+                              filename: str | None = None) -> Dict[str, Any]:
+        """
+        Write the slide record for a blob the caller holds a reference on.
+        `content_hash` (sha256) is computed while the upload streams in, so the
+        slide artifact cache never has to re-read the file.
+        """
+        slide_id = str(uuid.uuid4())
+        meta = {
+            "slide_id": slide_id,
+            "user_id": user_id,
+            "slide_path": blob["blob_path"],
+            "size_bytes": blob["size_bytes"],
+            "content_hash": content_hash,
+            # the blob this slide holds a reference on (legacy slides have none)
+            "blob_hash": content_hash,
+        }
+        if filename:
+            meta["filename"] = filename
+
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.hset(slide_key(slide_id), mapping=meta)
+        pipe.sadd(user_slides_key(user_id), slide_id)
+        await pipe.execute()
+        return meta
+
+    @staticmethod
+    async def create_slide_from_file(
+        user_id: str,
+        src_path: str,
+        content_hash: str,
+        size_bytes: int,
+        filename: str | None = None,
+    ) -> Dict[str, Any]:
+        """
+        Finish an upload: dedupe the file into the blob store and register the
+        slide. `src_path` is removed only once the slide is committed; on error
+        it is left for the caller to retry with.
+        """
+        blob = await SlideManager._acquire_blob(content_hash)
+        if blob is None:
+            dest = blob_path_for(content_hash)
+            await asyncio.to_thread(_link_into_place, src_path, dest)
+            blob = await SlideManager._acquire_blob(content_hash, {
+                "blob_path": str(dest),
+                "content_hash": content_hash,
+                "size_bytes": size_bytes,
+            })
+            if blob["blob_path"] != str(dest):
+                # another upload of the same content won the race
+                await asyncio.to_thread(_remove_quietly, dest)
+
+        try:
+            slide = await SlideManager._register_slide(user_id, content_hash, blob, filename)
+        except BaseException:
+            await SlideManager._release_blob(content_hash)
+            raise
+
+        await asyncio.to_thread(_remove_quietly, src_path)
+        return slide
+
+    @staticmethod
+    async def get_slide(slide_id: str) -> Optional[Dict[str, Any]]:
+        meta = await redis_client.hgetall(slide_key(slide_id))
+        return meta if meta else None
+
+    @staticmethod
+    async def delete_slide(slide_id: str) -> bool:
+        meta = await SlideManager.get_slide(slide_id)
+        if not meta:
+            return False
+
+        await redis_client.srem(user_slides_key(meta["user_id"]), slide_id)
+        await redis_client.delete(slide_key(slide_id), slide_preview_key(slide_id))
+
+        blob_hash = await SlideManager._held_blob(meta)
+        if blob_hash:
+            await SlideManager._release_blob(blob_hash)
+        elif meta.get("slide_path"):
+            # uploaded before the blob store: the file is this slide's alone
+            await asyncio.to_thread(_remove_quietly, meta["slide_path"])
+        return True
+
+    @staticmethod
+    async def _held_blob(meta: Dict[str, Any]) -> Optional[str]:
+        """
+        Hash of the blob a slide holds a reference on, if any. content_hash
+        alone doesn't tell: the artifact cache stamps it on legacy slides too.
+        """
+        if meta.get("blob_hash"):
+            return meta["blob_hash"]
+        # registered before blob_hash was recorded: its file is the blob's
+        content_hash = meta.get("content_hash")
+        if content_hash and meta.get("slide_path"):
+            blob_path = await redis_client.hget(slide_blob_key(content_hash), "blob_path")
+            if blob_path == meta["slide_path"]:
+                return content_hash
+        return None
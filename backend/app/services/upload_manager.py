@@ -0,0 +1,250 @@
+'''
+    Resumable, chunked slide uploads.
+
+    Protocol:
+        1) init      -> upload_id (Redis hash upload:<id>, empty .part file)
+        2) part(s)   -> raw bytes appended at the current offset; the offset is
+                        persisted in Redis after every flushed buffer, so a
+                        dropped connection resumes from the last durable byte
+        3) complete  -> .part deduplicated into the blob store, slide:<id> created
+
+    A sha256 passed at init (or complete) is only an expected checksum: the
+    upload is checked against it, and linked to a stored blob only by the hash
+    of the bytes actually received, so knowing a hash never grants its content.
+
+    Disk writes and hashing run in worker threads (asyncio.to_thread), so a
+    multi-GB upload never blocks the event loop (scheduler, workers, API).
+    The sha256 is updated while bytes stream in; after a restart it is rebuilt
+    once from the bytes already on disk. That in-process state is dropped with
+    the session: on complete / abort, on the first request to find it expired
+    (UPLOAD_TTL_SECONDS), and for idle expired sessions at every new upload.
+'''
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from app.core.config import BASE_DIR
+from app.core.redis_client import redis_client
+from app.models.redis_keys import upload_key
+from app.services.slide_manager import SlideManager
+
+UPLOAD_DIR = BASE_DIR / "storage" / "uploads"
+
+# unfinished uploads are forgotten after a day without progress
+UPLOAD_TTL_SECONDS = 24 * 3600
+
+# bytes buffered before a (threaded) disk write + offset checkpoint
+WRITE_BUFFER_BYTES = 8 * 1024 * 1024
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# in-process streaming hash state: upload_id -> (sha256, hashed_offset)
+_hashers: Dict[str, Tuple["hashlib._Hash", int]] = {}
+_locks: Dict[str, asyncio.Lock] = {}
+
+
+class UploadOffsetMismatch(Exception):
+    def __init__(self, offset: int):
+        super().__init__(f"expected offset {offset}")
+        self.offset = offset
+
+
+class UploadBusy(Exception):
+    pass
+
+
+# ------------------ blocking helpers (run in threads) ------------------
+def _prepare_part(path, offset: int, cached):
+    """Drop any bytes past the durable offset and return a hasher positioned at it."""
+    with open(path, "r+b") as f:
+        f.truncate(offset)
+
+    if cached is not None and cached[1] == offset:
+        return cached[0]
+
+    # no live hash state (e.g. process restarted): rebuild from disk once
+    h = hashlib.sha256()
+    remaining = offset
+    with open(path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(min(HASH_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            h.update(chunk)
+            remaining -= len(chunk)
+    return h
+
+
+def _append(path, offset: int, data: bytes, hasher):
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    hasher.update(data)
+
+
+def _forget(upload_id: str):
+    _hashers.pop(upload_id, None)
+    _locks.pop(upload_id, None)
+
+
+async def _forget_expired():
+    """Drop in-process state (and the .part file) of uploads whose session expired."""
+    idle = [uid for uid in set(_hashers) | set(_locks) if not (uid in _locks and _locks[uid].locked())]
+    if not idle:
+        return
+    pipe = redis_client.pipeline(transaction=False)
+    for uid in idle:
+        pipe.exists(upload_key(uid))
+    for uid, alive in zip(idle, await pipe.execute()):
+        if not alive:
+            _forget(uid)
+            await asyncio.to_thread(_remove_quietly, UPLOAD_DIR / f"{uid}.part")
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadManager:
+    @staticmethod
+    async def init_upload(user_id: str, filename: str, total_bytes: int, sha256: str | None = None) -> Dict:
+        """Start an upload. `sha256`, if given, is verified at complete."""
+        await _forget_expired()
+
+        upload_id = str(uuid.uuid4())
+        part_path = UPLOAD_DIR / f"{upload_id}.part"
+
+        UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(part_path.touch)
+
+        meta = {
+            "upload_id": upload_id,
+            "user_id": user_id,
+            "filename": filename,
+            "total_bytes": total_bytes,
+            "offset": 0,
+            "part_path": str(part_path),
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        if sha256:
+            meta["sha256"] = sha256.lower()
+        await redis_client.hset(upload_key(upload_id), mapping=meta)
+        await redis_client.expire(upload_key(upload_id), UPLOAD_TTL_SECONDS)
+        return meta
+
+    @staticmethod
+    async def get_upload(upload_id: str) -> Optional[Dict[str, str]]:
+        meta = await redis_client.hgetall(upload_key(upload_id))
+        return meta if meta else None
+
+    @staticmethod
+    async def write_part(upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> Optional[int]:
+        """
+        Append a part starting at `offset` (must equal the durable offset).
+        Returns the new offset, or None if the upload does not exist.
+        Raises UploadOffsetMismatch / UploadBusy / ValueError.
+        """
+        meta = await UploadManager.get_upload(upload_id)
+        if not meta:
+            _forget(upload_id)
+            return None
+
+        lock = _locks.setdefault(upload_id, asyncio.Lock())
+        if lock.locked():
+            raise UploadBusy()
+
+        async with lock:
+            current = int(meta["offset"])
+            total = int(meta["total_bytes"])
+            part_path = meta["part_path"]
+            if offset != current:
+                raise UploadOffsetMismatch(current)
+
+            hasher = await asyncio.to_thread(_prepare_part, part_path, current, _hashers.get(upload_id))
+            _hashers[upload_id] = (hasher, current)
+
+            async def flush(data: bytes) -> int:
+                nonlocal current
+                if current + len(data) > total:
+                    raise ValueError("Upload exceeds declared size")
+                await asyncio.to_thread(_append, part_path, current, data, hasher)
+                current += len(data)
+                _hashers[upload_id] = (hasher, current)
+                await redis_client.hset(upload_key(upload_id), "offset", current)
+                await redis_client.expire(upload_key(upload_id), UPLOAD_TTL_SECONDS)
+                return current
+
+            buf = bytearray()
+            try:
+                async for chunk in chunks:
+                    buf += chunk
+                    if len(buf) >= WRITE_BUFFER_BYTES:
+                        await flush(bytes(buf))
+                        buf.clear()
+            finally:
+                # keep whatever arrived before a disconnect, so the client resumes from there
+                if buf and current + len(buf) <= total:
+                    await flush(bytes(buf))
+
+            return current
+
+    @staticmethod
+    async def complete_upload(upload_id: str, expected_sha256: str | None = None) -> Optional[Dict]:
+        """
+        Finalize an upload into a slide (no copy for content that is already
+        stored). Returns the slide metadata, or None if the upload does not
+        exist. Raises UploadOffsetMismatch if bytes are missing, ValueError on
+        checksum mismatch.
+        """
+        meta = await UploadManager.get_upload(upload_id)
+        if not meta:
+            _forget(upload_id)
+            return None
+
+        lock = _locks.setdefault(upload_id, asyncio.Lock())
+        if lock.locked():
+            raise UploadBusy()
+
+        async with lock:
+            offset = int(meta["offset"])
+            total = int(meta["total_bytes"])
+            if offset != total:
+                raise UploadOffsetMismatch(offset)
+
+            part_path = meta["part_path"]
+            hasher = await asyncio.to_thread(_prepare_part, part_path, offset, _hashers.get(upload_id))
+            content_hash = hasher.hexdigest()
+            for expected in (meta.get("sha256"), expected_sha256):
+                if expected and expected.lower() != content_hash:
+                    raise ValueError("Checksum mismatch")
+
+            slide = await SlideManager.create_slide_from_file(
+                user_id=meta["user_id"],
+                src_path=part_path,
+                content_hash=content_hash,
+                size_bytes=total,
+                filename=meta["filename"],
+            )
+            await redis_client.delete(upload_key(upload_id))
+
+        _forget(upload_id)
+        return slide
+
+    @staticmethod
+    async def abort_upload(upload_id: str) -> bool:
+        meta = await UploadManager.get_upload(upload_id)
+        if not meta:
+            _forget(upload_id)
+            return False
+
+        await redis_client.delete(upload_key(upload_id))
+        _forget(upload_id)
+        await asyncio.to_thread(_remove_quietly, meta["part_path"])
+        return True
@@ -3,11 +3,14 @@ from app.models.redis_keys import (
     users_key,
     user_key,
     active_users_key,
-    user_queue_key,
-    user_running_jobs_key
+    user_running_jobs_key,
+    user_slides_key,
+    user_artifact_bytes_key,
 )
 from app.services.workflow_manager import WorkflowManager
 from app.services.branch_manager import BranchManager
+from app.services.slide_manager import SlideManager
+from app.scheduler.fair_share import FairShare
 
 class UserManager:
     @staticmethod
@@ -44,8 +47,8 @@ class UserManager:
             # 2b. Delete workflow metadata
             await WorkflowManager.delete_workflow(wf_id)
 
-        # 3. Delete user's job execution queue
-        await redis_client.delete(user_queue_key(user_id))
+        # 3. Delete user's fair-share backlog / weight
+        await FairShare.forget_user(user_id)
 
         # 4. Delete user's executed job instances (optional safety)
         # NOTE: If you used job:<id> format and want per-user job cleanup:
@@ -53,6 +56,11 @@ class UserManager:
         async for key in redis_client.scan_iter(pattern):
             await redis_client.delete(key)
 
+        # 4b. Drop the user's slides (shared slide files stay while referenced)
+        for slide_id in await redis_client.smembers(user_slides_key(user_id)):
+            await SlideManager.delete_slide(slide_id)
+        await redis_client.delete(user_slides_key(user_id))
+
         # 5. Remove user from global user sets
         await redis_client.srem(users_key(), user_id)
         await redis_client.srem(active_users_key(), user_id)
@@ -60,6 +68,7 @@ class UserManager:
         # 6. Remove user metadata & counters
         await redis_client.delete(user_key(user_id))
         await redis_client.delete(user_running_jobs_key(user_id))
+        await redis_client.delete(user_artifact_bytes_key(user_id))
 
         return True
         
@@ -13,8 +13,10 @@ from app.models.redis_keys import (
     workflows_key,
     workflow_key,
     workflow_branches_key,
-    workflow_branch_key
+    workflow_branch_key,
+    workflow_runs_key,
 )
+from app.services.artifact_manager import ArtifactManager
 
 
 class WorkflowManager:
@@ -66,13 +68,18 @@ class WorkflowManager:
     @staticmethod
     async def delete_workflow(workflow_id: str) -> bool:
         """
-        Delete a workflow and its metadata.
-        TODO: also clean up branches / runs / job instances later.
+        Delete a workflow and its metadata, expiring the artifacts of its runs.
+        TODO: also clean up branches / job instances later.
         """
+        owner = await redis_client.hget(workflow_key(workflow_id), "owner_user_id")
         removed = await redis_client.srem(workflows_key(), workflow_id)
         if removed == 0:
             return False
 
+        # outputs of every run go with the workflow
+        for run_id in await redis_client.smembers(workflow_runs_key(workflow_id)):
+            await ArtifactManager.expire_run(workflow_id, run_id, owner)
+
         await redis_client.delete(workflow_key(workflow_id))
         await redis_client.delete(workflow_branches_key(workflow_id))
         # Note: clean up branch keys separately if needed
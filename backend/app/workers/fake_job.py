@@ -5,7 +5,7 @@ import asyncio
 from app.workers.registry import register_job
 from app.services.job_manager import JobManager
 
-@register_job("fake_sleep")
+@register_job("fake_sleep", cpu=0.1, memory_mb=16)
 async def fake_sleep_job(job_id: str, input_payload: dict):
     """
     Demo job that runs 5 seconds total, updating progress every 1 second.
@@ -0,0 +1,155 @@
+'''
+    Job leases: at-least-once execution across worker crashes.
+
+    A node executor takes a job from its transport (workers/transport.py) in
+    a way that keeps it in Redis until acknowledged (the processing list, or
+    the stream's pending entries), so the job id is never only in the
+    executor's memory, and then holds a lease on it:
+
+        scheduler:leases    ZSET job_id -> lease expiry
+        job:<id>:data       lease_node / lease_source / lease_token: the delivery
+
+    The node's heartbeat renews the leases of the jobs it runs; acknowledging
+    a job (finished, either way) drops the lease and the delivery. The
+    scheduler reaps expired leases, and deliveries the transport reports as
+    unacknowledged for a lease period without a lease (taken by an executor
+    that died before leasing): the job's resources, running-set entry and
+    user slot are released, and the job is resubmitted, or failed once it
+    has been leased MAX_ATTEMPTS times (and dead-lettered, workers/retries.py).
+    A crash therefore costs one lease period, never a worker slot for good.
+'''
+from typing import List
+
+from app.core.redis_client import redis_client
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    JOB_LEASES_KEY,
+    GLOBAL_PENDING_JOBS,
+    CANCELLED_JOBS_KEY,
+    GLOBAL_RUNNING_JOBS,
+)
+from app.schemas.jobs import JobStatus
+from app.scheduler.resources import Resources
+from app.services.job_manager import JobManager
+from app.workers.worker_main import release_user_slot
+from app.workers.retries import Retries
+from app.workers.transport import Delivery, get_transport
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+# well above the node heartbeat period: a couple of missed beats don't expire a lease
+LEASE_SECONDS = 30
+# leases (= execution attempts) a job gets before it is failed
+MAX_ATTEMPTS = 3
+
+# jobs inspected per reap
+REAP_BATCH = 100
+
+
+class Leases:
+    @staticmethod
+    async def acquire(node_id: str, delivery: Delivery):
+        """Start a lease on a job the node just took from its transport."""
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zadd(JOB_LEASES_KEY, {delivery.job_id: metrics.now() + LEASE_SECONDS})
+        pipe.hset(job_key(delivery.job_id), mapping={
+            "lease_node": node_id,
+            "lease_source": delivery.source,
+            "lease_token": delivery.token,
+        })
+        pipe.hincrby(job_key(delivery.job_id), "attempts", 1)
+        await pipe.execute()
+
+    @staticmethod
+    async def renew(job_ids: List[str]) -> int:
+        """Extend the leases of the jobs a node is running (from its heartbeat)."""
+        if not job_ids:
+            return 0
+        expiry = metrics.now() + LEASE_SECONDS
+        # XX: a lease the reaper already took back stays gone
+        await redis_client.zadd(JOB_LEASES_KEY, {job_id: expiry for job_id in job_ids}, xx=True)
+        return len(job_ids)
+
+    @staticmethod
+    async def ack(delivery: Delivery):
+        await get_transport().ack(delivery)
+        if not await redis_client.zrem(JOB_LEASES_KEY, delivery.job_id):
+            log.warning("Lease on %s was reaped before it finished; the job may run twice", delivery.job_id)
+
+    @staticmethod
+    async def recover(node_id: str, delivery: Delivery, reason: str) -> str:
+        """
+        Take a job back from a node that lost it: resubmit it, or fail it
+        after MAX_ATTEMPTS. Returns "requeued", "failed", "cancelled" (it was
+        cancelled while it ran) or "finished" (the job completed but wasn't
+        acknowledged).
+        """
+        job_id = delivery.job_id
+        await get_transport().ack(delivery)
+        await redis_client.zrem(JOB_LEASES_KEY, job_id)
+
+        user_id, status, attempts = await redis_client.hmget(
+            job_key(job_id), ["user_id", "status", "attempts"]
+        )
+        await redis_client.srem(GLOBAL_RUNNING_JOBS, job_id)
+        await Resources.release(job_id)
+
+        if status in (JobStatus.SUCCESS.value, JobStatus.FAILED.value, JobStatus.CANCELLED.value):
+            outcome = "finished"
+            await redis_client.srem(CANCELLED_JOBS_KEY, job_id)
+        elif await redis_client.srem(CANCELLED_JOBS_KEY, job_id):
+            outcome = "cancelled"
+            await JobManager.mark_cancelled(job_id, f"cancelled; {reason}")
+        elif int(attempts or 0) >= MAX_ATTEMPTS:
+            outcome = "failed"
+            await JobManager.mark_failed(job_id, f"{reason} (gave up after {MAX_ATTEMPTS} attempts)")
+            await Retries.dead_letter(job_id)
+        else:
+            outcome = "requeued"
+            await JobManager.mark_requeued(job_id, f"{reason}, requeued")
+            await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
+
+        if user_id:
+            await release_user_slot(user_id, job_id)
+        metrics.LEASES_RECOVERED.inc(outcome=outcome)
+        log.warning("Recovered job %s from node %s (%s): %s", job_id, node_id, reason, outcome)
+        return outcome
+
+    @staticmethod
+    async def reap_expired() -> int:
+        """Recover every job whose lease ran out (called by the scheduler)."""
+        expired = await redis_client.zrangebyscore(
+            JOB_LEASES_KEY, "-inf", metrics.now(), start=0, num=REAP_BATCH
+        )
+        for job_id in expired:
+            # ZREM decides the race with a late ack (or another reaper)
+            if not await redis_client.zrem(JOB_LEASES_KEY, job_id):
+                continue
+            node_id, source, token = await redis_client.hmget(
+                job_key(job_id), ["lease_node", "lease_source", "lease_token"]
+            )
+            delivery = Delivery(job_id, source or "", token or job_id)
+            await Leases.recover(node_id or "", delivery, f"lease expired on node {node_id}")
+        return len(expired)
+
+    @staticmethod
+    async def reap_unleased(node_ids: List[str]) -> int:
+        """Recover deliveries left unacknowledged for a lease period by executors that never leased them."""
+        recovered = 0
+        for delivery in await get_transport().reclaim(node_ids, LEASE_SECONDS):
+            if await redis_client.zscore(JOB_LEASES_KEY, delivery.job_id) is not None:
+                continue   # a long job under a live lease: its ack settles the entry
+            node_id = await redis_client.hget(job_key(delivery.job_id), "node_id")
+            await Leases.recover(node_id or "", delivery, "delivery never acknowledged")
+            recovered += 1
+        return recovered
+
+    @staticmethod
+    async def recover_node(node_id: str, node_ids: List[str], reason: str) -> int:
+        """Recover everything a node that is gone still held (`node_ids`: nodes it may have stolen from)."""
+        held = await get_transport().held(node_id, node_ids)
+        for delivery in held:
+            await Leases.recover(node_id, delivery, reason)
+        return len(held)
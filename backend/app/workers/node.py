@@ -0,0 +1,353 @@
+'''
+    Worker node: runs the jobs the scheduler dispatches to it.
+
+    A node advertises its capacity (scheduler/resources.py), refreshes a
+    heartbeat every HEARTBEAT_SECONDS and runs NODE_WORKERS executors on the
+    jobs dispatched to it through the job transport (workers/transport.py),
+    each under a lease (workers/leases.py). One fetcher reads as many jobs as
+    there are idle executors in a single round-trip; with nothing queued
+    locally it steals the next job queued on the busiest live node if it fits
+    here, so work the scheduler packed onto one node spreads over idle ones.
+
+    The API process runs one node itself (settings.RUN_LOCAL_NODE); more
+    machines join with:
+        NODE_ID=gpu-1 NODE_GPUS=1 python -m app.workers.node
+    and serve their metrics on settings.NODE_METRICS_PORT (core/metrics.py).
+
+    A node id is held by one process at a time: a node won't start while the
+    heartbeat of its id is fresh, so it can't reap the jobs of a live node.
+
+    Cancelled jobs (services/cancellation_manager.py) are dropped when a
+    node takes them; running ones are interrupted through their CancelToken
+    (core/cancellation.py) when the cancel message arrives, or at the next
+    heartbeat, which checks the tombstones of the jobs it runs.
+
+    A node that stops heartbeating is reaped by the scheduler (reap_node):
+    jobs still queued on it go back to the scheduler, jobs it held leases on
+    are recovered, and its capacity is withdrawn.
+'''
+import asyncio
+from typing import List, Optional
+
+from app.core.redis_client import redis_client
+from app.core.config import settings
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    global_worker_usage_key,
+    GLOBAL_PENDING_JOBS,
+    CANCELLED_JOBS_KEY,
+    CANCEL_CHANNEL,
+    SCHEDULER_WAKEUP,
+)
+from app.scheduler.resources import Resources, fits
+from app.services.job_manager import JobManager
+from app.services.cancellation_manager import CancellationManager
+from app.workers.worker_main import run_job, release_user_slot
+from app.workers.leases import Leases
+from app.workers.transport import Delivery, get_transport
+from app.core.cancellation import cancel_local
+from app.core.log import get_logger, log_context
+
+log = get_logger(__name__)
+
+HEARTBEAT_SECONDS = 5
+# a node is dead once its heartbeat is this old
+NODE_TTL_SECONDS = 15
+# fetcher wait on an empty queue before looking for work to steal again
+IDLE_WAIT_SECONDS = 1
+# longest a stopping node waits for its tasks to unwind before leaving anyway
+SHUTDOWN_SECONDS = 5
+
+
+def local_capacity() -> dict:
+    return {"cpu": settings.NODE_CPUS, "memory_mb": settings.NODE_MEMORY_MB, "gpu": float(settings.NODE_GPUS)}
+
+
+class WorkerNode:
+    def __init__(self, node_id: str = None, capacity: dict = None, workers: int = None):
+        self.node_id = node_id or settings.NODE_ID
+        self.capacity = capacity or local_capacity()
+        self.workers = workers or settings.NODE_WORKERS
+        self.transport = get_transport()
+        self._inbox: asyncio.Queue = asyncio.Queue()
+        # executors free to take a job: what the fetcher may read at once
+        self._idle = asyncio.Semaphore(self.workers)
+        # jobs being run here, whose leases the heartbeat renews
+        self._running = set()
+
+    async def run(self):
+        """Join the cluster and execute jobs until cancelled, then leave it."""
+        await self._claim_id()
+        # a previous incarnation of this node_id left jobs behind: recover them first
+        await reap_node(self.node_id, "restarted")
+        await self.transport.open(self.node_id)
+        await Resources.advertise(self.node_id, self.capacity, self.workers, NODE_TTL_SECONDS)
+        log.info("Node %s started with %d workers (%s transport)", self.node_id, self.workers, self.transport.name)
+
+        tasks = [asyncio.create_task(self._heartbeat()), asyncio.create_task(self._fetcher()),
+                 asyncio.create_task(self._cancel_listener())]
+        tasks += [asyncio.create_task(self._executor()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            stuck = await stop_tasks(tasks, SHUTDOWN_SECONDS)
+            if stuck:
+                log.warning("Node %s: %d task(s) did not stop within %ds", self.node_id, len(stuck), SHUTDOWN_SECONDS)
+            await Resources.withdraw(self.node_id)
+            log.info("Node %s stopped", self.node_id)
+
+    # ------------------ liveness ------------------
+    async def _claim_id(self):
+        """
+        Wait out the heartbeat of a previous incarnation (at most one TTL);
+        refuse to start if another live process keeps it fresh.
+        """
+        deadline = metrics.now() + NODE_TTL_SECONDS + HEARTBEAT_SECONDS
+        while not await Resources.claim(self.node_id, NODE_TTL_SECONDS):
+            if metrics.now() >= deadline:
+                raise RuntimeError(f"Node id {self.node_id} is in use by a live node")
+            log.info("Node id %s still has a live heartbeat, waiting for it to expire", self.node_id)
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            try:
+                if not await redis_client.hexists(global_worker_usage_key(), self.node_id):
+                    # reaped while stalled (or Redis was flushed): join again
+                    log.warning("Node %s was dropped from the cluster, re-advertising", self.node_id)
+                    await Resources.advertise(self.node_id, self.capacity, self.workers, NODE_TTL_SECONDS)
+                else:
+                    await Resources.heartbeat(self.node_id, NODE_TTL_SECONDS)
+                await Leases.renew(list(self._running))
+                await self._cancel_tombstoned()
+            except Exception as exc:
+                log.error("Heartbeat of node %s failed: %s", self.node_id, exc)
+
+    # ------------------ cancellation ------------------
+    async def _cancel_listener(self):
+        """Interrupt running jobs cancelled on CANCEL_CHANNEL."""
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(CANCEL_CHANNEL)
+                while True:
+                    message = await pubsub.get_message(timeout=IDLE_WAIT_SECONDS)
+                    if message and message["data"] in self._running:
+                        cancel_local(message["data"], "cancelled while running")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # the heartbeat still finds cancelled jobs through their tombstones
+                log.error("Cancel listener of node %s failed: %s", self.node_id, exc)
+                await asyncio.sleep(IDLE_WAIT_SECONDS)
+            finally:
+                await pubsub.aclose()
+
+    async def _cancel_tombstoned(self):
+        """Interrupt running jobs with a tombstone (a cancel message this node missed)."""
+        running = list(self._running)
+        if not running:
+            return
+        flags = await redis_client.smismember(CANCELLED_JOBS_KEY, running)
+        for job_id, cancelled in zip(running, flags):
+            if cancelled:
+                cancel_local(job_id, "cancelled while running")
+
+    # ------------------ execution ------------------
+    async def _fetcher(self):
+        while True:
+            try:
+                await self._fetch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # a Redis hiccup must not take the node down; leases cover what it held
+                log.error("Fetcher on node %s failed: %s", self.node_id, exc)
+                await asyncio.sleep(IDLE_WAIT_SECONDS)
+
+    async def _fetch(self):
+        """Read one job per idle executor in one round-trip (at least one: waits for an idle executor)."""
+        await self._idle.acquire()
+        wanted = 1
+        while wanted < self.workers and not self._idle.locked():
+            await self._idle.acquire()   # doesn't block
+            wanted += 1
+
+        deliveries: List[Delivery] = []
+        try:
+            deliveries = await self.transport.receive(self.node_id, wanted, 0)
+            if not deliveries:
+                stolen = await self._steal()
+                deliveries = [stolen] if stolen else await self.transport.receive(
+                    self.node_id, wanted, IDLE_WAIT_SECONDS
+                )
+        finally:
+            for delivery in deliveries:
+                self._inbox.put_nowait(delivery)
+            for _ in range(wanted - len(deliveries)):
+                self._idle.release()
+
+    async def _executor(self):
+        while True:
+            delivery = await self._inbox.get()
+            try:
+                await self._execute(delivery)
+            except Exception as exc:
+                log.error("Executor on node %s failed on job %s: %s", self.node_id, delivery.job_id, exc)
+            finally:
+                self._idle.release()
+
+    async def _execute(self, delivery: Delivery):
+        job_id = delivery.job_id
+        if await CancellationManager.take_tombstone(job_id):
+            # cancelled after dispatch: its resources and slot are already free
+            log.debug("Dropping cancelled job %s (node=%s)", job_id, self.node_id)
+            await self.transport.ack(delivery)
+            return
+        # read before leasing: the lease fields would recreate a deleted job's hash
+        job_data = await redis_client.hgetall(job_key(job_id))
+        user_id = job_data.get("user_id")
+        if not job_data.get("job_template_id"):
+            # nothing to run, but the dispatch took resources and a slot: give
+            # back what the hash still records (it wakes the scheduler too)
+            log.warning("Missing job data for %s (node=%s)", job_id, self.node_id)
+            await Resources.release(job_id)
+            if user_id:
+                await release_user_slot(user_id, job_id)
+            else:
+                await redis_client.rpush(SCHEDULER_WAKEUP, job_id)
+            await self.transport.ack(delivery)
+            return
+
+        await Leases.acquire(self.node_id, delivery)
+        started_ts = await JobManager.mark_running(job_id)
+        if started_ts is None:
+            # cancelled after the tombstone check (cancel_job released its
+            # resources and slot), or deleted too
+            log.debug("Dropping cancelled job %s (node=%s)", job_id, self.node_id)
+            await CancellationManager.take_tombstone(job_id)
+            await Leases.ack(delivery)
+            if not await redis_client.hexists(job_key(job_id), "job_template_id"):
+                # all the lease wrote back: the hash was deleted before it
+                await redis_client.delete(job_key(job_id))
+            return
+        job_data["started_ts"] = started_ts
+
+        self._running.add(job_id)
+        try:
+            with log_context(job_id=job_id, run_id=job_data.get("run_id"), user_id=user_id):
+                await run_job(user_id, job_id, job_data)
+        finally:
+            self._running.discard(job_id)
+            await Leases.ack(delivery)
+
+    async def _steal(self) -> Optional[Delivery]:
+        """Take the next queued job of the busiest live node, if it fits here."""
+        nodes = await Resources.nodes(live_only=True)
+        mine = nodes.pop(self.node_id, None)
+        if mine is None or not nodes:
+            return None
+
+        victims = list(nodes)
+        depths = await self.transport.depths(victims)
+        for depth, node_id in sorted(zip(depths, victims), reverse=True):
+            if depth == 0:
+                break
+            delivery = await self.transport.steal(node_id, self.node_id)
+            if delivery is None:
+                continue
+            if not fits(await Resources.requirements(delivery.job_id), mine["free"]):
+                # too big for us: put it back
+                await self.transport.give_back(node_id, delivery)
+                continue
+            await Resources.transfer(delivery.job_id, self.node_id)
+            metrics.NODE_JOBS_STOLEN.inc(node=self.node_id)
+            log.debug("Stole job %s from node %s", delivery.job_id, node_id)
+            return delivery
+        return None
+
+
+async def stop_tasks(tasks, timeout: float) -> set:
+    """
+    Cancel `tasks` and wait up to `timeout` seconds for them to end; returns
+    the ones still running. The cancel is repeated: one that lands as a Redis
+    call completes can be swallowed, leaving the task waiting for more work.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    pending = set(tasks)
+    while pending and loop.time() < deadline:
+        for task in pending:
+            task.cancel()
+        _, pending = await asyncio.wait(pending, timeout=min(0.1, max(0.0, deadline - loop.time())))
+    for task in tasks:
+        if task.done() and not task.cancelled():
+            task.exception()   # retrieved here; the caller saw the first failure already
+    return pending
+
+
+async def reap_node(node_id: str, reason: str) -> int:
+    """
+    Recover the jobs of a node that is gone: queued ones are resubmitted,
+    leased ones recovered (workers/leases.py). Returns the number of jobs.
+    """
+    transport = get_transport()
+    recovered = 0
+    for job_id in await transport.drain(node_id):
+        if await CancellationManager.take_tombstone(job_id):
+            continue   # cancelled after dispatch, its slot and resources were freed then
+        user_id = await redis_client.hget(job_key(job_id), "user_id")
+        await JobManager.mark_requeued(job_id, f"worker node {node_id} {reason}, requeued")
+        await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
+        if user_id:
+            await release_user_slot(user_id, job_id)
+        recovered += 1
+
+    others = [other for other in await Resources.nodes() if other != node_id]
+    recovered += await Leases.recover_node(node_id, others, f"worker node {node_id} {reason}")
+
+    if recovered:
+        log.warning("Node %s %s: recovered %d job(s)", node_id, reason, recovered)
+    await Resources.withdraw(node_id)
+    return recovered
+
+
+async def reap_dead_nodes() -> int:
+    """Reap every advertised node whose heartbeat expired (called by the scheduler)."""
+    reaped = 0
+    for node_id, node in (await Resources.nodes()).items():
+        if not node["alive"]:
+            await reap_node(node_id, "stopped heartbeating")
+            reaped += 1
+    return reaped
+
+
+async def _main():
+    from app.core.log import setup_logging, shutdown_logging
+    from app.core.slide_pool import slide_pool
+
+    import app.jobs.fake_sleep  # noqa: F401
+    import app.jobs.wsi_initialize  # noqa: F401
+    import app.jobs.tile_segmentation  # noqa: F401
+
+    setup_logging()
+    server = None
+    try:
+        if settings.NODE_METRICS_PORT:
+            server = await metrics.serve(settings.NODE_METRICS_PORT)
+            log.info("Serving metrics on :%d/metrics", settings.NODE_METRICS_PORT)
+        await WorkerNode().run()
+    finally:
+        if server is not None:
+            server.close()
+        slide_pool.close()
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass  # the node withdrew itself on the way out
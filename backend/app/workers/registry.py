@@ -1,16 +1,121 @@
 '''
     Note that upon designing the "branch" or stream of jobs in frontend, we are designing the "Job templates"
     Here we define the mapping between "Job Templates" : Job Instances to be executed by workers
+
+    Templates also declare what one job needs from a worker node
+    (cpu cores, memory in MB, GPU slots). The scheduler bin-packs dispatches
+    against the capacity nodes advertise (scheduler/resources.py). A template
+    whose needs depend on its input passes `estimate(payload) -> dict`, which
+    runs at submit time and overrides the declared values it returns.
+
+    A template may also declare a RetryPolicy: failures raising one of its
+    `retry_on` exceptions (but none of `never_retry`) are retried with
+    exponential backoff, and a job that runs out of attempts lands in the
+    dead-letter queue (workers/retries.py).
 '''
 
-from typing import Callable, Dict
+import random
+from typing import Callable, Dict, Optional, Tuple, Type
+
+from app.core.log import get_logger
+
+log = get_logger(__name__)
 
 JOB_REGISTRY: Dict[str, Callable] = {}
 
-def register_job(name: str):
-    """Decorator to register jobs by name."""
+# template -> declared requirements; template -> payload-based estimator
+JOB_RESOURCES: Dict[str, Dict[str, float]] = {}
+JOB_ESTIMATORS: Dict[str, Callable[[dict], dict]] = {}
+
+RESOURCE_KEYS = ("cpu", "memory_mb", "gpu")
+DEFAULT_RESOURCES = {"cpu": 1.0, "memory_mb": 256.0, "gpu": 0.0}
+
+
+# I/O failures that can pass: timeouts and dropped connections (network mounts)
+TRANSIENT_IO_ERRORS: Tuple[Type[BaseException], ...] = (TimeoutError, ConnectionError)
+# failures another attempt can't fix, whatever retry_on says
+PERMANENT_ERRORS: Tuple[Type[BaseException], ...] = (
+    FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError,
+)
+
+
+class RetryPolicy:
+    """
+    Up to `max_attempts` executions of a job; after the n-th failed one it is
+    requeued in backoff_seconds * 2**(n-1) seconds (at most max_backoff_seconds,
+    minus up to `jitter` of it so retries of a batch don't land together),
+    as long as the exception is an instance of one of `retry_on` and of none
+    of `never_retry`.
+    """
+    def __init__(self, max_attempts: int = 1, backoff_seconds: float = 5.0,
+                 max_backoff_seconds: float = 600.0,
+                 retry_on: Tuple[Type[BaseException], ...] = (Exception,), jitter: float = 0.2,
+                 never_retry: Tuple[Type[BaseException], ...] = PERMANENT_ERRORS):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff_seconds = float(backoff_seconds)
+        self.max_backoff_seconds = float(max_backoff_seconds)
+        self.retry_on = tuple(retry_on)
+        self.never_retry = tuple(never_retry)
+        self.jitter = float(jitter)
+
+    def retryable(self, exc: BaseException) -> bool:
+        return isinstance(exc, self.retry_on) and not isinstance(exc, self.never_retry)
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** max(0, attempt - 1))
+        return delay * (1 - self.jitter * random.random())
+
+    def describe(self) -> dict:
+        return {
+            "max_attempts": self.max_attempts,
+            "backoff_seconds": self.backoff_seconds,
+            "max_backoff_seconds": self.max_backoff_seconds,
+            "retry_on": [cls.__name__ for cls in self.retry_on],
+            "never_retry": [cls.__name__ for cls in self.never_retry],
+        }
+
+
+# templates without a policy run once
+NO_RETRY = RetryPolicy()
+JOB_RETRY_POLICIES: Dict[str, RetryPolicy] = {}
+
+
+def retry_policy(name: str) -> RetryPolicy:
+    return JOB_RETRY_POLICIES.get(name, NO_RETRY)
+
+
+def register_job(name: str, cpu: float = 1.0, memory_mb: float = 256, gpu: int = 0,
+                 estimate: Optional[Callable[[dict], dict]] = None,
+                 retry: Optional[RetryPolicy] = None):
+    """Decorator to register jobs by name, with their resource requirements and retry policy."""
     def decorator(func):
         JOB_REGISTRY[name] = func
-        print(f"[JOB_REGISTRY] Registered job: {name}")  # Debugging line
+        JOB_RESOURCES[name] = {"cpu": float(cpu), "memory_mb": float(memory_mb), "gpu": float(gpu)}
+        if estimate is not None:
+            JOB_ESTIMATORS[name] = estimate
+        if retry is not None:
+            JOB_RETRY_POLICIES[name] = retry
+        log.debug("Registered job: %s (%s)", name, JOB_RESOURCES[name])
         return func
-    return decorator
\ No newline at end of file
+    return decorator
+
+
+def job_requirements(name: str, payload: dict) -> Dict[str, float]:
+    """
+    Requirements of one job of template `name`: the declaration, refined by the
+    template's estimator. Blocking (estimators may open the input), call it
+    off the event loop.
+    """
+    req = dict(JOB_RESOURCES.get(name, DEFAULT_RESOURCES))
+    estimate = JOB_ESTIMATORS.get(name)
+    if estimate is not None:
+        try:
+            estimated = estimate(payload) or {}
+        except Exception as exc:
+            log.warning("Resource estimate for %s failed, using declared values: %s", name, exc)
+            estimated = {}
+        for key in RESOURCE_KEYS:
+            if estimated.get(key) is not None:
+                req[key] = float(estimated[key])
+    return req
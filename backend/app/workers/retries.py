@@ -0,0 +1,157 @@
+'''
+    Retries and the dead-letter queue.
+
+    When a job raises, run_job asks Retries.after_failure what happens next,
+    following the template's RetryPolicy (workers/registry.py):
+
+    - retryable and attempts left: the job goes back to PENDING and waits in a
+      sorted-set timer wheel until its backoff ends
+
+          scheduler:delayed       ZSET job_id -> retry due (epoch seconds)
+
+      the scheduler loop moves due jobs back to scheduler:pending_jobs
+      (promote_due), from where they are scheduled like new submissions;
+    - otherwise the job is FAILED and dead-lettered
+
+          scheduler:dead_letter   ZSET job_id -> dead-lettered at
+
+      where it stays, with its last error, until someone replays it
+      (GET /scheduler/dead_letter, POST /scheduler/dead_letter/<job_id>/replay)
+      or discards it.
+
+    Attempts are counted per execution (the job's lease, workers/leases.py),
+    so node crashes that requeued a job count against its policy too.
+'''
+from typing import List, Optional
+
+from app.core.redis_client import redis_client
+from app.core import metrics
+from app.models.redis_keys import (
+    job_key,
+    DELAYED_JOBS_KEY,
+    DEAD_LETTER_KEY,
+    GLOBAL_PENDING_JOBS,
+)
+from app.services.job_manager import JobManager
+from app.workers.registry import retry_policy
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+# due retries moved to the pending queue per scheduler round
+PROMOTE_BATCH = 100
+
+_DEAD_LETTER_FIELDS = [
+    "job_template_id", "user_id", "workflow_id", "run_id", "branch_id",
+    "attempts", "progress_message", "finished_at",
+]
+
+
+class Retries:
+    # ------------------ failures ------------------
+    @staticmethod
+    async def after_failure(job_id: str, template: str, exc: BaseException, error_message: str) -> bool:
+        """
+        Record a failed attempt: schedule a retry (True) or fail and
+        dead-letter the job (False).
+        """
+        policy = retry_policy(template)
+        attempts = int(await redis_client.hget(job_key(job_id), "attempts") or 1)
+
+        if not policy.retryable(exc) or attempts >= policy.max_attempts:
+            if policy.max_attempts > 1 and attempts >= policy.max_attempts:
+                error_message = f"{error_message} (gave up after {attempts} attempts)"
+            await JobManager.mark_failed(job_id, error_message)
+            await Retries.dead_letter(job_id, template)
+            return False
+
+        delay = policy.delay(attempts)
+        retry_at = metrics.now() + delay
+        await JobManager.mark_retrying(
+            job_id, f"attempt {attempts}/{policy.max_attempts} failed, retrying in {delay:.0f}s: {error_message}",
+            retry_at,
+        )
+        await redis_client.zadd(DELAYED_JOBS_KEY, {job_id: retry_at})
+        metrics.JOB_RETRIES.inc(template=template)
+        log.warning("Job %s attempt %d/%d failed, retrying in %.1fs", job_id, attempts, policy.max_attempts, delay)
+        return True
+
+    @staticmethod
+    async def dead_letter(job_id: str, template: Optional[str] = None):
+        """Park a job that will not run again on its own (it is already FAILED)."""
+        if template is None:
+            template = await redis_client.hget(job_key(job_id), "job_template_id")
+        await redis_client.zadd(DEAD_LETTER_KEY, {job_id: metrics.now()})
+        metrics.JOBS_DEAD_LETTERED.inc(template=template or "")
+        log.warning("Job %s moved to the dead-letter queue", job_id)
+
+    # ------------------ timer wheel ------------------
+    @staticmethod
+    async def promote_due() -> int:
+        """Move retries whose backoff ended to the pending queue (called by the scheduler)."""
+        due = await redis_client.zrangebyscore(
+            DELAYED_JOBS_KEY, "-inf", metrics.now(), start=0, num=PROMOTE_BATCH
+        )
+        promoted = 0
+        for job_id in due:
+            # ZREM is the claim: a job is promoted once even with two schedulers
+            if await redis_client.zrem(DELAYED_JOBS_KEY, job_id):
+                await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
+                promoted += 1
+        return promoted
+
+    # ------------------ dead-letter queue ------------------
+    @staticmethod
+    async def list_dead_letters(offset: int = 0, limit: int = 100) -> List[dict]:
+        """Dead-lettered jobs, most recent first, with their last error."""
+        entries = await redis_client.zrevrange(DEAD_LETTER_KEY, offset, offset + limit - 1, withscores=True)
+        pipe = redis_client.pipeline(transaction=False)
+        for job_id, _ in entries:
+            pipe.hmget(job_key(job_id), _DEAD_LETTER_FIELDS)
+        out = []
+        for (job_id, ts), values in zip(entries, await pipe.execute()):
+            job = dict(zip(_DEAD_LETTER_FIELDS, values))
+            out.append({
+                "job_id": job_id,
+                "dead_lettered_ts": ts,
+                "template": job["job_template_id"],
+                "user_id": job["user_id"],
+                "workflow_id": job["workflow_id"],
+                "run_id": job["run_id"],
+                "branch_id": job["branch_id"],
+                "attempts": int(job["attempts"] or 0),
+                "error": job["progress_message"],
+                "failed_at": job["finished_at"],
+            })
+        return out
+
+    @staticmethod
+    async def count_dead_letters() -> int:
+        return await redis_client.zcard(DEAD_LETTER_KEY)
+
+    @staticmethod
+    async def replay(job_id: str) -> bool:
+        """Submit a dead-lettered job again with a fresh set of attempts."""
+        if not await redis_client.zrem(DEAD_LETTER_KEY, job_id):
+            return False
+        if not await redis_client.exists(job_key(job_id)):
+            return False   # deleted meanwhile
+        await JobManager.mark_replayed(job_id)
+        await redis_client.rpush(GLOBAL_PENDING_JOBS, job_id)
+        log.info("Replayed job %s from the dead-letter queue", job_id)
+        return True
+
+    @staticmethod
+    async def discard(job_id: str) -> bool:
+        """Drop a job from the dead-letter queue (it stays FAILED)."""
+        return bool(await redis_client.zrem(DEAD_LETTER_KEY, job_id))
+
+    @staticmethod
+    async def forget(job_ids: List[str]):
+        """Drop deleted jobs from the timer wheel and the dead-letter queue."""
+        if not job_ids:
+            return
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrem(DELAYED_JOBS_KEY, *job_ids)
+        pipe.zrem(DEAD_LETTER_KEY, *job_ids)
+        await pipe.execute()
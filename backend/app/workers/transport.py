@@ -0,0 +1,292 @@
+'''
+    Job transport: how dispatched job ids travel from the scheduler to the
+    executors of a worker node (settings.JOB_TRANSPORT).
+
+    "list" (default): scheduler:node:<node_id>:queue, LPUSHed by the
+    scheduler and moved atomically into scheduler:node:<node_id>:processing
+    by (B)RPOPLPUSH; acknowledging a job LREMs it from there.
+
+    "stream": scheduler:node:<node_id>:stream, XADDed with an approximate
+    MAXLEN and read with XREADGROUP by the node's consumer group. The pending
+    entries list (PEL) replaces the processing list: XACK acknowledges, XPENDING
+    shows what a consumer holds, and XAUTOCLAIM hands entries nobody acked
+    for LEASE_SECONDS to the scheduler, which recovers them (workers/leases.py).
+    Acknowledged entries stay in the stream until it is trimmed, so recent
+    dispatches can be inspected with XRANGE.
+
+    Both read in batches (one round-trip for as many jobs as the node has idle
+    executors), let idle nodes steal undelivered jobs of busy ones, and take
+    the same leases; compare them with
+        python -m benchmarks.control_plane_bench --transport stream
+'''
+import asyncio
+from typing import Dict, List, NamedTuple, Optional
+
+from redis.exceptions import ResponseError
+
+from app.core.redis_client import redis_client
+from app.core.config import settings
+from app.models.redis_keys import (
+    node_queue_key,
+    node_processing_key,
+    node_stream_key,
+    NODE_STREAM_GROUP,
+)
+from app.core.log import get_logger
+
+log = get_logger(__name__)
+
+# entries kept per node stream (approximate trim); far above the jobs that can
+# be queued on a node at once (the worker slots of the cluster), so trimming
+# only ever drops acknowledged history
+STREAM_MAXLEN = 10_000
+# consumer that XAUTOCLAIM hands idle entries to
+RECLAIM_CONSUMER = "reaper"
+# entries inspected per stream when draining, listing or reclaiming
+SCAN_BATCH = 100
+# fakeredis parks a blocked XREADGROUP on its connection, and cancelling it
+# there (node shutdown) can leave the connection hung: poll it at this period
+# instead of blocking
+_FAKE_POLL_SECONDS = 0.01
+
+
+def _can_block() -> bool:
+    return not type(redis_client).__module__.startswith("fakeredis")
+
+
+class Delivery(NamedTuple):
+    """A job handed to a node: where it sits until acknowledged, and its handle there."""
+    job_id: str
+    source: str   # processing list / stream key
+    token: str    # job id in the list / stream entry id
+
+
+class JobTransport:
+    """Interface of a transport; see the module docstring."""
+    name = ""
+
+    async def open(self, node_id: str):
+        """Prepare a node's queue before it advertises itself."""
+
+    async def send(self, node_id: str, job_id: str):
+        raise NotImplementedError
+
+    async def receive(self, node_id: str, count: int, timeout: float) -> List[Delivery]:
+        """Up to `count` of the node's queued jobs; waits up to `timeout` seconds for one."""
+        raise NotImplementedError
+
+    async def ack(self, delivery: Delivery) -> bool:
+        """Drop a delivery for good (the job ended, or was recovered)."""
+        raise NotImplementedError
+
+    async def depths(self, node_ids: List[str]) -> List[int]:
+        """Jobs queued on each node and not taken yet."""
+        raise NotImplementedError
+
+    async def steal(self, victim_id: str, node_id: str) -> Optional[Delivery]:
+        """Take the next queued job of `victim_id` for `node_id`."""
+        raise NotImplementedError
+
+    async def give_back(self, victim_id: str, delivery: Delivery):
+        """Return a stolen job that doesn't fit the thief."""
+        raise NotImplementedError
+
+    async def drain(self, node_id: str) -> List[str]:
+        """Remove and return the jobs queued on a node that is gone."""
+        raise NotImplementedError
+
+    async def held(self, node_id: str, node_ids: List[str]) -> List[Delivery]:
+        """Deliveries `node_id` took (from its queue or, stealing, from `node_ids`) and didn't ack."""
+        raise NotImplementedError
+
+    async def reclaim(self, node_ids: List[str], min_idle: float) -> List[Delivery]:
+        """Deliveries nobody acknowledged for `min_idle` seconds (transports that can tell)."""
+        return []
+
+
+# ------------------ lists ------------------
+class ListTransport(JobTransport):
+    name = "list"
+
+    async def send(self, node_id: str, job_id: str):
+        await redis_client.lpush(node_queue_key(node_id), job_id)
+
+    async def receive(self, node_id: str, count: int, timeout: float) -> List[Delivery]:
+        queue, processing = node_queue_key(node_id), node_processing_key(node_id)
+        # queue -> processing in one command, so a job is always in some Redis
+        # list. (B)RPOPLPUSH is LMOVE RIGHT LEFT, kept for Redis < 6.2 and
+        # fakeredis, whose BLMOVE doesn't block.
+        pipe = redis_client.pipeline(transaction=False)
+        for _ in range(count):
+            pipe.rpoplpush(queue, processing)
+        job_ids = [job_id for job_id in await pipe.execute() if job_id is not None]
+        if not job_ids and timeout:
+            job_id = await redis_client.brpoplpush(queue, processing, max(1, int(timeout)))
+            job_ids = [job_id] if job_id is not None else []
+        return [Delivery(job_id, processing, job_id) for job_id in job_ids]
+
+    async def ack(self, delivery: Delivery) -> bool:
+        return bool(await redis_client.lrem(delivery.source, 0, delivery.token))
+
+    async def depths(self, node_ids: List[str]) -> List[int]:
+        pipe = redis_client.pipeline(transaction=False)
+        for node_id in node_ids:
+            pipe.llen(node_queue_key(node_id))
+        return await pipe.execute()
+
+    async def steal(self, victim_id: str, node_id: str) -> Optional[Delivery]:
+        processing = node_processing_key(node_id)
+        job_id = await redis_client.rpoplpush(node_queue_key(victim_id), processing)
+        return Delivery(job_id, processing, job_id) if job_id is not None else None
+
+    async def give_back(self, victim_id: str, delivery: Delivery):
+        # next in line again
+        await redis_client.rpush(node_queue_key(victim_id), delivery.job_id)
+        await redis_client.lrem(delivery.source, 1, delivery.token)
+
+    async def drain(self, node_id: str) -> List[str]:
+        job_ids = []
+        while True:
+            job_id = await redis_client.rpop(node_queue_key(node_id))
+            if job_id is None:
+                return job_ids
+            job_ids.append(job_id)
+
+    async def held(self, node_id: str, node_ids: List[str]) -> List[Delivery]:
+        processing = node_processing_key(node_id)
+        return [Delivery(job_id, processing, job_id) for job_id in await redis_client.lrange(processing, 0, -1)]
+
+
+# ------------------ streams ------------------
+class StreamTransport(JobTransport):
+    name = "stream"
+
+    async def open(self, node_id: str):
+        try:
+            await redis_client.xgroup_create(node_stream_key(node_id), NODE_STREAM_GROUP, id="0", mkstream=True)
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+
+    async def send(self, node_id: str, job_id: str):
+        await redis_client.xadd(node_stream_key(node_id), {"job": job_id}, maxlen=STREAM_MAXLEN, approximate=True)
+
+    async def _read(self, stream: str, consumer: str, count: int, block_ms: Optional[int] = None) -> List[Delivery]:
+        reply = await redis_client.xreadgroup(NODE_STREAM_GROUP, consumer, {stream: ">"}, count=count, block=block_ms)
+        return [
+            Delivery(fields.get("job", ""), key, entry_id)
+            for key, entries in reply or []
+            for entry_id, fields in entries
+        ]
+
+    async def receive(self, node_id: str, count: int, timeout: float) -> List[Delivery]:
+        stream = node_stream_key(node_id)
+        if not timeout:
+            return await self._read(stream, node_id, count)
+
+        if _can_block():
+            return await self._read(stream, node_id, count, int(timeout * 1000))
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            deliveries = await self._read(stream, node_id, count)
+            if deliveries or loop.time() >= deadline:
+                return deliveries
+            await asyncio.sleep(_FAKE_POLL_SECONDS)
+
+    async def ack(self, delivery: Delivery) -> bool:
+        return bool(await redis_client.xack(delivery.source, NODE_STREAM_GROUP, delivery.token))
+
+    async def depths(self, node_ids: List[str]) -> List[int]:
+        pipe = redis_client.pipeline(transaction=False)
+        for node_id in node_ids:
+            pipe.xinfo_groups(node_stream_key(node_id))
+        out = []
+        for reply in await pipe.execute(raise_on_error=False):
+            if isinstance(reply, Exception):
+                out.append(0)   # no stream yet
+                continue
+            group = next((g for g in reply if g["name"] == NODE_STREAM_GROUP), None)
+            lag = group.get("lag") if group else 0
+            # lag is nil when Redis can't compute it (entries deleted mid-stream): assume work
+            out.append(1 if lag is None else int(lag))
+        return out
+
+    async def steal(self, victim_id: str, node_id: str) -> Optional[Delivery]:
+        deliveries = await self._read(node_stream_key(victim_id), node_id, 1)
+        return deliveries[0] if deliveries else None
+
+    async def give_back(self, victim_id: str, delivery: Delivery):
+        # entries can't be un-read: queue it again (at the back) and ack the stolen one
+        await self.send(victim_id, delivery.job_id)
+        await self.ack(delivery)
+
+    async def drain(self, node_id: str) -> List[str]:
+        stream, job_ids = node_stream_key(node_id), []
+        while True:
+            try:
+                deliveries = await self._read(stream, RECLAIM_CONSUMER, SCAN_BATCH)
+            except ResponseError:
+                return job_ids   # never opened
+            if not deliveries:
+                return job_ids
+            await redis_client.xack(stream, NODE_STREAM_GROUP, *[d.token for d in deliveries])
+            job_ids += [d.job_id for d in deliveries if d.job_id]
+
+    async def _resolve(self, stream: str, entry_ids: List[str]) -> List[Delivery]:
+        """Deliveries for pending entry ids; entries trimmed away meanwhile are acked and dropped."""
+        if not entry_ids:
+            return []
+        pipe = redis_client.pipeline(transaction=False)
+        for entry_id in entry_ids:
+            pipe.xrange(stream, entry_id, entry_id)
+        out, lost = [], []
+        for entry_id, entries in zip(entry_ids, await pipe.execute()):
+            if entries and entries[0][1].get("job"):
+                out.append(Delivery(entries[0][1]["job"], stream, entry_id))
+            else:
+                lost.append(entry_id)
+        if lost:
+            log.warning("Dropping %d pending entries of %s trimmed before they were acked", len(lost), stream)
+            await redis_client.xack(stream, NODE_STREAM_GROUP, *lost)
+        return out
+
+    async def held(self, node_id: str, node_ids: List[str]) -> List[Delivery]:
+        out = []
+        for other in dict.fromkeys([node_id, *node_ids]):
+            stream = node_stream_key(other)
+            try:
+                pending = await redis_client.xpending_range(
+                    stream, NODE_STREAM_GROUP, "-", "+", SCAN_BATCH, consumername=node_id
+                )
+            except ResponseError:
+                continue   # no stream / group
+            out += await self._resolve(stream, [p["message_id"] for p in pending])
+        return out
+
+    async def reclaim(self, node_ids: List[str], min_idle: float) -> List[Delivery]:
+        out = []
+        for node_id in node_ids:
+            stream = node_stream_key(node_id)
+            try:
+                entry_ids = await redis_client.xautoclaim(
+                    stream, NODE_STREAM_GROUP, RECLAIM_CONSUMER, int(min_idle * 1000),
+                    start_id="0-0", count=SCAN_BATCH, justid=True,
+                )
+            except ResponseError:
+                continue
+            out += await self._resolve(stream, entry_ids)
+        return out
+
+
+TRANSPORTS: Dict[str, JobTransport] = {t.name: t for t in (ListTransport(), StreamTransport())}
+
+
+def get_transport() -> JobTransport:
+    try:
+        return TRANSPORTS[settings.JOB_TRANSPORT]
+    except KeyError:
+        raise ValueError(
+            f"Unknown JOB_TRANSPORT {settings.JOB_TRANSPORT!r} (expected one of {', '.join(TRANSPORTS)})"
+        ) from None
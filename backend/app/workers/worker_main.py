@@ -1,19 +1,27 @@
 # app/workers/worker_main.py
-import asyncio
 import json
+import logging
 from datetime import datetime
 
 from app.core.redis_client import redis_client
 from app.models.redis_keys import (
-    user_queue_key,
     job_key,
     GLOBAL_RUNNING_JOBS,
     GLOBAL_JOB_PROGRESS,
     ACTIVE_USERS_KEY,
+    SCHEDULER_WAKEUP,
+    CANCELLED_JOBS_KEY,
 )
 from app.workers.registry import JOB_REGISTRY
 from app.schemas.jobs import JobStatus
 from app.services.job_manager import JobManager
+from app.scheduler.resources import Resources
+from app.workers.retries import Retries
+from app.core.cancellation import JobCancelled, run_cancellable
+from app.core import metrics
+from app.core.log import get_logger
+
+log = get_logger(__name__)
 
 
 async def _user_has_other_running_jobs(user_id: str, current_job_id: str) -> bool:
@@ -56,83 +64,104 @@ async def _set_progress(job_id: str, user_id: str, status: JobStatus, percent: f
     )
 
 
-async def worker_loop(user_id: str):
+async def run_job(user_id: str, job_id: str, job_data: dict):
     """
-    Dedicated worker for a single user.
-    Continuously pulls job_ids from user:<id>:queue and executes them.
-
-    This worker does NOT do global scheduling logic; it only consumes jobs
-    that have already been assigned to this user by the scheduler.
+    Execute one job a worker node picked up and marked RUNNING, and record
+    its outcome (runs inside log_context; see workers/node.py for the node loop).
     """
-    queue = user_queue_key(user_id)
-    print(f"[Worker:{user_id}] Started. Queue = {queue}")
-
-    while True:
-        # Non-blocking pop with small sleep to avoid busy-loop
-        job_id = await redis_client.lpop(queue)
-        if not job_id:
-            await asyncio.sleep(0.5)
-            continue
-
-        print(f"[Worker:{user_id}] Picked job {job_id}")
-
-        # Load job metadata
-        job_data = await redis_client.hgetall(job_key(job_id))
-        if not job_data:
-            print(f"[Worker:{user_id}] Missing job data for {job_id}")
-            continue
-
-        template = job_data.get("job_template_id")
-        raw_payload = job_data.get("input_payload", "{}")
-
-        # Parse payload (defensive against double JSON encoding)
-        try:
-            payload = json.loads(raw_payload)
-            if isinstance(payload, str):
-                payload = json.loads(payload)
-        except Exception:
-            payload = {}
-
-        # --- Mark job RUNNING & register globally ---
-        try:
-            # Persist job state in your JobManager (DB / Redis / etc.)
-            await JobManager.mark_running(job_id)
-
-            # Mark in global sets / hashes (for scheduler + UI)
-            await redis_client.sadd(GLOBAL_RUNNING_JOBS, job_id)
-            await redis_client.sadd(ACTIVE_USERS_KEY, user_id)
-
-            await _set_progress(job_id, user_id, JobStatus.RUNNING, 0.0)
-
-            # ---- Execute the actual job function ----
-            func = JOB_REGISTRY.get(template)
-            if not func:
-                raise RuntimeError(f"Unknown job template: {template}")
-
-            # func is expected to be an async callable: await func(job_id, payload)
-            result = await func(job_id, payload)
-
-            # Mark success in your JobManager
-            await JobManager.mark_success(job_id, result)
-
-            # Final progress = 100%
-            await _set_progress(job_id, user_id, JobStatus.SUCCESS, 1.0)
-
-        except Exception as exc:
-            # Persist failure
-            err_msg = f"{type(exc).__name__}: {exc}"
-            print(f"[Worker:{user_id}] Job {job_id} FAILED: {err_msg}")
-            await JobManager.mark_failed(job_id, err_msg)
-
-            # Mark as failed for UI
+    log.info("Picked job %s", job_id)
+
+    template = job_data.get("job_template_id")
+    raw_payload = job_data.get("input_payload", "{}")
+
+    # Parse payload (defensive against double JSON encoding)
+    try:
+        payload = json.loads(raw_payload)
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+    except Exception:
+        payload = {}
+
+    # --- Register globally (the node marked the job RUNNING) ---
+    status = JobStatus.FAILED
+    retrying = False
+    try:
+        metrics.observe_between(metrics.JOB_DISPATCH_LATENCY, job_data, "dispatched_ts",
+                                float(job_data["started_ts"]), template=template, user=user_id)
+
+        # Mark in global sets / hashes (for scheduler + UI)
+        await redis_client.sadd(GLOBAL_RUNNING_JOBS, job_id)
+        await redis_client.sadd(ACTIVE_USERS_KEY, user_id)
+
+        await _set_progress(job_id, user_id, JobStatus.RUNNING, 0.0)
+
+        # ---- Execute the actual job function ----
+        func = JOB_REGISTRY.get(template)
+        if not func:
+            raise RuntimeError(f"Unknown job template: {template}")
+
+        # func is expected to be an async callable: await func(job_id, payload),
+        # interruptible by a cancel (core/cancellation.py)
+        result = await run_cancellable(job_id, lambda: func(job_id, payload))
+
+        # Mark success in your JobManager
+        await JobManager.mark_success(job_id, result)
+        status = JobStatus.SUCCESS
+
+        # Final progress = 100%
+        await _set_progress(job_id, user_id, JobStatus.SUCCESS, 1.0)
+
+    except JobCancelled as exc:
+        # cancelled while running (services/cancellation_manager.py): final, never retried
+        status = JobStatus.CANCELLED
+        await JobManager.mark_cancelled(job_id, str(exc) or "cancelled")
+        await _set_progress(job_id, user_id, JobStatus.CANCELLED, 1.0)
+        metrics.JOBS_CANCELLED.inc(template=template, stage="running")
+        log.info("Job %s cancelled", job_id)
+
+    except Exception as exc:
+        # Persist failure
+        err_msg = f"{type(exc).__name__}: {exc}"
+        log.error("Job %s FAILED: %s", job_id, err_msg, exc_info=log.isEnabledFor(logging.DEBUG))
+        # retry after a backoff, or FAILED + dead-letter queue (workers/retries.py)
+        retrying = await Retries.after_failure(job_id, template, exc, err_msg)
+
+        # Mark as failed (or waiting for its retry) for UI
+        if retrying:
+            await _set_progress(job_id, user_id, JobStatus.PENDING, 0.0)
+        else:
             await _set_progress(job_id, user_id, JobStatus.FAILED, 1.0)
 
-        finally:
-            # Always remove this job from the running set
-            await redis_client.srem(GLOBAL_RUNNING_JOBS, job_id)
+    finally:
+        end = metrics.now()
+        labels = {"template": template, "user": user_id, "status": status.value}
+        metrics.observe_between(metrics.JOB_RUN_TIME, job_data, "started_ts", end, **labels)
+        if not retrying:
+            metrics.observe_between(metrics.JOB_TOTAL_TIME, job_data, "enqueued_ts", end, **labels)
+            metrics.JOBS_FINISHED.inc(template=template, status=status.value)
+
+        # Always remove this job from the running set and give back its node resources
+        # (and its tombstone, if it was cancelled while running)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.srem(GLOBAL_RUNNING_JOBS, job_id)
+        pipe.srem(CANCELLED_JOBS_KEY, job_id)
+        await pipe.execute()
+        await Resources.release(job_id)
+        await release_user_slot(user_id, job_id)
+        # its run / branch was deleted while it ran (CancellationManager.delete_jobs)
+        if await redis_client.hget(job_key(job_id), "deleted"):
+            await redis_client.delete(job_key(job_id))
+
+
+async def release_user_slot(user_id: str, job_id: str):
+    """
+    A job of `user_id` left the cluster (finished, or lost with its node):
+    free the user's slot unless they still have a job running, and wake the
+    scheduler since the slot or the node capacity is free again.
+    """
+    # Only remove the user from ACTIVE_USERS if they have no more running jobs
+    if not await _user_has_other_running_jobs(user_id, job_id):
+        await redis_client.srem(ACTIVE_USERS_KEY, user_id)
+        log.debug("No more running jobs for %s, removed from ACTIVE_USERS", user_id)
 
-            # Only remove the user from ACTIVE_USERS if they have no more running jobs
-            has_other = await _user_has_other_running_jobs(user_id, job_id)
-            if not has_other:
-                await redis_client.srem(ACTIVE_USERS_KEY, user_id)
-                print(f"[Worker:{user_id}] No more running jobs, removed from ACTIVE_USERS")
\ No newline at end of file
+    await redis_client.rpush(SCHEDULER_WAKEUP, user_id)
\ No newline at end of file
@@ -0,0 +1,77 @@
+'''
+    Label colorization benchmark: per-label loop (old save_overlay /
+    save_downsampled_mask) vs the LUT colorizer in app.core.colorize.
+
+    Run from backend/:
+        python -m benchmarks.colorize_bench --labels 50000 --size 2048
+
+    The loop is O(labels x pixels), so by default it is timed on a sample of
+    labels and extrapolated; pass --full to time every label.
+'''
+import argparse
+import time
+
+import numpy as np
+
+from app.core.colorize import colorize_labels
+
+
+def make_label_mask(size: int, num_labels: int, seed: int = 0) -> np.ndarray:
+    """Blocky synthetic instance mask with ~num_labels distinct labels (0 = background)."""
+    rng = np.random.default_rng(seed)
+    cells = int(np.ceil(np.sqrt(num_labels * 1.25)))
+    grid = rng.permutation(cells * cells).reshape(cells, cells).astype(np.uint32) + 1
+    grid[grid > num_labels] = 0
+    reps = max(1, size // cells)
+    blocks = np.kron(grid, np.ones((reps, reps), dtype=np.uint32))[:size, :size]
+
+    mask = np.zeros((size, size), dtype=np.uint32)
+    mask[: blocks.shape[0], : blocks.shape[1]] = blocks
+    return mask
+
+
+def colorize_loop(mask: np.ndarray, labels=None) -> np.ndarray:
+    """The previous implementation: one full-image pass per label."""
+    if labels is None:
+        labels = np.unique(mask)
+        labels = labels[labels != 0]
+
+    np.random.seed(42)
+    colors = {label: tuple(np.random.randint(50, 256, 3)) for label in labels}
+
+    h, w = mask.shape
+    colored = np.zeros((h, w, 3), dtype=np.uint8)
+    for label, color in colors.items():
+        colored[mask == label] = color
+    return colored
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--labels", type=int, default=50_000)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--sample", type=int, default=500, help="labels timed for the loop baseline")
+    parser.add_argument("--full", action="store_true", help="time the loop over every label")
+    args = parser.parse_args()
+
+    mask = make_label_mask(args.size, args.labels)
+    labels = np.unique(mask)
+    labels = labels[labels != 0]
+    print(f"mask {mask.shape}, {len(labels)} labels")
+
+    t0 = time.perf_counter()
+    colorize_labels(mask)
+    lut_s = time.perf_counter() - t0
+    print(f"LUT colorizer      : {lut_s * 1000:10.1f} ms")
+
+    timed = labels if args.full else labels[: args.sample]
+    t0 = time.perf_counter()
+    colorize_loop(mask, timed)
+    loop_s = (time.perf_counter() - t0) * len(labels) / len(timed)
+    tag = "measured" if args.full else f"extrapolated from {len(timed)} labels"
+    print(f"per-label loop     : {loop_s * 1000:10.1f} ms ({tag})")
+    print(f"speedup            : {loop_s / lut_s:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
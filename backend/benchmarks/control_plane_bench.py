@@ -0,0 +1,295 @@
+'''
+    Control-plane benchmark: scheduler_loop + in-process worker nodes draining
+    synthetic tenants that each submit fake_sleep-style jobs.
+
+    Run from backend/:
+        python -m benchmarks.control_plane_bench --tenants 6 --jobs 50 --job-ms 10
+        python -m benchmarks.control_plane_bench --redis-url redis://localhost:6379/15
+        # node scaling: same load on 1, 2, 4 nodes
+        python -m benchmarks.control_plane_bench --tenants 32 --job-ms 50 --nodes 4
+        # job transport: node lists (default) vs Redis Streams consumer groups
+        python -m benchmarks.control_plane_bench --transport stream
+
+    Without --redis-url it runs against an in-process Redis stand-in
+    (fakeredis, `pip install fakeredis`); with a URL the target DB is FLUSHED
+    first, so point it at a scratch database.
+
+    Reports sustained jobs/s, p50/p99 of queue wait (enqueue -> dispatch),
+    dispatch latency (dispatch -> start) and end-to-end latency, plus Redis
+    commands per job (idle polling included, it is part of the cost), and
+    writes everything to --out as JSON so control-plane regressions show up
+    as a diff.
+'''
+import argparse
+import asyncio
+import importlib
+import json
+import platform
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+BENCH_TEMPLATE = "bench_sleep"
+
+
+# -----------------------------------------------------
+# Redis clients (counted one for the app, raw one for probing)
+# -----------------------------------------------------
+def make_clients(redis_url):
+    """(client handed to the app, probe client sharing the same data)."""
+    if redis_url:
+        import redis.asyncio as redis
+
+        app_client = redis.Redis.from_url(redis_url, decode_responses=True, max_connections=50)
+        probe = redis.Redis.from_url(redis_url, decode_responses=True)
+        return app_client, probe, "redis"
+
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis is not installed: `pip install fakeredis` or pass --redis-url")
+
+    server = fakeredis.FakeServer()
+    app_client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    probe = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    return app_client, probe, "fakeredis"
+
+
+def count_commands(client) -> Counter:
+    """Count every command the client sends (pipelined ones included), by name."""
+    counts = Counter()
+    execute_command = client.execute_command
+    make_pipeline = client.pipeline
+
+    async def counted_execute(*args, **options):
+        counts[str(args[0]).upper()] += 1
+        return await execute_command(*args, **options)
+
+    def counted_pipeline(*args, **kwargs):
+        pipe = make_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        async def counted_pipe_execute(*a, **kw):
+            for cmd_args, _ in pipe.command_stack:
+                counts[str(cmd_args[0]).upper()] += 1
+            return await execute(*a, **kw)
+
+        pipe.execute = counted_pipe_execute
+        return pipe
+
+    client.execute_command = counted_execute
+    client.pipeline = counted_pipeline
+    return counts
+
+
+# -----------------------------------------------------
+# Stats
+# -----------------------------------------------------
+def percentile(values, q):
+    """Nearest-rank percentile (q in [0, 100])."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[idx]
+
+
+def summarize(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 3),
+        "p50_ms": round(percentile(values, 50) * 1000, 3),
+        "p99_ms": round(percentile(values, 99) * 1000, 3),
+        "max_ms": round(max(values) * 1000, 3),
+    }
+
+
+def _f(job, field):
+    try:
+        return float(job.get(field) or "")
+    except ValueError:
+        return None
+
+
+# -----------------------------------------------------
+# Benchmark
+# -----------------------------------------------------
+async def run(args):
+    app_client, probe, backend = make_clients(args.redis_url)
+    if backend == "redis":
+        await probe.flushdb()
+
+    # app modules bind `redis_client` at import time, so swap it first
+    import app.core.redis_client as rc
+    rc.redis_client = app_client
+
+    registry = importlib.import_module("app.workers.registry")
+    keys = importlib.import_module("app.models.redis_keys")
+    from app.services.user_manager import UserManager
+    from app.services.workflow_manager import WorkflowManager
+    from app.services.branch_manager import BranchManager
+    from app.services.execution_manager import ExecutionManager
+    scheduler_main = importlib.import_module("app.scheduler.scheduler_main")
+    from app.workers.node import WorkerNode, SHUTDOWN_SECONDS, stop_tasks
+    from app.core.config import settings
+
+    settings.JOB_TRANSPORT = args.transport
+    if args.max_active:
+        scheduler_main.MAX_ACTIVE_USERS = args.max_active
+
+    @registry.register_job(BENCH_TEMPLATE, cpu=1, memory_mb=64)
+    async def bench_sleep(job_id: str, payload: dict):
+        await asyncio.sleep(payload.get("seconds", 0))
+        return {"job_id": job_id}
+
+    # --- synthetic tenants: one workflow each, `jobs_per_run` jobs per run ---
+    tenants = [f"bench-tenant-{i}" for i in range(args.tenants)]
+    runs_per_tenant = max(1, args.jobs // args.jobs_per_run)
+    for uid in tenants:
+        await UserManager.register_user(uid)
+        wf = f"bench-wf-{uid}"
+        await WorkflowManager.create_workflow(wf, "benchmark", uid)
+        for _ in range(args.jobs_per_run):
+            await BranchManager.add_job_to_branch(
+                wf, "default", BENCH_TEMPLATE, {"seconds": args.job_ms / 1000}
+            )
+    await probe.set(keys.scheduler_state_key(), "running")
+
+    counts = count_commands(app_client)
+    tasks = [asyncio.create_task(scheduler_main.scheduler_loop())]
+    capacity = {"cpu": args.node_cpus, "memory_mb": 64 * 1024, "gpu": 0}
+    tasks += [
+        asyncio.create_task(WorkerNode(f"bench-node-{i}", capacity, args.node_workers).run())
+        for i in range(args.nodes)
+    ]
+
+    # --- submit: open loop, `rate` runs/s per tenant (0 = all at once) ---
+    job_ids = []
+
+    async def submit(uid):
+        for _ in range(runs_per_tenant):
+            result = await ExecutionManager.execute_workflow(f"bench-wf-{uid}")
+            job_ids.extend(result["job_ids"])
+            if args.rate:
+                await asyncio.sleep(1 / args.rate)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(submit(uid) for uid in tenants))
+
+    # --- wait for every job to finish (probe client, not counted) ---
+    pending = set(job_ids)
+    deadline = time.perf_counter() + args.timeout
+    while pending and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+        pipe = probe.pipeline(transaction=False)
+        ordered = list(pending)
+        for jid in ordered:
+            pipe.hget(keys.job_key(jid), "finished_ts")
+        for jid, finished in zip(ordered, await pipe.execute()):
+            if finished:
+                pending.discard(jid)
+    wall = time.perf_counter() - t0
+
+    await stop_tasks(tasks, SHUTDOWN_SECONDS)
+    total_commands = sum(counts.values())
+
+    # --- latency breakdown from the job lifecycle timestamps ---
+    pipe = probe.pipeline(transaction=False)
+    for jid in job_ids:
+        pipe.hgetall(keys.job_key(jid))
+    jobs = [j for j in await pipe.execute() if j.get("finished_ts")]
+
+    queue_wait, dispatch, total = [], [], []
+    for job in jobs:
+        enq, dis, sta, fin = (_f(job, f) for f in ("enqueued_ts", "dispatched_ts", "started_ts", "finished_ts"))
+        if enq is not None and dis is not None:
+            queue_wait.append(dis - enq)
+        if dis is not None and sta is not None:
+            dispatch.append(sta - dis)
+        if enq is not None and fin is not None:
+            total.append(fin - enq)
+
+    first = min((_f(j, "enqueued_ts") for j in jobs), default=None)
+    last = max((_f(j, "finished_ts") for j in jobs), default=None)
+    span = (last - first) if first is not None and last is not None else wall
+    done = len(jobs)
+
+    await app_client.aclose()
+    await probe.aclose()
+
+    return {
+        "benchmark": "control_plane",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "env": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "redis_backend": backend,
+        },
+        "config": {
+            "tenants": args.tenants,
+            "jobs_per_tenant": runs_per_tenant * args.jobs_per_run,
+            "jobs_per_run": args.jobs_per_run,
+            "job_ms": args.job_ms,
+            "rate_runs_per_s": args.rate,
+            "nodes": args.nodes,
+            "node_workers": args.node_workers,
+            "node_cpus": args.node_cpus,
+            "transport": args.transport,
+            "max_active_users": scheduler_main.MAX_ACTIVE_USERS,
+        },
+        "results": {
+            "jobs_submitted": len(job_ids),
+            "jobs_finished": done,
+            "timed_out": bool(pending),
+            "wall_seconds": round(wall, 3),
+            "jobs_per_second": round(done / span, 3) if span > 0 else None,
+            "queue_wait": summarize(queue_wait),
+            "dispatch_latency": summarize(dispatch),
+            "end_to_end": summarize(total),
+            "jobs_per_node": dict(Counter(j.get("node_id", "") for j in jobs)),
+            "redis_commands": total_commands,
+            "redis_commands_per_job": round(total_commands / done, 2) if done else None,
+            "redis_commands_by_name": dict(counts.most_common()),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenants", type=int, default=6)
+    parser.add_argument("--jobs", type=int, default=50, help="jobs per tenant")
+    parser.add_argument("--jobs-per-run", type=int, default=5, help="jobs in each tenant's workflow run")
+    parser.add_argument("--job-ms", type=float, default=10, help="simulated job duration")
+    parser.add_argument("--rate", type=float, default=0, help="runs/s per tenant (0 = submit all at once)")
+    parser.add_argument("--nodes", type=int, default=1, help="in-process worker nodes")
+    parser.add_argument("--node-workers", type=int, default=4, help="executors per node")
+    parser.add_argument("--node-cpus", type=float, default=8, help="advertised cpus per node (1 per job)")
+    parser.add_argument("--max-active", type=int, default=0, help="override MAX_ACTIVE_USERS")
+    parser.add_argument("--transport", choices=["list", "stream"], default="list", help="job transport to the nodes")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--redis-url", default=None, help="real Redis to use (its DB is flushed)")
+    parser.add_argument("--out", default="control_plane_bench.json")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    res = report["results"]
+    print(f"backend            : {report['env']['redis_backend']} ({args.transport} transport)")
+    print(f"jobs finished      : {res['jobs_finished']}/{res['jobs_submitted']} in {res['wall_seconds']} s")
+    print(f"throughput         : {res['jobs_per_second']} jobs/s")
+    for name in ("queue_wait", "dispatch_latency", "end_to_end"):
+        s = res[name]
+        if s["count"]:
+            print(f"{name:<19}: p50 {s['p50_ms']:9.1f} ms   p99 {s['p99_ms']:9.1f} ms")
+    print(f"jobs per node      : {res['jobs_per_node']}")
+    print(f"redis cmds / job   : {res['redis_commands_per_job']}")
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+'''
+    Segmentation pipeline benchmark on synthetic slides.
+
+    Generates pyramidal tiled TIFFs (OpenSlide "generic tiled TIFF") of a
+    given size and tissue coverage, swaps the segmentation model for a stub
+    with a fixed per-tile cost, and runs tile_segmentation's
+    run_segmentation_task on them. Needs no GPU, network or real slide, only
+    the backend requirements (torch CPU is enough) plus fakeredis for the
+    progress updates (or --redis-url).
+
+    Run from backend/:
+        python -m benchmarks.segmentation_bench --sizes 8192,16384 --coverage 0.1,0.5
+        python -m benchmarks.segmentation_bench --model-ms 0 --pyramid --repeat 3
+
+    Reports tiles/s, peak RSS and seconds per stage
+    (tiling, decode, inference, stitch, output) per slide, and writes JSON.
+'''
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+import numpy as np
+import tifffile
+
+TIFF_TILE = 256
+# level-0 pixels per cell of the tissue layout
+LAYOUT_CELL = 64
+
+TISSUE_RGB = np.array([190, 110, 165], dtype=np.int16)      # H&E-ish pink
+BACKGROUND_RGB = np.array([242, 242, 242], dtype=np.int16)
+
+# report stage -> StageProfiler stages it is made of
+REPORT_STAGES = {
+    "tiling": ("tissue_mask", "tiling"),
+    "decode": ("read",),
+    "inference": ("inference",),
+    "stitch": ("stitch", "allocate"),
+    "output": ("save", "pyramid"),
+}
+
+
+# -----------------------------------------------------
+# Synthetic slides
+# -----------------------------------------------------
+def tissue_layout(width: int, height: int, coverage: float, seed: int) -> np.ndarray:
+    """Boolean tissue map (one cell per LAYOUT_CELL px) with ~`coverage` tissue."""
+    rng = np.random.default_rng(seed)
+    lw, lh = -(-width // LAYOUT_CELL), -(-height // LAYOUT_CELL)
+    # smooth blobs: upsampled coarse noise thresholded at the coverage quantile
+    noise = rng.random((8, 8)).astype(np.float32)
+    field = cv2.resize(noise, (lw, lh), interpolation=cv2.INTER_CUBIC)
+    if coverage <= 0:
+        return np.zeros((lh, lw), dtype=bool)
+    return field >= np.quantile(field, 1 - min(coverage, 1.0))
+
+
+def _tiles(layout, width, height, downsample, seed):
+    """Yield the TIFF tiles of one level, row-major, rendered from the layout."""
+    rng = np.random.default_rng(seed)
+    cell = LAYOUT_CELL / downsample
+    for y in range(0, height, TIFF_TILE):
+        for x in range(0, width, TIFF_TILE):
+            ys = (np.arange(y, y + TIFF_TILE) / cell).astype(int).clip(0, layout.shape[0] - 1)
+            xs = (np.arange(x, x + TIFF_TILE) / cell).astype(int).clip(0, layout.shape[1] - 1)
+            tissue = layout[np.ix_(ys, xs)]
+            if not tissue.any():
+                tile = np.broadcast_to(BACKGROUND_RGB, (TIFF_TILE, TIFF_TILE, 3))
+            else:
+                tile = np.where(tissue[..., None], TISSUE_RGB, BACKGROUND_RGB)
+                tile = tile + rng.integers(-25, 26, (TIFF_TILE, TIFF_TILE, 1), dtype=np.int16)
+            yield np.ascontiguousarray(tile.clip(0, 255).astype(np.uint8))
+
+
+def make_synthetic_slide(path: Path, width: int, height: int, coverage: float,
+                         seed: int = 0, compression: str = "zlib") -> Path:
+    """Write a tiled pyramidal RGB TIFF (levels halve until <= 1024 px)."""
+    layout = tissue_layout(width, height, coverage, seed)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tifffile.TiffWriter(tmp, bigtiff=True) as tif:
+        w, h, downsample = width, height, 1
+        while True:
+            tif.write(
+                _tiles(layout, w, h, downsample, seed),
+                shape=(h, w, 3),
+                dtype=np.uint8,
+                tile=(TIFF_TILE, TIFF_TILE),
+                photometric="rgb",
+                compression=compression,
+                # OpenSlide only takes later directories as levels when flagged reduced-resolution
+                subfiletype=0 if downsample == 1 else 1,
+                metadata=None,
+            )
+            if max(w, h) <= 1024:
+                break
+            w, h, downsample = max(1, w // 2), max(1, h // 2), downsample * 2
+    tmp.replace(path)
+    return path
+
+
+# -----------------------------------------------------
+# Stub model
+# -----------------------------------------------------
+def make_stub_model(cost_ms: float):
+    """
+    Drop-in for the torchvision segmentation model: a fixed sleep per call
+    plus a cheap 4x-downsampled "darker than background" map as 2-class logits.
+    """
+    import torch
+    import torch.nn.functional as F
+
+    class StubSegmenter(torch.nn.Module):
+        def forward(self, x):
+            if cost_ms:
+                time.sleep(cost_ms / 1000)
+            pooled = F.avg_pool2d(x.mean(dim=1, keepdim=True), 4)
+            return {"out": torch.cat([pooled, -pooled], dim=1)}
+
+    return StubSegmenter().eval()
+
+
+# -----------------------------------------------------
+# Benchmark
+# -----------------------------------------------------
+def _parse_list(raw, cast):
+    return [cast(v) for v in raw.split(",") if v]
+
+
+def _stage_report(profile):
+    stages = profile["stages"]
+    return {
+        name: round(sum(stages.get(s, {}).get("seconds", 0.0) for s in parts), 4)
+        for name, parts in REPORT_STAGES.items()
+    }
+
+
+async def run(args):
+    from benchmarks.control_plane_bench import make_clients
+
+    # progress updates go through app.core.redis_client; swap it before importing the job
+    app_client, probe, backend = make_clients(args.redis_url)
+    import app.core.redis_client as rc
+    rc.redis_client = app_client
+
+    from app.jobs import tile_segmentation as seg
+    from app.core.slide_pool import slide_pool
+
+    seg.set_model(make_stub_model(args.model_ms), f"stub-{args.model_ms}ms")
+    if args.batch_size:
+        seg.BATCH_SIZE = args.batch_size
+
+    slide_dir = Path(args.slide_dir or tempfile.mkdtemp(prefix="seg-bench-slides-"))
+    out_root = Path(tempfile.mkdtemp(prefix="seg-bench-out-"))
+    loop = asyncio.get_running_loop()
+    runs = []
+
+    for size in args.sizes:
+        for coverage in args.coverage:
+            slide_path = slide_dir / f"synthetic_{size}_{int(coverage * 100)}_{args.seed}.tiff"
+            if not slide_path.exists():
+                t = time.perf_counter()
+                make_synthetic_slide(slide_path, size, size, coverage, args.seed, args.compression)
+                print(f"generated {slide_path.name} in {time.perf_counter() - t:.1f} s")
+
+            for rep in range(args.repeat):
+                job_id = f"bench-{size}-{int(coverage * 100)}-{rep}"
+                result = await loop.run_in_executor(
+                    None,
+                    seg.run_segmentation_task,
+                    job_id, str(slide_path), args.tile_size, args.overlap,
+                    args.min_tile_size, args.max_tile_size, loop,
+                    None, args.pyramid, out_root / job_id, args.trace,
+                )
+                profile = result["profile"]
+                tiles = profile["counters"].get("tiles_processed", 0)
+                run_stats = {
+                    "slide": slide_path.name,
+                    "size": size,
+                    "coverage": coverage,
+                    "repeat": rep,
+                    "tiles": tiles,
+                    "tiles_skipped": profile["counters"].get("tiles_skipped", 0),
+                    "wall_seconds": profile["wall_seconds"],
+                    "tiles_per_second": round(tiles / profile["wall_seconds"], 3) if profile["wall_seconds"] else None,
+                    "decoded_mb": round(profile["counters"].get("bytes_decoded", 0) / 1024**2, 1),
+                    "peak_rss_mb": round(profile["rss_peak_bytes"] / 1024**2, 1),
+                    "stages": _stage_report(profile),
+                    "bound_by": profile["bound_by"],
+                    "profile": profile,
+                }
+                runs.append(run_stats)
+                print(
+                    f"{slide_path.name} #{rep}: {tiles} tiles, {run_stats['tiles_per_second']} tiles/s, "
+                    f"peak RSS {run_stats['peak_rss_mb']} MB, stages {run_stats['stages']}"
+                )
+
+    slide_pool.close()
+    await app_client.aclose()
+    await probe.aclose()
+
+    return {
+        "benchmark": "segmentation",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "env": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "redis_backend": backend,
+        },
+        "config": {
+            "sizes": args.sizes,
+            "coverage": args.coverage,
+            "seed": args.seed,
+            "compression": args.compression,
+            "model_ms": args.model_ms,
+            "tile_size": args.tile_size,
+            "overlap": args.overlap,
+            "min_tile_size": args.min_tile_size,
+            "max_tile_size": args.max_tile_size,
+            "batch_size": args.batch_size or seg.BATCH_SIZE,
+            "pyramid": args.pyramid,
+            "repeat": args.repeat,
+        },
+        "runs": runs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=lambda s: _parse_list(s, int), default=[8192],
+                        help="comma-separated level-0 edge lengths (square slides)")
+    parser.add_argument("--coverage", type=lambda s: _parse_list(s, float), default=[0.3],
+                        help="comma-separated tissue fractions")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compression", default="zlib", help="TIFF compression (zlib, jpeg needs imagecodecs)")
+    parser.add_argument("--model-ms", type=float, default=20, help="stub model cost per tile")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--overlap", type=int, default=128)
+    parser.add_argument("--min-tile-size", type=int, default=512)
+    parser.add_argument("--max-tile-size", type=int, default=1536)
+    parser.add_argument("--batch-size", type=int, default=0, help="override tile_segmentation.BATCH_SIZE")
+    parser.add_argument("--pyramid", action="store_true", help="also write the DeepZoom result pyramid")
+    parser.add_argument("--trace", action="store_true", help="dump a cProfile trace per run")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--slide-dir", default=None, help="reuse generated slides across invocations")
+    parser.add_argument("--redis-url", default=None, help="real Redis for progress updates")
+    parser.add_argument("--out", default="segmentation_bench.json")
+    args = parser.parse_args()
+
+    try:
+        import torch  # noqa: F401
+    except ImportError:
+        sys.exit("torch is required (CPU build is enough): pip install torch torchvision")
+
+    report = asyncio.run(run(args))
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
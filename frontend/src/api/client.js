@@ -1,4 +1,6 @@
 const API_BASE = "http://localhost:8000";
+const UPLOAD_PART_SIZE = 16 * 1024 * 1024;
+const UPLOAD_MAX_RETRIES = 5;
 
 async function request(path, { method = "GET", body, headers = {} } = {}) {
   const res = await fetch(`${API_BASE}${path}`, {
@@ -50,10 +52,11 @@ export const api = {
     }),
   getBranchJobs: (workflow_id, branch_id) =>
     request(`/workflows/${workflow_id}/branches/${branch_id}`),
-  addBranchJob: (workflow_id, branch_id, job_template_id, input_payload) =>
+  // priority: "interactive" | "normal" | "batch" (optional, template default otherwise)
+  addBranchJob: (workflow_id, branch_id, job_template_id, input_payload, priority) =>
     request(`/workflows/${workflow_id}/branches/${branch_id}/jobs`, {
       method: "POST",
-      body: { job_template_id, input_payload },
+      body: { job_template_id, input_payload, ...(priority ? { priority } : {}) },
     }),
   deleteBranch: (workflow_id, branch_id) =>
     request(`/workflows/${workflow_id}/branches/${branch_id}`, {
@@ -69,8 +72,12 @@ export const api = {
     }),
 
   // Execution / Scheduler
-  executeWorkflow: (workflow_id) =>
-    request(`/workflows/${workflow_id}/execute`, { method: "POST" }),
+  executeWorkflow: (workflow_id, priority) =>
+    request(
+      `/workflows/${workflow_id}/execute` +
+        (priority ? `?priority=${encodeURIComponent(priority)}` : ""),
+      { method: "POST" }
+    ),
   startScheduler: () => request("/scheduler/start", { method: "POST" }),
   pauseScheduler: () => request("/scheduler/pause", { method: "POST" }),
   getSchedulerState: () => request("/scheduler/state"),
@@ -78,20 +85,43 @@ export const api = {
 
   // Slides
   listSlides: (user_id) => request(`/files/user/${user_id}/slides`),
+  // DeepZoom source for OpenSeadragon-style viewers, and a small preview image
+  slideDziUrl: (slide_id, format = "jpeg") =>
+    `${API_BASE}/files/slides/${slide_id}/image.dzi?format=${format}`,
+  slidePreviewUrl: (slide_id) =>
+    `${API_BASE}/files/slides/${slide_id}/preview.jpg`,
 
-  uploadWSI: async (file, user_id) => {
-    const formData = new FormData();
-    formData.append("file", file);
-
-    const res = await fetch(`${API_BASE}/files/upload_wsi?user_id=${user_id}`, {
+  // Resumable chunked upload: each part is retried from the server's offset,
+  // so a dropped connection only re-sends the unfinished part.
+  uploadWSI: async (file, user_id, { onProgress } = {}) => {
+    const init = await request("/files/uploads", {
       method: "POST",
-      body: formData,
+      body: { user_id, filename: file.name, size_bytes: file.size },
     });
+    const uploadId = init.upload_id;
+    let offset = init.offset;
+    let failures = 0;
 
-    if (!res.ok) {
-      throw new Error(`Upload failed: ${res.status}`);
+    while (offset < file.size) {
+      const part = file.slice(offset, offset + UPLOAD_PART_SIZE);
+      try {
+        const res = await fetch(
+          `${API_BASE}/files/uploads/${uploadId}?offset=${offset}`,
+          { method: "PUT", body: part }
+        );
+        if (!res.ok) throw new Error(`Upload failed: ${res.status}`);
+        offset = (await res.json()).offset;
+        failures = 0;
+      } catch (err) {
+        if (++failures > UPLOAD_MAX_RETRIES) throw err;
+        offset = (await request(`/files/uploads/${uploadId}`)).offset;
+      }
+      onProgress?.(offset / file.size);
     }
 
-    return await res.json();
+    return request(`/files/uploads/${uploadId}/complete`, {
+      method: "POST",
+      body: {},
+    });
   },
 };
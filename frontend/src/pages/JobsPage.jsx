@@ -18,6 +18,7 @@ function isFilePath(value) {
   const lower = value.toLowerCase();
 
   return (
+    lower.startsWith("/files/artifacts/") ||
     lower.includes("/tmp/") ||
     lower.includes("/storage/") ||
     lower.endsWith(".png") ||
@@ -32,15 +33,19 @@ function isFilePath(value) {
   );
 }
 
-function makeDownloadUrl(path) {
+function makeDownloadUrl(path, userId) {
   const clean = String(path).replace(/^"|"$/g, "");
-  return `${BACKEND}/files/download?path=${encodeURIComponent(clean)}`;
+  // artifact outputs are already URLs; the artifact's owner is rate-limited server-side
+  if (clean.startsWith("/files/artifacts/")) return `${BACKEND}${clean}`;
+  const url = `${BACKEND}/files/download?path=${encodeURIComponent(clean)}`;
+  // downloads are rate-limited per user on the backend
+  return userId ? `${url}&user_id=${encodeURIComponent(userId)}` : url;
 }
 
 // ------------------------------------------------------
 // File-aware Output Renderer (FINAL VERSION)
 // ------------------------------------------------------
-function RenderOutput({ data }) {
+function RenderOutput({ data, userId }) {
   let parsed = data;
 
   try {
@@ -59,12 +64,15 @@ function RenderOutput({ data }) {
 
             {isFilePath(value) ? (
               <a
-                href={makeDownloadUrl(value)}
+                href={makeDownloadUrl(value, userId)}
                 target="_blank"
                 rel="noopener noreferrer"
                 className="text-sky-600 underline hover:text-sky-500 ml-1"
               >
-                Download {String(value).split("/").pop()}
+                Download{" "}
+                {String(value).startsWith("/files/artifacts/")
+                  ? key
+                  : String(value).split("/").pop()}
               </a>
             ) : (
               <pre className="bg-white border rounded-md p-2 overflow-auto">
@@ -81,7 +89,7 @@ function RenderOutput({ data }) {
   if (isFilePath(parsed)) {
     return (
       <a
-        href={makeDownloadUrl(parsed)}
+        href={makeDownloadUrl(parsed, userId)}
         target="_blank"
         rel="noopener noreferrer"
         className="text-sky-600 underline hover:text-sky-500"
@@ -279,8 +287,8 @@ function JobDetails({ job }) {
 
       {/* Input + Output */}
       <div className="grid grid-cols-1 md:grid-cols-2 gap-3">
-        <Payload label="Input payload" data={job.input_payload} />
-        <Payload label="Output payload" data={job.output_payload} />
+        <Payload label="Input payload" data={job.input_payload} userId={job.user_id} />
+        <Payload label="Output payload" data={job.output_payload} userId={job.user_id} />
       </div>
 
       {/* Timestamps */}
@@ -308,11 +316,11 @@ function Info({ label, value, mono }) {
   );
 }
 
-function Payload({ label, data }) {
+function Payload({ label, data, userId }) {
   return (
     <div>
       <div className="text-gray-500 mb-1">{label}</div>
-      <RenderOutput data={data} />
+      <RenderOutput data={data} userId={userId} />
     </div>
   );
 }
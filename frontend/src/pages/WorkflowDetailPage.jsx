@@ -331,9 +331,27 @@ export function WorkflowDetailPage() {
                   key={sl.slide_id}
                   className="text-xs border rounded-md p-2 bg-white"
                 >
-                  <div className="font-mono text-sky-700">{sl.slide_id}</div>
-                  <div className="text-gray-700 text-[11px] break-all">
-                    {sl.slide_path}
+                  <div className="flex gap-2">
+                    <img
+                      src={api.slidePreviewUrl(sl.slide_id)}
+                      alt=""
+                      loading="lazy"
+                      className="w-12 h-12 object-contain bg-gray-100 rounded"
+                    />
+                    <div className="min-w-0">
+                      <div className="font-mono text-sky-700">{sl.slide_id}</div>
+                      <div className="text-gray-700 text-[11px] break-all">
+                        {sl.filename ?? sl.slide_path}
+                      </div>
+                      <a
+                        href={api.slideDziUrl(sl.slide_id)}
+                        target="_blank"
+                        rel="noopener noreferrer"
+                        className="text-sky-600 underline text-[11px]"
+                      >
+                        DeepZoom source
+                      </a>
+                    </div>
                   </div>
                 </div>
               ))